@@ -0,0 +1,122 @@
+"""
+JSON 解碼微基準測試
+比較標準庫 json 與 orjson 解析 depth_book 訊息的速度
+
+用法:
+    # 先錄製 500 筆 depth_book 原始訊息（每行一筆）
+    python benchJsonCodec.py --record 500 --input depth_samples.jsonl
+    # 對錄製的訊息進行基準測試
+    python benchJsonCodec.py --input depth_samples.jsonl
+    # 也可直接使用 MarketDataStream 的行情錄製文件 (.mdcap)
+    python benchJsonCodec.py --input captures/market_20260116_204326_0001.mdcap
+"""
+import argparse
+import json
+import sys
+import time
+
+import websocket
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ==========================================
+# ⚙️ 設定區
+# ==========================================
+WS_URL = "wss://perps.standx.com/ws-stream/v1"
+SYMBOL = "BTC-USD"
+CHANNEL = "depth_book"
+
+# ==========================================
+# 🎙️ 錄製 depth_book 訊息
+# ==========================================
+
+def record_depth_messages(output_path, message_count):
+    """從 WebSocket 錄製指定數量的 depth_book 原始訊息，每行一筆"""
+    recorded = []
+
+    def on_open(ws):
+        print(f"✅ 連線成功，開始錄製 {message_count} 筆 {CHANNEL} 訊息...")
+        ws.send(json.dumps({"subscribe": {"channel": CHANNEL, "symbol": SYMBOL}}))
+
+    def on_message(ws, message):
+        if f'"channel":"{CHANNEL}"' not in message.replace(" ", ""):
+            return
+        recorded.append(message)
+        if len(recorded) >= message_count:
+            ws.close()
+
+    ws = websocket.WebSocketApp(WS_URL, on_open=on_open, on_message=on_message)
+    ws.run_forever()
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for message in recorded:
+            f.write(message.replace("\n", "") + "\n")
+    print(f"📝 已錄製 {len(recorded)} 筆訊息到: {output_path}")
+
+# ==========================================
+# ⏱️ 基準測試
+# ==========================================
+
+def load_messages(input_path):
+    if input_path.endswith(".mdcap"):
+        # 行情錄製文件：只取出 depth_book 訊息
+        from main import iter_capture_records
+        return [
+            raw_message for _, _, raw_message in iter_capture_records(input_path)
+            if f'"channel":"{CHANNEL}"' in raw_message.replace(" ", "")
+        ]
+    with open(input_path, 'r', encoding='utf-8') as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+def bench_decoder(name, decoder, messages, repeat):
+    """輸出每筆平均耗時與吞吐量，返回每筆平均微秒"""
+    total_bytes = sum(len(message) for message in messages) * repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            decoder(message)
+    elapsed = time.perf_counter() - started
+    per_message_us = elapsed / (len(messages) * repeat) * 1e6
+    throughput_mb = total_bytes / elapsed / 1e6
+    print(f"{name:<16} | {per_message_us:>10.2f} µs/筆 | {throughput_mb:>8.1f} MB/s")
+    return per_message_us
+
+def run_benchmark(messages, repeat):
+    avg_size = sum(len(message) for message in messages) / len(messages)
+    print(f"📊 樣本: {len(messages)} 筆, 平均大小 {avg_size / 1024:.1f} KB, 重複 {repeat} 次")
+    print("-" * 52)
+
+    results = {"json.loads": bench_decoder("json.loads", json.loads, messages, repeat)}
+    if orjson:
+        results["orjson.loads"] = bench_decoder("orjson.loads", orjson.loads, messages, repeat)
+        encoded = [message.encode('utf-8') for message in messages]
+        results["orjson (bytes)"] = bench_decoder("orjson (bytes)", orjson.loads, encoded, repeat)
+    else:
+        print("⚠️ 未安裝 orjson，僅測試標準庫 (pip install orjson)")
+
+    print("-" * 52)
+    baseline = results["json.loads"]
+    for name, per_message_us in results.items():
+        print(f"{name:<16} | 相對 json.loads: {baseline / per_message_us:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="depth_book JSON 解碼基準測試")
+    parser.add_argument("--input", required=True, help="每行一筆原始訊息的樣本文件")
+    parser.add_argument("--record", type=int, default=0, help="先從 WebSocket 錄製指定數量的訊息到 --input")
+    parser.add_argument("--repeat", type=int, default=20, help="樣本重複次數")
+    args = parser.parse_args()
+
+    if args.record > 0:
+        record_depth_messages(args.input, args.record)
+
+    messages = load_messages(args.input)
+    if not messages:
+        print(f"❌ 樣本文件為空: {args.input}")
+        sys.exit(1)
+    run_benchmark(messages, args.repeat)
+
+if __name__ == "__main__":
+    main()
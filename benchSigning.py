@@ -0,0 +1,104 @@
+"""
+請求簽名微基準測試
+比較原本的簽名流程（每次 uuid4 + 字串格式化 + SigningKey.sign）與 main.RequestSigner 的每秒簽名數
+
+用法:
+    python benchSigning.py
+    python benchSigning.py --count 50000 --burst 8
+"""
+import argparse
+import base64
+import time
+import uuid
+
+from nacl.encoding import HexEncoder
+from nacl.signing import SigningKey
+
+from main import RequestSigner, build_limit_order, encode_json
+
+# ==========================================
+# ✍️ 原本的簽名流程（作為基準）
+# ==========================================
+
+def sign_reference(signer, request_payload):
+    request_uuid = str(uuid.uuid4())
+    current_timestamp = int(time.time() * 1000)
+    protocol_version = "v1"
+
+    signature_message = f"{protocol_version},{request_uuid},{current_timestamp},{request_payload}"
+    signed_data = signer.sign(signature_message.encode('utf-8'))
+    signature_encoded = base64.b64encode(signed_data.signature).decode('utf-8')
+
+    return {
+        "x-request-sign-version": protocol_version,
+        "x-request-id": request_uuid,
+        "x-request-timestamp": str(current_timestamp),
+        "x-request-signature": signature_encoded
+    }
+
+# ==========================================
+# ⏱️ 基準測試
+# ==========================================
+
+def verify_headers(verify_key, headers, request_payload):
+    """以交易所的方式驗證簽名，確保快速路徑產生的標頭等價"""
+    message = (
+        f"{headers['x-request-sign-version']},{headers['x-request-id']},"
+        f"{headers['x-request-timestamp']},{request_payload}"
+    )
+    verify_key.verify(message.encode('utf-8'), base64.b64decode(headers['x-request-signature']))
+
+def bench_throughput(name, sign, request_payload, count):
+    """連續簽名 count 次，返回每秒簽名數"""
+    started = time.perf_counter()
+    for _ in range(count):
+        sign(request_payload)
+    elapsed = time.perf_counter() - started
+    per_call_us = elapsed / count * 1e6
+    headers_per_second = count / elapsed
+    print(f"{name:<16} | {per_call_us:>8.2f} µs/次 | {headers_per_second:>10,.0f} 次/秒")
+    return headers_per_second
+
+def bench_burst(name, sign, request_payload, burst_size, rounds):
+    """模擬撤單+補單突發：每輪連續簽 burst_size 筆，統計整輪耗時（即最後一筆請求被延後的時間）"""
+    burst_costs = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(burst_size):
+            sign(request_payload)
+        burst_costs.append((time.perf_counter() - started) * 1e6)
+        # 讓背景補充線程有時間補滿請求 ID
+        time.sleep(0.001)
+    burst_costs.sort()
+    p50 = burst_costs[len(burst_costs) // 2]
+    p99 = burst_costs[min(len(burst_costs) - 1, int(len(burst_costs) * 0.99))]
+    print(f"{name:<16} | 突發 {burst_size} 筆: p50 {p50:>8.1f} µs | p99 {p99:>8.1f} µs")
+
+def main():
+    parser = argparse.ArgumentParser(description="請求簽名基準測試")
+    parser.add_argument("--count", type=int, default=20000, help="連續簽名次數")
+    parser.add_argument("--burst", type=int, default=4, help="突發測試每輪簽名筆數")
+    parser.add_argument("--rounds", type=int, default=500, help="突發測試輪數")
+    args = parser.parse_args()
+
+    signer = SigningKey(SigningKey.generate().encode(encoder=HexEncoder), encoder=HexEncoder)
+    request_signer = RequestSigner(signer)
+    request_payload = encode_json(build_limit_order('buy', 95000))
+
+    verify_headers(signer.verify_key, sign_reference(signer, request_payload), request_payload)
+    verify_headers(signer.verify_key, request_signer.sign_headers(request_payload), request_payload)
+    print(f"✅ 兩種簽名結果皆通過驗證 (請求內容 {len(request_payload)} 字節)")
+    print("-" * 56)
+
+    reference_rate = bench_throughput(
+        "原始流程", lambda payload: sign_reference(signer, payload), request_payload, args.count
+    )
+    fast_rate = bench_throughput("RequestSigner", request_signer.sign_headers, request_payload, args.count)
+    print(f"RequestSigner 相對原始流程: {fast_rate / reference_rate:.2f}x")
+    print("-" * 56)
+
+    bench_burst("原始流程", lambda payload: sign_reference(signer, payload), request_payload, args.burst, args.rounds)
+    bench_burst("RequestSigner", request_signer.sign_headers, request_payload, args.burst, args.rounds)
+
+if __name__ == "__main__":
+    main()
@@ -10,16 +10,52 @@ import sys
 import threading
 import websocket
 import math
+import random
 import signal
+import queue
+import asyncio
+import atexit
+import struct
+import zlib
+import gzip
+import shutil
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, count
 from datetime import datetime, timedelta
-from collections import deque
+from functools import cached_property
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from nacl.signing import SigningKey
 from nacl.encoding import HexEncoder
+from nacl.bindings import crypto_sign, crypto_sign_BYTES, crypto_sign_seed_keypair
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 import logging
+import logging.handlers
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# 可選：orjson 解析速度較標準庫快數倍，未安裝時回退到 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 可選：aiohttp 僅在啟用非同步客戶端 (ASYNC_CLIENT_ENABLED) 時需要
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# 可選：numpy 用於逐筆價格統計 (TICK_STATS_ENABLED)，未安裝時僅使用窗口漲跌幅風控
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # ==========================================
 # 🛠️ 日誌系統配置
 # ==========================================
@@ -40,7 +76,8 @@ SIGNING_KEY = os.getenv("SIGNING_KEY")  # Base58 編碼的私鑰，用於簽名
 
 # 交易對設定
 TRADING_PAIR = "BTC-USD"  # 交易對符號
-API_BASE_URL = "https://perps.standx.com"  # API 基礎網址
+API_BASE_URL = os.getenv("STANDX_API_URL", "https://perps.standx.com")  # API 基礎網址
+STREAM_URL = os.getenv("STANDX_STREAM_URL", "wss://perps.standx.com/ws-stream/v1")  # 行情 WebSocket 網址
 
 # 做市策略配置
 ORDER_SIZE = "0.45"  # 每筆訂單大小，要注意單位是 "幣", 500u 40x槓桿大概能開 0.09 (多空都開)
@@ -53,6 +90,10 @@ SPREAD_DANGER_THRESHOLD = 25  # 價差危險閾值（基點），超過會觸發
 VOLATILITY_SHORT_TERM_PCT = 0.001  # 10秒短期波動率上限（百分比）
 VOLATILITY_MID_TERM_PCT = 0.0015  # 20秒中期波動率上限（百分比）
 VOLATILITY_LONG_TERM_PCT = 0.002  # 30秒長期波動率上限（百分比）
+VOLATILITY_SHORT_TERM_WINDOW = 10  # 短期波動率觀察窗口（秒）
+VOLATILITY_MID_TERM_WINDOW = 20  # 中期波動率觀察窗口（秒）
+VOLATILITY_LONG_TERM_WINDOW = 30  # 長期波動率觀察窗口（秒）
+VOLATILITY_WINDOWS = (VOLATILITY_SHORT_TERM_WINDOW, VOLATILITY_MID_TERM_WINDOW, VOLATILITY_LONG_TERM_WINDOW)  # 追蹤的所有窗口（秒），可加入更多觀察週期
 MARKET_PAUSE_DURATION = 300  # 市場波動觸發的暫停時間（秒）
 POSITION_PAUSE_DURATION = 300  # 吃單後的冷靜期時間（秒）
 
@@ -60,10 +101,94 @@ POSITION_PAUSE_DURATION = 300  # 吃單後的冷靜期時間（秒）
 ORDERBOOK_IMBALANCE_LIMIT = 0.50  # 訂單簿不平衡閾值（0-1），超過會暫停交易
 ORDERBOOK_PAUSE_DURATION = 300  # OBI 觸發的暫停時間（秒）
 ORDERBOOK_PRICE_RANGE_BPS = 20  # 計算 OBI 的價格範圍（基點）
+ORDERBOOK_IMBALANCE_BANDS_BPS = (5, 10, 20, 50)  # 多週期 OBI 的價格範圍（基點）
 
 # 系統參數
 LOOP_INTERVAL = 0.2  # 主循環間隔時間（秒）
-PRICE_HISTORY_SIZE = 200  # 價格歷史記錄緩衝區大小
+EVENT_DRIVEN_LOOP = False  # 事件驅動模式：行情更新時立即喚醒主循環，取代固定間隔輪詢
+LOOP_MIN_INTERVAL = 0.05  # 事件驅動模式下兩輪之間的最短間隔（秒），限制 REST 請求頻率
+LOOP_MAX_IDLE = 1.0  # 事件驅動模式下無行情更新時的最長等待（秒），作為心跳
+TICK_STATS_ENABLED = True  # 逐筆價格統計（需 numpy）：已實現波動率、EWMA 波動率與收益分佈
+TICK_HISTORY_SIZE = 4096  # 逐筆價格環形緩衝區容量（筆），超過時覆蓋最舊的樣本
+VOLATILITY_ROBUST_BASE_TICKS = 5  # 窗口漲跌幅的穩健基準：取窗口最舊 N 筆價格的中位數，避免單筆異常報價觸發風控
+VOLATILITY_EWMA_HALF_LIFE = 30  # EWMA 波動率的半衰期（秒）
+VOLATILITY_EWMA_HORIZON = 10  # EWMA 波動率換算的時間跨度（秒）
+VOLATILITY_EWMA_LIMIT_PCT = None  # EWMA 波動率上限（百分比，以 VOLATILITY_EWMA_HORIZON 秒計），None 為僅觀察不觸發，需先以回放數據校準
+PRICE_HISTORY_SIZE = 256  # 價格歷史環形緩衝區初始容量（筆），最長窗口內樣本超過時自動擴容
+
+# 行情連線參數
+WS_RECONNECT_BASE_DELAY = 0.5  # 重連指數退避的基礎延遲（秒），第一次重連立即進行
+WS_RECONNECT_MAX_DELAY = 30  # 重連退避延遲上限（秒）
+WS_PING_INTERVAL = 15  # WebSocket ping 間隔（秒），用於偵測半開連線
+WS_PING_TIMEOUT = 10  # WebSocket pong 等待時間（秒）
+WS_CHANNEL_STALE_TIMEOUT = 10  # 單一頻道無數據超過此時間（秒）即重新訂閱
+WS_STREAM_STALE_TIMEOUT = 20  # 所有頻道無數據超過此時間（秒）即強制重連
+
+# 行情錄製參數
+MARKET_CAPTURE_DIR = os.getenv("MARKET_CAPTURE_DIR")  # 行情錄製目錄，未設置則不錄製
+MARKET_CAPTURE_ROTATE_MB = 256  # 單個錄製文件大小上限（MB），超過即輪替
+MARKET_CAPTURE_COMPRESS = True  # 是否以 zlib 壓縮錄製文件
+MARKET_CAPTURE_QUEUE_SIZE = 100000  # 待寫入佇列上限，寫入跟不上時丟棄新訊息而非阻塞行情線程
+MARKET_CAPTURE_CHANNELS = ("price", "depth_book")  # 需要錄製的頻道
+
+# 訂單 I/O 參數
+ORDER_IO_WORKERS = 4  # 下單/撤單共用執行緒池的大小，限制同時進行的訂單請求數
+ORDER_CANCEL_TIMEOUT = 2  # 批量撤單等待結果的最長時間（秒）
+ORDER_REFRESH_TIMEOUT = 2  # 補單與撤單/改價並行送出後等待結果的最長時間（秒）
+
+# 請求簽名參數
+SIGNER_REQUEST_ID_POOL = 256  # 預先生成的請求 ID 數量，低於一半時背景補充
+
+# 請求預算（客戶端限流）參數
+REQUEST_PRIORITY_CRITICAL = 0  # 撤單、市價平倉
+REQUEST_PRIORITY_NORMAL = 1  # 下單、餘額查詢與強制刷新的持倉/掛單查詢
+REQUEST_PRIORITY_LOW = 2  # 持倉/掛單/價格查詢
+RATE_LIMIT_ENABLED = True  # 啟用客戶端請求預算
+RATE_LIMIT_BUDGETS = {  # 各類端點的 (每秒請求數, 突發容量)，total 為所有請求共用的總預算
+    "total": (15.0, 30),
+    "order": (12.0, 24),
+    "query": (5.0, 10)
+}
+RATE_LIMIT_PRIORITY_RESERVE = {  # 各優先級在總預算中必須保留給更高優先級的令牌數
+    REQUEST_PRIORITY_CRITICAL: 0,
+    REQUEST_PRIORITY_NORMAL: 4,
+    REQUEST_PRIORITY_LOW: 10
+}
+RATE_LIMIT_DECREASE_FACTOR = 0.5  # 收到 429 時速率乘以此係數
+RATE_LIMIT_MIN_RATE_RATIO = 0.2  # 降速下限（設定速率的比例）
+RATE_LIMIT_INCREASE_RATIO = 0.02  # 每次成功回應恢復設定速率的比例
+RATE_LIMIT_ORDER_MAX_WAIT = 1.0  # 訂單請求最多等待令牌的秒數，逾時仍會發送
+RATE_LIMIT_QUERY_MAX_WAIT = 0.2  # 查詢最多等待令牌的秒數，逾時改用快取或丟棄
+RATE_LIMIT_CACHE_TTL = 1.0  # 預算不足時可重用的查詢結果有效期（秒）
+
+# 非同步客戶端參數
+ASYNC_CLIENT_ENABLED = False  # 使用 asyncio + aiohttp 的 AsyncTradingBot（需安裝 aiohttp）
+ASYNC_BRIDGE_TIMEOUT = 15  # 同步策略等待非同步操作完成的最長時間（秒）
+
+# HTTP 連線池參數
+HTTP_POOL_CONNECTIONS = 2  # 連線池快取的主機數
+HTTP_POOL_MAXSIZE = 8  # 每個主機保留的最大連線數（應不小於 ORDER_IO_WORKERS）
+HTTP_WARMUP_CONNECTIONS = 4  # 啟動時預先建立的連線數
+HTTP_KEEPALIVE_INTERVAL = 20  # 連線閒置超過此秒數時發送探測請求，避免被伺服器關閉
+HTTP_SLOW_CONNECT_MS = 100  # 建立新連線耗時超過此值（毫秒）時記錄警告
+
+# 私有推送參數
+PRIVATE_STREAM_ENABLED = True  # 以 WebSocket 推送維護持倉與掛單，REST 僅用於初始同步與定期對帳
+PRIVATE_STREAM_CHANNELS = ("order", "position")  # 認證後訂閱的私有頻道
+ACCOUNT_RECONCILE_INTERVAL = 10  # 以 REST 對帳持倉與本地掛單簿的間隔（秒）
+
+# 成交記錄參數
+TRADE_LOG_QUEUE_SIZE = 1024  # 成交記錄寫入佇列上限（筆），滿時丟棄新記錄而不阻塞策略線程
+TRADE_LOG_FSYNC_INTERVAL = 1.0  # fsync 最短間隔（秒）；0 表示每批寫入後立即 fsync，None 表示只 flush 不 fsync
+TRADE_LOG_TEXT_VIEW = True  # 是否同時寫入人類可讀的文字記錄 (trades.log)；結構化日誌 (trades.jsonl) 一律寫入
+TRADE_LOG_ROTATE_MB = 5  # 文字成交記錄大小上限（MB），超過即輪替；結構化日誌 (.jsonl + 索引) 不輪替，見 TradeJournal
+
+# 日誌輪替參數
+APP_LOG_FILE = os.getenv("APP_LOG_FILE", "mmbot.log")  # 程式日誌文件，設為空字串則只輸出到終端
+APP_LOG_ROTATE_MB = 20  # 程式日誌大小上限（MB），超過即輪替
+LOG_ROTATE_DAILY = True  # 跨日時輪替（程式日誌與文字成交記錄）
+LOG_RETENTION_COUNT = 30  # 每個日誌保留的壓縮歸檔數量上限
+LOG_RETENTION_DAYS = 14  # 壓縮歸檔保留天數，超過即刪除
 
 # 資金管理參數
 MIN_BALANCE_THRESHOLD = 2190  # 最低餘額閾值（DUSD），低於此值將暫停程式
@@ -72,6 +197,28 @@ BALANCE_CHECK_INTERVAL = 30  # 餘額檢查間隔（秒）
 # 全域狀態變數
 is_shutting_down = False
 trading_bot = None
+risk_engine = None
+
+# ==========================================
+# 🧩 JSON 編解碼
+# ==========================================
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+def decode_json(raw_message):
+    """解析 JSON 訊息（str 或 bytes），優先使用 orjson"""
+    if orjson:
+        return orjson.loads(raw_message)
+    return json.loads(raw_message)
+
+def encode_json(payload):
+    """
+    序列化為 JSON 字串，優先使用 orjson
+    注意: 簽名與請求體必須使用同一個返回值，兩種後端的空白格式不同
+    """
+    if orjson:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload)
 
 # ==========================================
 # 🔐 密鑰轉換工具
@@ -87,260 +234,1074 @@ def decode_base58_private_key(b58_string):
         log.error(f"Base58 密鑰解碼失敗: {err}")
         return None
 
+# ==========================================
+# ✍️ 請求簽名
+# ==========================================
+
+class RequestSigner:
+    """
+    請求簽名器：背景預先生成請求 ID，並重用展開後的 Ed25519 私鑰
+    簽名路徑上只剩拼接訊息、一次 crypto_sign 與 base64 編碼
+    簽名訊息格式: "v1,{請求ID},{毫秒時間戳},{請求內容}"
+    """
+    SIGN_VERSION = "v1"
+    SIGN_VERSION_PREFIX = b"v1,"
+
+    def __init__(self, signing_key, pool_size=SIGNER_REQUEST_ID_POOL):
+        # 展開一次 64 字節私鑰，避免每次簽名都經過 SigningKey 包裝
+        self.secret_key = crypto_sign_seed_keypair(bytes(signing_key))[1]
+        self.pool_size = pool_size
+        self.request_ids = deque()
+        self.refill_needed = threading.Event()
+        self._refill_request_ids()
+        self.refill_thread = threading.Thread(target=self._run_refill, daemon=True)
+        self.refill_thread.start()
+
+    @staticmethod
+    def _generate_request_id():
+        request_id = str(uuid.uuid4())
+        return request_id, request_id.encode('ascii') + b","
+
+    def _refill_request_ids(self):
+        while len(self.request_ids) < self.pool_size:
+            self.request_ids.append(self._generate_request_id())
+
+    def _run_refill(self):
+        while True:
+            self.refill_needed.wait()
+            self.refill_needed.clear()
+            # 分小批生成並讓出 GIL，避免補充時卡住正在簽名的請求線程
+            while len(self.request_ids) < self.pool_size:
+                for _ in range(16):
+                    self.request_ids.append(self._generate_request_id())
+                time.sleep(0)
+
+    def _next_request_id(self):
+        try:
+            request_id = self.request_ids.popleft()
+        except IndexError:
+            request_id = self._generate_request_id()
+        if len(self.request_ids) < self.pool_size // 2:
+            self.refill_needed.set()
+        return request_id
+
+    def sign_headers(self, request_payload):
+        """生成請求簽名標頭，request_payload 為請求內容字串或字節"""
+        if isinstance(request_payload, str):
+            request_payload = request_payload.encode('utf-8')
+        request_id, request_id_part = self._next_request_id()
+        timestamp = str(int(time.time() * 1000))
+        signature_message = b"".join((
+            self.SIGN_VERSION_PREFIX, request_id_part, timestamp.encode('ascii'), b",", request_payload
+        ))
+        signature = crypto_sign(signature_message, self.secret_key)[:crypto_sign_BYTES]
+        return {
+            "x-request-sign-version": self.SIGN_VERSION,
+            "x-request-id": request_id,
+            "x-request-timestamp": timestamp,
+            "x-request-signature": base64.b64encode(signature).decode('ascii')
+        }
+
+# ==========================================
+# 📚 訂單簿結構
+# ==========================================
+
+class OrderBook:
+    """
+    已解析的訂單簿
+    深度訊息到達時一次性轉換為數值並按價格升序排列，
+    同時建立累計量（前綴和）陣列，任意價格範圍的掛單量
+    只需兩次二分搜尋加一次減法
+    """
+    def __init__(self):
+        # 買賣盤皆按價格升序存放，方便 bisect 查詢
+        self.bid_prices = []
+        self.bid_sizes = []
+        self.ask_prices = []
+        self.ask_sizes = []
+        # 累計量：cumulative[i] 為前 i 檔的總量，長度比檔位多 1
+        self.bid_cumulative = [0.0]
+        self.ask_cumulative = [0.0]
+
+    @staticmethod
+    def _parse_levels(raw_levels):
+        """將 [[price_str, qty_str], ...] 轉換為升序的 (價格列表, 數量列表)"""
+        parsed_levels = []
+        for level in raw_levels:
+            try:
+                parsed_levels.append((float(level[0]), float(level[1])))
+            except (TypeError, ValueError, IndexError):
+                pass
+        parsed_levels.sort()
+        return [price for price, _ in parsed_levels], [size for _, size in parsed_levels]
+
+    def copy(self):
+        """淺拷貝：共用未更新一側的列表"""
+        book = OrderBook()
+        book.bid_prices, book.bid_sizes, book.bid_cumulative = self.bid_prices, self.bid_sizes, self.bid_cumulative
+        book.ask_prices, book.ask_sizes, book.ask_cumulative = self.ask_prices, self.ask_sizes, self.ask_cumulative
+        return book
+
+    def update_bids(self, raw_levels):
+        """以深度訊息中的買盤快照替換買盤，並重建累計量"""
+        self.bid_prices, self.bid_sizes = self._parse_levels(raw_levels)
+        self.bid_cumulative = list(accumulate(self.bid_sizes, initial=0.0))
+
+    def update_asks(self, raw_levels):
+        """以深度訊息中的賣盤快照替換賣盤，並重建累計量"""
+        self.ask_prices, self.ask_sizes = self._parse_levels(raw_levels)
+        self.ask_cumulative = list(accumulate(self.ask_sizes, initial=0.0))
+
+    def is_ready(self):
+        return bool(self.bid_prices) and bool(self.ask_prices)
+
+    @staticmethod
+    def _range_indices(prices, lower_price, upper_price):
+        """返回價格落在 [lower_price, upper_price] 內的索引區間"""
+        return bisect_left(prices, lower_price), bisect_right(prices, upper_price)
+
+    def bid_volume(self, lower_price, upper_price):
+        start, end = self._range_indices(self.bid_prices, lower_price, upper_price)
+        return self.bid_cumulative[end] - self.bid_cumulative[start]
+
+    def ask_volume(self, lower_price, upper_price):
+        start, end = self._range_indices(self.ask_prices, lower_price, upper_price)
+        return self.ask_cumulative[end] - self.ask_cumulative[start]
+
+    def volume_within_bps(self, reference_price, range_bps):
+        """
+        返回參考價 ±range_bps 範圍內的掛單量
+        返回: (買盤量, 賣盤量)，買盤取 [下界, 參考價]，賣盤取 [參考價, 上界]
+        """
+        range_factor = range_bps / 10000.0
+        return (
+            self.bid_volume(reference_price * (1 - range_factor), reference_price),
+            self.ask_volume(reference_price, reference_price * (1 + range_factor))
+        )
+
+    def imbalance_within_bps(self, reference_price, range_bps):
+        """計算 ±range_bps 範圍內的 OBI，範圍內無掛單時返回 None"""
+        bid_volume, ask_volume = self.volume_within_bps(reference_price, range_bps)
+        combined_volume = bid_volume + ask_volume
+        if combined_volume == 0:
+            return None
+        return (bid_volume - ask_volume) / combined_volume
+
+    def bid_levels_in_range(self, lower_price, upper_price):
+        """返回範圍內的買盤檔位 [(價格, 數量), ...]，按價格降序"""
+        start, end = self._range_indices(self.bid_prices, lower_price, upper_price)
+        return list(zip(reversed(self.bid_prices[start:end]), reversed(self.bid_sizes[start:end])))
+
+    def ask_levels_in_range(self, lower_price, upper_price):
+        """返回範圍內的賣盤檔位 [(價格, 數量), ...]，按價格升序"""
+        start, end = self._range_indices(self.ask_prices, lower_price, upper_price)
+        return list(zip(self.ask_prices[start:end], self.ask_sizes[start:end]))
+
+# ==========================================
+# 📈 波動率追蹤
+# ==========================================
+
+class VolatilityTracker:
+    """
+    多窗口價格波動追蹤器
+    價格與時間戳存放在 array 環形緩衝區，以遞增序號定位 (序號 % 容量)；
+    每個窗口維護一個指向窗口內最舊樣本的指針，時間推進時只向前移動，
+    另以最長窗口的單調佇列維護最高/最低價：佇列按序號遞增，
+    較短窗口的極值即佇列中第一個落在該窗口內的元素，
+    因此每筆樣本的攤銷成本為 O(窗口數)，漲跌幅查詢為 O(1)
+    """
+    def __init__(self, windows=VOLATILITY_WINDOWS, capacity=PRICE_HISTORY_SIZE):
+        self.windows = tuple(sorted(set(windows)))
+        self.window_index = {window: index for index, window in enumerate(self.windows)}
+        self.capacity = max(2, capacity)
+        self.timestamps = array('d', bytes(8 * self.capacity))
+        self.prices = array('d', bytes(8 * self.capacity))
+        self.clear()
+
+    def clear(self):
+        # next_seq 為下一筆樣本的序號，[start_seqs[i], next_seq) 為窗口 i 內的樣本
+        self.next_seq = 0
+        self.start_seqs = [0] * len(self.windows)
+        # 最長窗口的單調佇列，存放 (價格, 序號)：max_queue 價格遞減、min_queue 價格遞增
+        self.max_queue = deque()
+        self.min_queue = deque()
+
+    def __len__(self):
+        """最長窗口內的樣本數"""
+        return self.next_seq - self.start_seqs[-1] if self.windows else 0
+
+    def _grow(self):
+        """容量不足時加倍，按序號重新排列仍在最長窗口內的樣本"""
+        new_capacity = self.capacity * 2
+        timestamps = array('d', bytes(8 * new_capacity))
+        prices = array('d', bytes(8 * new_capacity))
+        for seq in range(self.start_seqs[-1], self.next_seq):
+            timestamps[seq % new_capacity] = self.timestamps[seq % self.capacity]
+            prices[seq % new_capacity] = self.prices[seq % self.capacity]
+        self.timestamps, self.prices, self.capacity = timestamps, prices, new_capacity
+        log.info(f"價格歷史緩衝區擴容至 {new_capacity} 筆")
+
+    def append(self, timestamp, price):
+        """加入一筆價格樣本，並將各窗口指針推進到窗口起點"""
+        seq = self.next_seq
+        start_seqs = self.start_seqs
+        if self.windows and seq - start_seqs[-1] >= self.capacity:
+            self._grow()
+        timestamps, capacity = self.timestamps, self.capacity
+        slot = seq % capacity
+        timestamps[slot] = timestamp
+        self.prices[slot] = price
+        self.next_seq = seq + 1
+
+        index = 0
+        for window in self.windows:
+            cutoff = timestamp - window
+            start_seq = start_seqs[index]
+            while timestamps[start_seq % capacity] < cutoff:
+                start_seq += 1
+            start_seqs[index] = start_seq
+            index += 1
+
+        entry = (price, seq)
+        max_queue, min_queue = self.max_queue, self.min_queue
+        while max_queue and max_queue[-1][0] <= price:
+            max_queue.pop()
+        max_queue.append(entry)
+        while min_queue and min_queue[-1][0] >= price:
+            min_queue.pop()
+        min_queue.append(entry)
+        if self.windows:
+            start_seq = start_seqs[-1]
+            while max_queue[0][1] < start_seq:
+                max_queue.popleft()
+            while min_queue[0][1] < start_seq:
+                min_queue.popleft()
+
+    def latest_price(self):
+        if self.next_seq == 0:
+            return None
+        return self.prices[(self.next_seq - 1) % self.capacity]
+
+    def base_price(self, window):
+        """返回窗口內最舊的價格，無樣本時返回 None"""
+        start_seq = self.start_seqs[self.window_index[window]]
+        if start_seq >= self.next_seq:
+            return None
+        return self.prices[start_seq % self.capacity]
+
+    def window_return(self, window, price=None):
+        """
+        返回 price（預設為最新價格）相對窗口起點價格的變動幅度絕對值
+        例如 0.001 表示 0.1%，無樣本時返回 0.0
+        """
+        # 每輪對每個窗口都會呼叫，直接查表而不經 base_price/latest_price
+        seq = self.next_seq
+        start_seq = self.start_seqs[self.window_index[window]]
+        if start_seq >= seq:
+            return 0.0
+        prices, capacity = self.prices, self.capacity
+        base_price = prices[start_seq % capacity]
+        if price is None:
+            price = prices[(seq - 1) % capacity]
+        if not base_price:
+            return 0.0
+        return abs(price - base_price) / base_price
+
+    def window_range(self, window):
+        """返回窗口內的 (最低價, 最高價)，無樣本時返回 (None, None)"""
+        start_seq = self.start_seqs[self.window_index[window]]
+        if start_seq >= self.next_seq:
+            return None, None
+        # 最新樣本一定在佇列尾端，因此必定找得到
+        low = next(price for price, seq in self.min_queue if seq >= start_seq)
+        high = next(price for price, seq in self.max_queue if seq >= start_seq)
+        return low, high
+
+# 單一窗口的逐筆收益統計（收益皆為對數收益）
+WindowStats = namedtuple('WindowStats', [
+    'count',            # 窗口內的收益筆數
+    'realized_vol',     # 已實現波動率：窗口內收益平方和的平方根
+    'mean_return',      # 平均收益
+    'return_std',       # 收益標準差
+    'max_abs_return',   # 單筆最大收益絕對值
+    'robust_return'     # 最新價相對窗口起點中位數價格的變動幅度絕對值
+])
+
+class TickStatistics:
+    """
+    基於 numpy 的逐筆價格統計
+    每筆樣本寫入兩次（i 與 i + 容量），使最近 N 筆永遠是一段連續切片；
+    收益與收益平方的累計和、EWMA 變異數在 append 時以純 Python 純量 O(1) 更新，
+    樣本先暫存在列表中，到需要分佈統計（或暫存滿 flush_size 筆）時才批次寫入 numpy 緩衝區，
+    因此每輪的固定成本只有幾次浮點運算，向量化統計只在風控檢查接近閾值時才計算
+    """
+    def __init__(self, capacity=TICK_HISTORY_SIZE, half_life=VOLATILITY_EWMA_HALF_LIFE,
+                 horizon=VOLATILITY_EWMA_HORIZON, robust_ticks=VOLATILITY_ROBUST_BASE_TICKS,
+                 max_gap=max(VOLATILITY_WINDOWS), flush_size=256):
+        self.capacity = capacity
+        self.max_gap = max_gap
+        self.flush_size = max(1, min(flush_size, capacity))
+        self.decay_time = half_life / math.log(2)
+        self.horizon = horizon
+        self.robust_offsets = np.arange(max(1, robust_ticks))
+        self.timestamps = np.zeros(2 * capacity)
+        self.prices = np.zeros(2 * capacity)
+        self.abs_returns = np.zeros(2 * capacity)
+        self.return_sums = np.zeros(2 * capacity)
+        self.squared_sums = np.zeros(2 * capacity)
+        self.clear()
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.last_timestamp = None
+        self.last_price = None
+        self.return_sum = 0.0
+        self.squared_sum = 0.0
+        # 以單位時間計的 EWMA 變異數
+        self.ewma_variance_rate = 0.0
+        # 尚未寫入 numpy 緩衝區的樣本 (時間戳, 價格, 對數收益)
+        self.pending = []
+
+    def append(self, timestamp, price):
+        """加入一筆價格樣本，並增量更新累計和與 EWMA 變異數"""
+        log_return = 0.0
+        last_price = self.last_price
+        if last_price:
+            elapsed = timestamp - self.last_timestamp
+            if elapsed < 0.0:
+                elapsed = 0.0
+            # 與上一筆間隔超過最長窗口（例如冷靜期後恢復）時，上一筆已是過期報價，不計收益
+            if elapsed <= self.max_gap:
+                log_return = math.log(price / last_price)
+            # 連續時間 EWMA：舊值按經過時間衰減，新的二次變差以 1/衰減時間 計入
+            decay_time = self.decay_time
+            self.ewma_variance_rate = (
+                self.ewma_variance_rate * math.exp(-elapsed / decay_time)
+                + log_return * log_return / decay_time
+            )
+        self.last_timestamp = timestamp
+        self.last_price = price
+
+        pending = self.pending
+        pending.append((timestamp, price, log_return))
+        if len(pending) >= self.flush_size:
+            self._flush()
+
+    def _flush(self):
+        """將暫存樣本批次寫入 numpy 環形緩衝區（含鏡像區）"""
+        pending = self.pending
+        if not pending:
+            return
+        self.pending = []
+        timestamps, prices, log_returns = np.array(pending).T
+        # 累計和接續上一批的結尾（cumsum 依序相加，與逐筆累加的結果一致）
+        return_sums = np.cumsum(np.concatenate(((self.return_sum,), log_returns)))[1:]
+        squared_sums = np.cumsum(np.concatenate(((self.squared_sum,), log_returns * log_returns)))[1:]
+        self.return_sum = float(return_sums[-1])
+        self.squared_sum = float(squared_sums[-1])
+        # flush_size 不超過容量，一批暫存最多剛好寫滿一圈
+        slots = (self.head + np.arange(len(pending))) % self.capacity
+        mirrors = slots + self.capacity
+        for buffer, column in (
+            (self.timestamps, timestamps), (self.prices, prices), (self.abs_returns, np.abs(log_returns)),
+            (self.return_sums, return_sums), (self.squared_sums, squared_sums)
+        ):
+            buffer[slots] = column
+            buffer[mirrors] = column
+        self.head = (self.head + len(pending)) % self.capacity
+        self.count = min(self.count + len(pending), self.capacity)
+
+    def ewma_volatility(self):
+        """EWMA 波動率，換算為 horizon 秒內的標準差"""
+        return math.sqrt(self.ewma_variance_rate * self.horizon)
+
+    def window_stats(self, windows):
+        """
+        批次計算多個窗口的收益統計（收益為對數收益）
+        返回 {窗口秒數: WindowStats}，無樣本時返回空字典
+        """
+        self._flush()
+        if self.count == 0:
+            return {}
+        end = self.head + self.capacity
+        first = end - self.count
+        latest = end - 1
+        windows = sorted(windows, reverse=True)
+        # 各窗口起點樣本的絕對索引（由長到短，索引遞增）
+        starts = first + np.searchsorted(
+            self.timestamps[first:end], self.timestamps[latest] - np.asarray(windows, dtype=float), side='left'
+        )
+        # 窗口起點樣本的收益來自窗口外的前一筆，不計入
+        counts = (latest - starts).tolist()
+        return_sums = (self.return_sums[latest] - self.return_sums[starts]).tolist()
+        squared_sums = (self.squared_sums[latest] - self.squared_sums[starts]).tolist()
+        # 相鄰窗口起點之間各段的最大值，再由短窗口往長窗口累計
+        segment_max = np.maximum.reduceat(self.abs_returns[:end], np.minimum(starts + 1, latest))
+        max_abs_returns = np.maximum.accumulate(segment_max[::-1])[::-1].tolist()
+        # 穩健基準：窗口最舊數筆價格的中位數（樣本不足時以最新價補齊）
+        base_window = np.sort(self.prices[np.minimum(starts[:, None] + self.robust_offsets, latest)], axis=1)
+        middle = len(self.robust_offsets) // 2
+        base_prices = base_window[:, middle] if len(self.robust_offsets) % 2 else (base_window[:, middle - 1] + base_window[:, middle]) / 2
+        latest_price = self.prices[latest]
+        robust_returns = (np.abs(latest_price - base_prices) / base_prices).tolist()
+
+        stats = {}
+        for index, window in enumerate(windows):
+            count = counts[index]
+            if count <= 0:
+                stats[window] = WindowStats(0, 0.0, 0.0, 0.0, 0.0, robust_returns[index])
+                continue
+            squared_sum = max(0.0, squared_sums[index])
+            mean_return = return_sums[index] / count
+            stats[window] = WindowStats(
+                count=count,
+                realized_vol=math.sqrt(squared_sum),
+                mean_return=mean_return,
+                return_std=math.sqrt(max(0.0, squared_sum / count - mean_return * mean_return)),
+                max_abs_return=max_abs_returns[index],
+                robust_return=robust_returns[index]
+            )
+        return stats
+
+# ==========================================
+# 🎞️ 行情錄製
+# ==========================================
+
+# 錄製文件格式:
+#   文件頭 (不壓縮): magic(5s) 版本(B) 旗標(B) 牆鐘錨點(d) 單調時鐘錨點納秒(q)
+#   記錄 (旗標含 CAPTURE_FLAG_ZLIB 時整段為 zlib 串流): 接收時單調時鐘納秒(q) 長度(I) 原始訊息
+CAPTURE_MAGIC = b"MDCAP"
+CAPTURE_VERSION = 1
+CAPTURE_FLAG_ZLIB = 0x01
+CAPTURE_HEADER = struct.Struct("<5sBBdq")
+CAPTURE_RECORD_HEADER = struct.Struct("<qI")
+CAPTURE_FILE_SUFFIX = ".mdcap"
+
+class MarketDataRecorder:
+    """
+    行情原始訊息錄製器
+    行情線程只把 (接收時間, 原始訊息) 放入佇列，編碼、壓縮與寫檔都在背景線程完成
+    文件超過 rotate_bytes 時輪替為新文件
+    """
+    def __init__(self, capture_dir, rotate_bytes=MARKET_CAPTURE_ROTATE_MB * 1024 * 1024,
+                 compress=MARKET_CAPTURE_COMPRESS):
+        self.capture_dir = capture_dir
+        self.rotate_bytes = rotate_bytes
+        self.compress = compress
+        self.record_queue = queue.Queue(maxsize=MARKET_CAPTURE_QUEUE_SIZE)
+        self.dropped_count = 0
+        self.recorded_count = 0
+        
+        self.capture_file = None
+        self.compressor = None
+        self.segment_index = 0
+        
+        os.makedirs(self.capture_dir, exist_ok=True)
+        self.writer_thread = threading.Thread(target=self._run_writer, daemon=True)
+        self.writer_thread.start()
+
+    def record(self, received_ns, raw_message):
+        """由行情線程調用：只入佇列，不做任何 I/O"""
+        try:
+            self.record_queue.put_nowait((received_ns, raw_message))
+        except queue.Full:
+            self.dropped_count += 1
+
+    def close(self):
+        """寫完佇列中剩餘的訊息並關閉文件"""
+        self.record_queue.put(None)
+        self.writer_thread.join(timeout=5)
+
+    def _open_segment(self):
+        self.segment_index += 1
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = os.path.join(self.capture_dir, f"market_{timestamp}_{self.segment_index:04d}{CAPTURE_FILE_SUFFIX}")
+        flags = CAPTURE_FLAG_ZLIB if self.compress else 0
+        
+        self.capture_file = open(filename, 'wb')
+        self.capture_file.write(CAPTURE_HEADER.pack(
+            CAPTURE_MAGIC, CAPTURE_VERSION, flags, time.time(), time.monotonic_ns()
+        ))
+        self.compressor = zlib.compressobj() if self.compress else None
+        log.info(f"行情錄製文件: {filename}")
+
+    def _close_segment(self):
+        if not self.capture_file:
+            return
+        if self.compressor:
+            self.capture_file.write(self.compressor.flush(zlib.Z_FINISH))
+        self.capture_file.close()
+        self.capture_file = None
+        self.compressor = None
+
+    def _write_batch(self, batch):
+        chunks = []
+        for received_ns, raw_message in batch:
+            payload = raw_message.encode('utf-8') if isinstance(raw_message, str) else raw_message
+            chunks.append(CAPTURE_RECORD_HEADER.pack(received_ns, len(payload)))
+            chunks.append(payload)
+        data = b"".join(chunks)
+        
+        if self.capture_file is None:
+            self._open_segment()
+        if self.compressor:
+            # Z_SYNC_FLUSH 讓已寫入的數據在程式中斷時仍可解壓
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.capture_file.write(data)
+        self.capture_file.flush()
+        self.recorded_count += len(batch)
+        
+        if self.capture_file.tell() >= self.rotate_bytes:
+            self._close_segment()
+
+    def _run_writer(self):
+        while True:
+            try:
+                item = self.record_queue.get()
+                batch = []
+                stop_requested = item is None
+                if not stop_requested:
+                    batch.append(item)
+                # 一次取出佇列中所有已到達的訊息合併寫入
+                while not stop_requested:
+                    try:
+                        item = self.record_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop_requested = True
+                    else:
+                        batch.append(item)
+                
+                if batch:
+                    self._write_batch(batch)
+                if stop_requested:
+                    self._close_segment()
+                    return
+            except Exception as err:
+                log.error(f"行情錄製寫入錯誤: {err}")
+
+def _iter_capture_body(capture_file, compressed):
+    """逐塊讀取錄製文件主體，壓縮文件邊讀邊解壓"""
+    decompressor = zlib.decompressobj() if compressed else None
+    while True:
+        chunk = capture_file.read(1024 * 1024)
+        if not chunk:
+            break
+        yield decompressor.decompress(chunk) if decompressor else chunk
+
+def iter_capture_records(capture_path):
+    """
+    讀取錄製文件
+    逐筆返回: (接收時單調時鐘納秒, 推算的牆鐘時間戳, 原始訊息 str)
+    文件尾部因程式中斷而不完整的記錄會被忽略
+    """
+    with open(capture_path, 'rb') as capture_file:
+        magic, version, flags, wall_anchor, mono_anchor_ns = CAPTURE_HEADER.unpack(
+            capture_file.read(CAPTURE_HEADER.size)
+        )
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            raise ValueError(f"不是有效的行情錄製文件: {capture_path}")
+        
+        buffer = b""
+        header_size = CAPTURE_RECORD_HEADER.size
+        try:
+            for chunk in _iter_capture_body(capture_file, flags & CAPTURE_FLAG_ZLIB):
+                buffer += chunk
+                offset = 0
+                while len(buffer) - offset >= header_size:
+                    received_ns, payload_length = CAPTURE_RECORD_HEADER.unpack_from(buffer, offset)
+                    record_end = offset + header_size + payload_length
+                    if record_end > len(buffer):
+                        break
+                    raw_message = buffer[offset + header_size:record_end].decode('utf-8')
+                    wall_time = wall_anchor + (received_ns - mono_anchor_ns) / 1e9
+                    yield received_ns, wall_time, raw_message
+                    offset = record_end
+                buffer = buffer[offset:]
+        except zlib.error as err:
+            log.warning(f"錄製文件尾部不完整，已讀取至中斷處: {capture_path} ({err})")
+
+def list_capture_files(capture_dir):
+    """返回目錄下按文件名（即時間）排序的錄製文件"""
+    return sorted(
+        os.path.join(capture_dir, filename)
+        for filename in os.listdir(capture_dir)
+        if filename.endswith(CAPTURE_FILE_SUFFIX)
+    )
+
 # ==========================================
 # 📊 市場數據監聽器
 # ==========================================
 
+class ReconnectBackoff:
+    """
+    帶隨機抖動的指數退避
+    第一次重試立即進行，之後延遲在 [上限/2, 上限] 之間隨機，上限每次翻倍直到 max_delay
+    """
+    def __init__(self, base_delay=WS_RECONNECT_BASE_DELAY, max_delay=WS_RECONNECT_MAX_DELAY):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt = 0
+
+    def next_delay(self):
+        attempt = self.attempt
+        self.attempt += 1
+        if attempt == 0:
+            return 0.0
+        delay_cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(delay_cap / 2, delay_cap)
+
+    def reset(self):
+        self.attempt = 0
+
+# 不可變的市場快照：行情線程每次更新都建立新快照並整體替換引用，
+# 策略線程讀取時無需加鎖即可得到一致的買賣價與訂單簿
+MarketSnapshot = namedtuple('MarketSnapshot', [
+    'seq',              # 快照序號，每次發布遞增
+    'price_seq',        # 價格更新序號
+    'depth_seq',        # 深度更新序號
+    'bid',              # 最優買價
+    'ask',              # 最優賣價
+    'mid',              # 中間價
+    'last',             # 最新成交價
+    'price_ready',      # 價格數據是否就緒
+    'orderbook',        # 已解析的 OrderBook（發布後不再修改）
+    'depth_ready',      # 深度數據是否就緒
+    'received_at'       # 最後更新時間戳
+])
+
+EMPTY_MARKET_SNAPSHOT = MarketSnapshot(0, 0, 0, 0.0, 0.0, 0.0, 0.0, False, OrderBook(), False, 0.0)
+
 class MarketDataStream:
-    def __init__(self):
-        # 價格數據
-        self.current_bid = 0.0
-        self.current_ask = 0.0
-        self.market_mid_price = 0.0
-        self.latest_trade_price = 0.0
-        self.price_data_ready = False
-        
-        # 深度數據
-        self.bid_levels = []
-        self.ask_levels = []
-        self.depth_data_ready = False
-        
-        # WebSocket 配置
-        self.stream_url = "wss://perps.standx.com/ws-stream/v1"
-        self.price_ws = None
-        self.depth_ws = None
+    def __init__(self, capture_dir=MARKET_CAPTURE_DIR, connect=True):
+        """
+        capture_dir: 行情錄製目錄，None 表示不錄製
+        connect: False 時不建立 WebSocket 連線，由外部直接調用 _handle_stream_message 餵入訊息（回放用）
+        """
+        # 市場快照（價格 + 深度），以原子引用替換方式發布
+        self.snapshot = EMPTY_MARKET_SNAPSHOT
+        # 新快照發布時通知策略線程
+        self.update_event = threading.Event()
+        
+        # 行情錄製（可選）
+        self.recorder = MarketDataRecorder(capture_dir) if capture_dir else None
+        
+        # WebSocket 配置（所有頻道共用同一條連線）
+        self.stream_url = STREAM_URL
+        self.stream_ws = None
+        
+        # 私有頻道認證請求（連線建立時先於訂閱發送）與連線狀態監聽者
+        self.auth_request = None
+        self.connection_listeners = []
+        
+        # 訂閱列表與頻道分派表，鍵為 (頻道, 交易對)
+        self.subscriptions = []
+        self.channel_handlers = {}
+        self.channel_backoff = {}
+        self.channel_last_message = {}
+        self.channel_resubscribe_at = {}
+        self.channel_awaiting_data = {}
+        self.subscribe("price", TRADING_PAIR, self._handle_price_message)
+        self.subscribe("depth_book", TRADING_PAIR, self._handle_depth_message)
         
         # 連線管理
-        self.data_lock = threading.Lock()
-        self.retry_count = 0
         self.max_retries = 10
         self.last_data_timestamp = time.time()
+        self.connection_backoff = ReconnectBackoff()
+        self.is_connected = False
+        self.connected_at = None
+        self.disconnected_at = time.monotonic()
+        
+        # 連線統計（重連次數與斷線時長）
+        self.feed_stats = {
+            'connects': 0,
+            'reconnects': 0,
+            'disconnected_seconds': 0.0,
+            'last_gap_seconds': 0.0,
+            'channel_gap_seconds': {},
+            'channel_resubscribes': {}
+        }
         
-        # 啟動 WebSocket 連線
-        self.price_thread = threading.Thread(target=self._start_price_stream, daemon=True)
-        self.price_thread.start()
+        if not connect:
+            return
         
-        self.depth_thread = threading.Thread(target=self._start_depth_stream, daemon=True)
-        self.depth_thread.start()
+        # 啟動 WebSocket 連線監督循環
+        self.stream_thread = threading.Thread(target=self._run_stream_supervisor, daemon=True)
+        self.stream_thread.start()
         
         self.health_monitor = threading.Thread(target=self._monitor_health, daemon=True)
         self.health_monitor.start()
 
-    def _monitor_health(self):
-        """監控連線健康狀態"""
-        while True:
+    def subscribe(self, channel, symbol, handler):
+        """
+        在共用連線上訂閱頻道
+        handler: 接收該頻道 data 欄位的回調函數
+        若連線已建立則立即發送訂閱，否則在連線建立時統一發送
+        """
+        self.register_channel_handler(channel, symbol, handler)
+        if (channel, symbol) in self.subscriptions:
+            return
+        self.subscriptions.append((channel, symbol))
+        
+        # 各頻道獨立的重新訂閱退避與數據間隔追蹤
+        self.channel_backoff[(channel, symbol)] = ReconnectBackoff()
+        self.channel_last_message[(channel, symbol)] = None
+        self.channel_resubscribe_at[(channel, symbol)] = 0.0
+        self.channel_awaiting_data[(channel, symbol)] = True
+        
+        stream_ws = self.stream_ws
+        if stream_ws and stream_ws.sock and stream_ws.sock.connected:
+            self._send_subscription(stream_ws, channel, symbol)
+
+    def register_channel_handler(self, channel, symbol, handler):
+        """只註冊頻道處理函數，不發送訂閱（用於認證後自動推送的私有頻道）"""
+        self.channel_handlers[(channel, symbol)] = handler
+
+    def authenticate(self, auth_token, channels):
+        """
+        在共用連線上認證並訂閱私有頻道
+        每次連線建立時都會先發送認證請求，再發送公開頻道訂閱
+        """
+        self.auth_request = {
+            "auth": {
+                "token": auth_token,
+                "streams": [{"channel": channel} for channel in channels]
+            }
+        }
+        stream_ws = self.stream_ws
+        if stream_ws and stream_ws.sock and stream_ws.sock.connected:
+            stream_ws.send(encode_json(self.auth_request))
+
+    def add_connection_listener(self, listener):
+        """註冊連線狀態回調 listener(connected)，連線建立與斷開時調用"""
+        self.connection_listeners.append(listener)
+
+    def _notify_connection_listeners(self, connected):
+        for listener in self.connection_listeners:
             try:
-                time.sleep(30)
-                elapsed = time.time() - self.last_data_timestamp
-                if elapsed > 60:
-                    log.warning(f"數據流異常: {int(elapsed)}秒 無新數據")
-                    if self.price_ws:
-                        log.info("重啟價格數據流...")
-                        self.price_ws.close()
+                listener(connected)
             except Exception as err:
-                log.error(f"健康監控錯誤: {err}")
+                log.error(f"連線狀態回調錯誤: {err}")
 
-    def _handle_price_open(self, ws):
-        log.info(f"價格頻道連線成功 (重試次數: {self.retry_count})")
-        print("✅ 即時監控買賣單數據Procyons版本連線 (Price Channel)...")
+    def _send_subscription(self, ws, channel, symbol):
         subscription = {
             "subscribe": {
-                "channel": "price",
-                "symbol": TRADING_PAIR
+                "channel": channel,
+                "symbol": symbol
             }
         }
-        ws.send(json.dumps(subscription))
-        self.retry_count = 0
+        ws.send(encode_json(subscription))
+
+    def _monitor_health(self):
+        """健康監控線程：每秒檢查一次（非同步版本由 AsyncTradingBot.run_stream_health_monitor 在事件循環中執行）"""
+        while True:
+            time.sleep(1)
+            self._check_health()
 
-    def _handle_price_message(self, ws, raw_message):
+    def _check_health(self):
+        """
+        檢查各頻道數據是否中斷
+        單一頻道停更時按該頻道的退避節奏重新訂閱；全部停更時強制重連
+        """
         try:
-            self.last_data_timestamp = time.time()
-            parsed_data = json.loads(raw_message)
-            if parsed_data.get("channel") == "price" and "data" in parsed_data:
-                market_data = parsed_data["data"]
+            if not self.is_connected:
+                return
+            
+            now = time.monotonic()
+            stream_idle = now - max(
+                [ts for ts in self.channel_last_message.values() if ts] + [self.connected_at]
+            )
+            if stream_idle > WS_STREAM_STALE_TIMEOUT:
+                log.warning(f"數據流異常: {int(stream_idle)}秒 無新數據，強制重連")
+                if self.stream_ws:
+                    self.stream_ws.close()
+                return
+            
+            for channel, symbol in list(self.subscriptions):
+                key = (channel, symbol)
+                last_message = self.channel_last_message.get(key) or self.connected_at
+                if now - last_message <= WS_CHANNEL_STALE_TIMEOUT:
+                    continue
+                if now < self.channel_resubscribe_at[key]:
+                    continue
                 
-                with self.data_lock:
-                    if "spread" in market_data and len(market_data["spread"]) >= 2:
-                        self.current_bid = float(market_data["spread"][0])
-                        self.current_ask = float(market_data["spread"][1])
-                    if "mid_price" in market_data:
-                        self.market_mid_price = float(market_data["mid_price"])
-                    if "last_price" in market_data:
-                        self.latest_trade_price = float(market_data["last_price"])
-                    if self.current_bid > 0 and self.current_ask > 0:
-                        self.price_data_ready = True
-        except json.JSONDecodeError as err:
-            log.error(f"JSON 解析錯誤: {err}")
+                delay = self.channel_backoff[key].next_delay()
+                self.channel_resubscribe_at[key] = now + max(delay, WS_CHANNEL_STALE_TIMEOUT)
+                log.warning(f"{channel} 頻道 {int(now - last_message)}秒 無數據，重新訂閱")
+                resubscribes = self.feed_stats['channel_resubscribes']
+                resubscribes[key] = resubscribes.get(key, 0) + 1
+                self._send_subscription(self.stream_ws, channel, symbol)
         except Exception as err:
-            log.error(f"價格訊息處理錯誤: {err}")
+            log.error(f"健康監控錯誤: {err}")
 
-    def _handle_price_error(self, ws, error):
-        log.error(f"價格 WebSocket 錯誤: {error}")
-
-    def _handle_price_close(self, ws, status_code, close_reason):
-        log.warning(f"價格連線關閉 (狀態: {status_code}, 原因: {close_reason})")
-        
-        if self.retry_count < self.max_retries:
-            self.retry_count += 1
-            backoff_time = min(5 * self.retry_count, 30)
-            log.info(f"等待 {backoff_time}秒 後重連 (第 {self.retry_count} 次)")
-            time.sleep(backoff_time)
-            self._start_price_stream()
+    def _handle_stream_open(self, ws):
+        now = time.monotonic()
+        self.is_connected = True
+        self.connected_at = now
+        self.feed_stats['connects'] += 1
+        if self.feed_stats['connects'] > 1:
+            self.feed_stats['reconnects'] += 1
+            gap_seconds = now - self.disconnected_at
+            self.feed_stats['last_gap_seconds'] = gap_seconds
+            self.feed_stats['disconnected_seconds'] += gap_seconds
+            log.info(f"市場數據重連成功 (第 {self.feed_stats['reconnects']} 次重連, 斷線 {gap_seconds:.2f}秒)")
         else:
-            log.critical(f"已達最大重連次數 ({self.max_retries})")
+            log.info("市場數據連線成功")
+        print("✅ 即時監控買賣單數據Procyons版本連線 (Price + Depth Channel)...")
+        
+        if self.auth_request:
+            ws.send(encode_json(self.auth_request))
+        self._notify_connection_listeners(True)
+        for channel, symbol in list(self.subscriptions):
+            self.channel_awaiting_data[(channel, symbol)] = True
+            self._send_subscription(ws, channel, symbol)
 
-    def _start_price_stream(self):
+    def _handle_stream_message(self, ws, raw_message):
+        """解析一次訊息後按 channel 欄位分派，價格與深度保持到達順序"""
         try:
-            self.price_ws = websocket.WebSocketApp(
-                self.stream_url,
-                on_open=self._handle_price_open,
-                on_message=self._handle_price_message,
-                on_error=self._handle_price_error,
-                on_close=self._handle_price_close
-            )
-            self.price_ws.run_forever()
+            received_ns = time.monotonic_ns()
+            self.last_data_timestamp = time.time()
+            parsed_data = decode_json(raw_message)
+            channel = parsed_data.get("channel")
+            if channel is None or "data" not in parsed_data:
+                return
+            if self.recorder and channel in MARKET_CAPTURE_CHANNELS:
+                self.recorder.record(received_ns, raw_message)
+            
+            # 未帶 symbol 的訊息視為主交易對
+            symbol = parsed_data.get("symbol", TRADING_PAIR)
+            key = (channel, symbol)
+            handler = self.channel_handlers.get(key)
+            if handler:
+                self._record_channel_data(key)
+                handler(parsed_data["data"])
+        except json.JSONDecodeError as err:
+            log.error(f"JSON 解析錯誤: {err}")
         except Exception as err:
-            log.error(f"價格流執行錯誤: {err}")
+            log.error(f"市場訊息處理錯誤: {err}")
 
-    def _handle_depth_open(self, ws):
-        log.info("深度頻道連線成功")
-        subscription = {
-            "subscribe": {
-                "channel": "depth_book",
-                "symbol": TRADING_PAIR
-            }
-        }
-        ws.send(json.dumps(subscription))
+    def _record_channel_data(self, key):
+        """記錄頻道數據到達時間；斷線後第一筆數據到達時統計該頻道的盲區時長"""
+        now = time.monotonic()
+        self.channel_last_message[key] = now
+        if self.channel_awaiting_data.get(key):
+            self.channel_awaiting_data[key] = False
+            channel_gaps = self.feed_stats['channel_gap_seconds']
+            if self.feed_stats['connects'] > 1:
+                channel_gaps[key] = channel_gaps.get(key, 0.0) + (now - self.disconnected_at)
+            self.channel_backoff[key].reset()
+            self.channel_resubscribe_at[key] = 0.0
+            # 收到數據才視為連線恢復正常，重置連線退避
+            self.connection_backoff.reset()
+
+    def _handle_price_message(self, market_data):
+        try:
+            previous = self.snapshot
+            bid, ask = previous.bid, previous.ask
+            mid, last = previous.mid, previous.last
+            if "spread" in market_data and len(market_data["spread"]) >= 2:
+                bid = float(market_data["spread"][0])
+                ask = float(market_data["spread"][1])
+            if "mid_price" in market_data:
+                mid = float(market_data["mid_price"])
+            if "last_price" in market_data:
+                last = float(market_data["last_price"])
+            
+            self._publish_snapshot(previous._replace(
+                price_seq=previous.price_seq + 1,
+                bid=bid,
+                ask=ask,
+                mid=mid,
+                last=last,
+                price_ready=previous.price_ready or (bid > 0 and ask > 0)
+            ))
+        except Exception as err:
+            log.error(f"價格訊息處理錯誤: {err}")
 
-    def _handle_depth_message(self, ws, raw_message):
+    def _handle_depth_message(self, depth_data):
         try:
-            parsed_data = json.loads(raw_message)
-            if parsed_data.get("channel") == "depth_book" and "data" in parsed_data:
-                depth_data = parsed_data["data"]
-                with self.data_lock:
-                    if "bids" in depth_data:
-                        self.bid_levels = depth_data["bids"]
-                    if "asks" in depth_data:
-                        self.ask_levels = depth_data["asks"]
-                    if self.bid_levels and self.ask_levels:
-                        self.depth_data_ready = True
+            # 在新的 OrderBook 上解析，已發布的訂單簿不會被修改
+            previous = self.snapshot
+            updated_book = previous.orderbook.copy()
+            if "bids" in depth_data:
+                updated_book.update_bids(depth_data["bids"])
+            if "asks" in depth_data:
+                updated_book.update_asks(depth_data["asks"])
+            
+            self._publish_snapshot(previous._replace(
+                depth_seq=previous.depth_seq + 1,
+                orderbook=updated_book,
+                depth_ready=previous.depth_ready or updated_book.is_ready()
+            ))
         except Exception as err:
             log.error(f"深度數據處理錯誤: {err}")
 
-    def _handle_depth_error(self, ws, error):
-        log.error(f"深度 WebSocket 錯誤: {error}")
+    def _publish_snapshot(self, snapshot):
+        """發布新快照：單一引用賦值，讀取端無需加鎖"""
+        self.snapshot = snapshot._replace(seq=snapshot.seq + 1, received_at=time.time())
+        self.update_event.set()
 
-    def _handle_depth_close(self, ws, status_code, close_reason):
-        log.warning("深度連線關閉，5秒後重連")
-        time.sleep(5)
-        self._start_depth_stream()
+    def get_snapshot(self):
+        """返回當前市場快照，同一輪策略計算應使用同一份快照"""
+        return self.snapshot
 
-    def _start_depth_stream(self):
-        try:
-            self.depth_ws = websocket.WebSocketApp(
-                self.stream_url,
-                on_open=self._handle_depth_open,
-                on_message=self._handle_depth_message,
-                on_error=self._handle_depth_error,
-                on_close=self._handle_depth_close
-            )
-            self.depth_ws.run_forever()
-        except Exception as err:
-            log.error(f"深度流執行錯誤: {err}")
-
-    def fetch_current_price(self):
-        """獲取當前市場中間價"""
-        with self.data_lock:
-            if self.price_data_ready:
-                if self.market_mid_price > 0:
-                    return self.market_mid_price
-                elif self.current_bid > 0 and self.current_ask > 0:
-                    return (self.current_bid + self.current_ask) / 2
-                elif self.latest_trade_price > 0:
-                    return self.latest_trade_price
+    def wait_for_update(self, observed_seq, timeout):
+        """
+        等待序號晚於 observed_seq 的快照發布
+        返回: True 表示有新行情，False 表示等待逾時
+        """
+        # 先清除再檢查序號：檢查後才發布的快照會重新設置事件，不會遺漏
+        self.update_event.clear()
+        if self.snapshot.seq != observed_seq:
+            return True
+        return self.update_event.wait(timeout)
+
+    # 兼容屬性：從當前快照讀取
+    @property
+    def current_bid(self):
+        return self.snapshot.bid
+
+    @property
+    def current_ask(self):
+        return self.snapshot.ask
+
+    @property
+    def market_mid_price(self):
+        return self.snapshot.mid
+
+    @property
+    def latest_trade_price(self):
+        return self.snapshot.last
+
+    @property
+    def price_data_ready(self):
+        return self.snapshot.price_ready
+
+    @property
+    def depth_data_ready(self):
+        return self.snapshot.depth_ready
+
+    @property
+    def orderbook(self):
+        return self.snapshot.orderbook
+
+    def _handle_stream_error(self, ws, error):
+        log.error(f"市場數據 WebSocket 錯誤: {error}")
+
+    def _handle_stream_close(self, ws, status_code, close_reason):
+        log.warning(f"市場數據連線關閉 (狀態: {status_code}, 原因: {close_reason})")
+
+    def _run_stream_supervisor(self):
+        """
+        連線監督循環：run_forever 返回即代表斷線，於循環內按退避時間重連
+        取代在 on_close 回調中遞迴重啟連線，避免堆疊持續增長
+        """
+        while True:
+            try:
+                self.stream_ws = websocket.WebSocketApp(
+                    self.stream_url,
+                    on_open=self._handle_stream_open,
+                    on_message=self._handle_stream_message,
+                    on_error=self._handle_stream_error,
+                    on_close=self._handle_stream_close
+                )
+                self.stream_ws.run_forever(ping_interval=WS_PING_INTERVAL, ping_timeout=WS_PING_TIMEOUT)
+            except Exception as err:
+                log.error(f"市場數據流執行錯誤: {err}")
+            
+            self._handle_stream_disconnect()
+            time.sleep(self._next_reconnect_delay())
+
+    def _handle_stream_disconnect(self):
+        if self.is_connected:
+            self.is_connected = False
+            self.disconnected_at = time.monotonic()
+            self._notify_connection_listeners(False)
+
+    def _next_reconnect_delay(self):
+        backoff_time = self.connection_backoff.next_delay()
+        if self.connection_backoff.attempt == self.max_retries + 1:
+            log.critical(f"已連續重連 {self.max_retries} 次仍未恢復，持續重試中")
+        log.info(f"等待 {backoff_time:.2f}秒 後重連 (第 {self.connection_backoff.attempt} 次)")
+        return backoff_time
+
+    def get_feed_stats(self):
+        """返回行情連線統計：連線/重連次數、累計斷線秒數、各頻道的盲區秒數與重新訂閱次數"""
+        stats = dict(self.feed_stats)
+        stats['channel_gap_seconds'] = dict(self.feed_stats['channel_gap_seconds'])
+        stats['channel_resubscribes'] = dict(self.feed_stats['channel_resubscribes'])
+        if not self.is_connected and self.feed_stats['connects'] > 0:
+            stats['disconnected_seconds'] += time.monotonic() - self.disconnected_at
+        return stats
+
+    def fetch_current_price(self, snapshot=None):
+        """獲取當前市場中間價（可傳入快照以保持同一輪計算的一致性）"""
+        snapshot = snapshot or self.snapshot
+        if snapshot.price_ready:
+            if snapshot.mid > 0:
+                return snapshot.mid
+            elif snapshot.bid > 0 and snapshot.ask > 0:
+                return (snapshot.bid + snapshot.ask) / 2
+            elif snapshot.last > 0:
+                return snapshot.last
         return None
 
-    def compute_orderbook_imbalance(self, reference_price):
+    def _get_price_bounds(self, reference_price):
+        """計算 ORDERBOOK_PRICE_RANGE_BPS 對應的價格上下界"""
+        range_factor = ORDERBOOK_PRICE_RANGE_BPS / 10000.0
+        return reference_price * (1 - range_factor), reference_price * (1 + range_factor)
+
+    def compute_orderbook_imbalance(self, reference_price, range_bps=None, snapshot=None):
         """
         計算訂單簿不平衡指標 (OBI)
         範圍: -1 到 1
         正值表示買盤強勢，負值表示賣盤強勢
+        range_bps: 統計範圍（基點），預設為 ORDERBOOK_PRICE_RANGE_BPS
         """
-        if not self.depth_data_ready or not reference_price or reference_price == 0:
+        snapshot = snapshot or self.snapshot
+        if not snapshot.depth_ready or not reference_price or reference_price == 0:
             return None
         
-        with self.data_lock:
-            # 計算價格範圍
-            range_factor = ORDERBOOK_PRICE_RANGE_BPS / 10000.0
-            lower_price_bound = reference_price * (1 - range_factor)
-            upper_price_bound = reference_price * (1 + range_factor)
-            
-            # 統計買盤量
-            total_bid_volume = 0.0
-            for price_level, volume_str in self.bid_levels:
-                try:
-                    level_price = float(price_level)
-                    if lower_price_bound <= level_price <= reference_price:
-                        total_bid_volume += float(volume_str)
-                except:
-                    pass
-            
-            # 統計賣盤量
-            total_ask_volume = 0.0
-            for price_level, volume_str in self.ask_levels:
-                try:
-                    level_price = float(price_level)
-                    if reference_price <= level_price <= upper_price_bound:
-                        total_ask_volume += float(volume_str)
-                except:
-                    pass
-            
-            # 計算不平衡度
-            combined_volume = total_bid_volume + total_ask_volume
-            if combined_volume == 0:
-                return None
-            
-            imbalance = (total_bid_volume - total_ask_volume) / combined_volume
-            return imbalance
+        if range_bps is None:
+            range_bps = ORDERBOOK_PRICE_RANGE_BPS
+        return snapshot.orderbook.imbalance_within_bps(reference_price, range_bps)
+    
+    def compute_multi_band_imbalance(self, reference_price, bands_bps=None, snapshot=None):
+        """
+        一次計算多個價格範圍的 OBI（多週期不平衡信號）
+        bands_bps: 價格範圍列表（基點），預設為 ORDERBOOK_IMBALANCE_BANDS_BPS
+        返回: {範圍bps: OBI 或 None}，數據未就緒時返回 None
+        """
+        snapshot = snapshot or self.snapshot
+        if not snapshot.depth_ready or not reference_price or reference_price == 0:
+            return None
+        
+        if bands_bps is None:
+            bands_bps = ORDERBOOK_IMBALANCE_BANDS_BPS
+        book = snapshot.orderbook
+        return {band: book.imbalance_within_bps(reference_price, band) for band in bands_bps}
     
-    def get_orderbook_depth(self, reference_price):
+    def get_orderbook_depth(self, reference_price, snapshot=None):
         """
         獲取 ORDERBOOK_PRICE_RANGE_BPS 範圍內的訂單簿深度
         返回: (買盤總量, 賣盤總量, 總深度)
         """
-        if not self.depth_data_ready or not reference_price or reference_price == 0:
+        snapshot = snapshot or self.snapshot
+        if not snapshot.depth_ready or not reference_price or reference_price == 0:
             return None, None, None
         
-        with self.data_lock:
-            # 計算價格範圍
-            range_factor = ORDERBOOK_PRICE_RANGE_BPS / 10000.0
-            lower_price_bound = reference_price * (1 - range_factor)
-            upper_price_bound = reference_price * (1 + range_factor)
-            
-            # 統計買盤量
-            total_bid_volume = 0.0
-            for price_level, volume_str in self.bid_levels:
-                try:
-                    level_price = float(price_level)
-                    if lower_price_bound <= level_price <= reference_price:
-                        total_bid_volume += float(volume_str)
-                except:
-                    pass
-            
-            # 統計賣盤量
-            total_ask_volume = 0.0
-            for price_level, volume_str in self.ask_levels:
-                try:
-                    level_price = float(price_level)
-                    if reference_price <= level_price <= upper_price_bound:
-                        total_ask_volume += float(volume_str)
-                except:
-                    pass
-            
-            total_depth = total_bid_volume + total_ask_volume
-            return total_bid_volume, total_ask_volume, total_depth
+        lower_price_bound, upper_price_bound = self._get_price_bounds(reference_price)
+        book = snapshot.orderbook
+        
+        total_bid_volume = book.bid_volume(lower_price_bound, reference_price)
+        total_ask_volume = book.ask_volume(reference_price, upper_price_bound)
+        
+        total_depth = total_bid_volume + total_ask_volume
+        return total_bid_volume, total_ask_volume, total_depth
     
-    def get_detailed_orderbook_depth(self, reference_price):
+    def get_detailed_orderbook_depth(self, reference_price, snapshot=None):
         """
         獲取 ORDERBOOK_PRICE_RANGE_BPS 範圍內每個價格檔位的詳細深度
         返回: {
@@ -351,68 +1312,631 @@ class MarketDataStream:
             'total_depth': 總深度
         }
         """
-        if not self.depth_data_ready or not reference_price or reference_price == 0:
+        snapshot = snapshot or self.snapshot
+        if not snapshot.depth_ready or not reference_price or reference_price == 0:
             return None
         
-        with self.data_lock:
-            # 計算價格範圍
-            range_factor = ORDERBOOK_PRICE_RANGE_BPS / 10000.0
-            lower_price_bound = reference_price * (1 - range_factor)
-            upper_price_bound = reference_price * (1 + range_factor)
-            
-            # 收集買盤檔位
-            bid_levels = []
-            total_bid_volume = 0.0
-            for price_level, volume_str in self.bid_levels:
-                try:
-                    level_price = float(price_level)
-                    if lower_price_bound <= level_price <= reference_price:
-                        volume = float(volume_str)
-                        bid_levels.append((level_price, volume))
-                        total_bid_volume += volume
-                except:
-                    pass
-            
-            # 收集賣盤檔位
-            ask_levels = []
-            total_ask_volume = 0.0
-            for price_level, volume_str in self.ask_levels:
-                try:
-                    level_price = float(price_level)
-                    if reference_price <= level_price <= upper_price_bound:
-                        volume = float(volume_str)
-                        ask_levels.append((level_price, volume))
-                        total_ask_volume += volume
-                except:
-                    pass
-            
-            # 排序：買盤按價格降序，賣盤按價格升序
-            bid_levels.sort(key=lambda x: x[0], reverse=True)
-            ask_levels.sort(key=lambda x: x[0])
-            
-            return {
-                'bid_levels': bid_levels,
-                'ask_levels': ask_levels,
-                'total_bid': total_bid_volume,
-                'total_ask': total_ask_volume,
-                'total_depth': total_bid_volume + total_ask_volume
-            }
+        lower_price_bound, upper_price_bound = self._get_price_bounds(reference_price)
+        book = snapshot.orderbook
+        
+        # 檔位已預先排序：買盤降序，賣盤升序
+        bid_levels = book.bid_levels_in_range(lower_price_bound, reference_price)
+        ask_levels = book.ask_levels_in_range(reference_price, upper_price_bound)
+        total_bid_volume, total_ask_volume = book.volume_within_bps(reference_price, ORDERBOOK_PRICE_RANGE_BPS)
+        
+        return {
+            'bid_levels': bid_levels,
+            'ask_levels': ask_levels,
+            'total_bid': total_bid_volume,
+            'total_ask': total_ask_volume,
+            'total_depth': total_bid_volume + total_ask_volume
+        }
 
 # ==========================================
-# 📝 成交記錄系統
+# 👤 帳戶狀態（私有推送 + 本地訂單簿）
 # ==========================================
 
-class TradeLogger:
-    def __init__(self, log_filename="trades.log"):
-        """
+class AccountState:
+    """
+    本地持倉與掛單視圖
+    掛單以 /api/new_order 返回的訂單 ID 為鍵，由下單/撤單回應與私有推送即時維護；
+    持倉由私有推送更新。REST 僅用於初始同步、斷線或狀態不確定後的重新同步，以及定期對帳
+    """
+    # 視為仍在掛單中的訂單狀態
+    OPEN_ORDER_STATUSES = ("new", "open", "partially_filled", "pending")
+    # 記住最近已結束的訂單 ID，避免推送先於下單回應到達時把已結束的訂單重新加回
+    CLOSED_ORDER_MEMORY = 256
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.position = None
+        self.orders = {}
+        self.closed_order_ids = deque(maxlen=self.CLOSED_ORDER_MEMORY)
+        self.untracked_orders = []
+        self.position_synced_at = None
+        self.orders_synced_at = None
+        self.orders_dirty = False
+        self.stream_connected = False
+        self.push_confirmed = False
+
+    @staticmethod
+    def _iter_items(data):
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return [data]
+        return []
+
+    @staticmethod
+    def extract_order_id(order_result):
+        """從下單回應中取出訂單 ID，支援 order_id / id 以及嵌套在 data / result 中的格式"""
+        if not isinstance(order_result, dict):
+            return None
+        for key in ('order_id', 'id'):
+            if order_result.get(key) is not None:
+                return order_result[key]
+        for key in ('data', 'result'):
+            nested = order_result.get(key)
+            if isinstance(nested, dict):
+                order_id = AccountState.extract_order_id(nested)
+                if order_id is not None:
+                    return order_id
+        return None
+
+    # ---------- 私有推送 ----------
+
+    def handle_connection_change(self, connected):
+        """連線斷開後推送可能遺漏，持倉與掛單都需重新以 REST 同步"""
+        with self.lock:
+            self.stream_connected = connected
+            self.push_confirmed = False
+            if not connected:
+                self.position_synced_at = None
+                self.orders_dirty = True
+
+    def handle_auth_message(self, data):
+        """認證回應：code 為 0 或未帶錯誤時視為私有推送已生效"""
+        code = data.get('code', 0) if isinstance(data, dict) else 0
+        with self.lock:
+            self.push_confirmed = code == 0
+        if code != 0:
+            log.error(f"私有頻道認證失敗: {data}")
+
+    def handle_position_message(self, data):
+        with self.lock:
+            self.push_confirmed = True
+            for item in self._iter_items(data):
+                if item.get('symbol', TRADING_PAIR) == TRADING_PAIR:
+                    self.position = item
+
+    def handle_order_message(self, data):
+        with self.lock:
+            self.push_confirmed = True
+            for item in self._iter_items(data):
+                if item.get('symbol', TRADING_PAIR) != TRADING_PAIR:
+                    continue
+                order_id = item.get('id', item.get('order_id'))
+                if order_id is None:
+                    continue
+                status = str(item.get('status', 'open')).lower()
+                if status in self.OPEN_ORDER_STATUSES:
+                    if order_id not in self.closed_order_ids:
+                        self.orders[order_id] = dict(item, id=order_id)
+                else:
+                    self._forget_order(order_id)
+
+    def _forget_order(self, order_id):
+        self.orders.pop(order_id, None)
+        self.closed_order_ids.append(order_id)
+
+    # ---------- 下單/撤單回應 ----------
+
+    def register_submitted_order(self, order_result, side, price, quantity):
+        """
+        以下單回應登記新掛單
+        回應成功但取不到訂單 ID 時無法在本地追蹤，標記為需要 REST 對帳（屆時按方向與價格匹配）
+        """
+        order_id = self.extract_order_id(order_result)
+        with self.lock:
+            if order_id is None:
+                self.untracked_orders.append((side, float(price)))
+                self.orders_dirty = True
+                return
+            if order_id in self.closed_order_ids:
+                return
+            self.orders.setdefault(order_id, {
+                'id': order_id,
+                'symbol': TRADING_PAIR,
+                'side': side,
+                'price': str(price),
+                'qty': str(quantity),
+                'status': 'open'
+            })
+
+    def register_canceled_order(self, order_id, confirmed):
+        """撤單成功時移除掛單；結果不確定（逾時、錯誤）時標記為需要 REST 對帳"""
+        with self.lock:
+            if confirmed:
+                self._forget_order(order_id)
+            else:
+                self.orders_dirty = True
+
+    # ---------- 同步狀態 ----------
+
+    def is_live(self):
+        with self.lock:
+            return self.stream_connected and self.push_confirmed
+
+    def position_trusted(self):
+        """持倉只能由推送維護，推送可用且未到對帳時間時才可信"""
+        with self.lock:
+            return (self.stream_connected and self.push_confirmed
+                    and self._is_fresh(self.position_synced_at))
+
+    def orders_trusted(self):
+        """掛單由下單/撤單回應維護，未到對帳時間且沒有不確定的請求即可信"""
+        with self.lock:
+            return not self.orders_dirty and self._is_fresh(self.orders_synced_at)
+
+    @staticmethod
+    def _is_fresh(synced_at):
+        return synced_at is not None and time.time() - synced_at < ACCOUNT_RECONCILE_INTERVAL
+
+    def sync_position(self, position):
+        with self.lock:
+            previous_qty = float(self.position.get('qty', 0)) if self.position else 0.0
+            current_qty = float(position.get('qty', 0)) if position else 0.0
+            self.position = position
+            self.position_synced_at = time.time()
+            # 沒有私有推送時，持倉變化代表有掛單成交，本地掛單需重新對帳
+            if current_qty != previous_qty and not self.push_confirmed:
+                self.orders_dirty = True
+
+    def sync_orders(self, orders):
+        """以 REST 結果覆蓋本地掛單，並記錄與本地視圖的偏差"""
+        remote_orders = {order['id']: order for order in orders if 'id' in order}
+        with self.lock:
+            local_orders = self.orders
+            missing = [order_id for order_id in local_orders if order_id not in remote_orders]
+            unknown = [order_id for order_id in remote_orders if order_id not in local_orders]
+            # 下單回應缺少 ID 的訂單按方向與價格匹配，匹配上的不算偏差
+            untracked_keys = set(self.untracked_orders)
+            unknown = [
+                order_id for order_id in unknown
+                if (remote_orders[order_id].get('side'), float(remote_orders[order_id].get('price', 0))) not in untracked_keys
+            ]
+            self.untracked_orders = []
+            was_synced = self.orders_synced_at is not None
+            self.orders = remote_orders
+            self.orders_synced_at = time.time()
+            self.orders_dirty = False
+        if was_synced and (missing or unknown):
+            log.info(f"掛單對帳偏差: 本地多出 {len(missing)} 筆, 交易所多出 {len(unknown)} 筆")
+
+    def get_position(self):
+        with self.lock:
+            return dict(self.position) if self.position else None
+
+    def get_open_orders(self):
+        with self.lock:
+            return [dict(order) for order in self.orders.values()]
+
+# ==========================================
+# 🗄️ 日誌輪替與歸檔
+# ==========================================
+
+# 輪替出的文件名: <主檔名>.<輪替時間 YYYYmmdd_HHMMSS>[_序號]<副檔名>，壓縮後加上 .gz
+LOG_SEGMENT_TIME_FORMAT = '%Y%m%d_%H%M%S'
+
+def log_file_day(filename):
+    """返回現有日誌文件最後修改的日期，文件不存在時返回今天，用於跨日輪替"""
+    if os.path.exists(filename):
+        return datetime.fromtimestamp(os.path.getmtime(filename)).date()
+    return datetime.now().date()
+
+def log_rotation_due(current_size, opened_day, max_bytes, daily=LOG_ROTATE_DAILY):
+    """文件超過大小上限，或啟用跨日輪替且日期已改變時返回 True"""
+    if current_size <= 0:
+        return False
+    if max_bytes and current_size >= max_bytes:
+        return True
+    return daily and datetime.now().date() != opened_day
+
+class LogArchiver:
+    """
+    日誌歸檔器
+    寫入端輪替時只需把文件改名（幾乎不耗時），壓縮為 .gz 與清理過期歸檔都在背景線程完成
+    """
+    def __init__(self, retention_count=LOG_RETENTION_COUNT, retention_days=LOG_RETENTION_DAYS):
+        self.retention_count = retention_count
+        self.retention_days = retention_days
+        self.archive_queue = queue.Queue()
+        self.archiver_thread = threading.Thread(target=self._run_archiver, daemon=True)
+        self.archiver_thread.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _segment_files(filename):
+        """
+        返回 (未壓縮的輪替文件, 已壓縮的歸檔 [(路徑, 輪替時間)])，皆按 (輪替時間, 序號) 排序
+        同一秒內的多次輪替以 _1、_2 ... 後綴區分，無後綴視為序號 0；
+        不能按文件名排序，否則 _10 會排在 _2 之前
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        base_name, extension = os.path.splitext(os.path.basename(filename))
+        prefix = base_name + "."
+        segments, archives = [], []
+        for entry in os.listdir(directory):
+            if not entry.startswith(prefix):
+                continue
+            stamp_end = len(prefix) + 15
+            try:
+                rotated_at = datetime.strptime(entry[len(prefix):stamp_end], LOG_SEGMENT_TIME_FORMAT)
+            except ValueError:
+                continue
+            if entry.endswith(extension + ".gz"):
+                suffix = entry[stamp_end:len(entry) - len(extension) - 3]
+                is_archive = True
+            elif entry.endswith(extension):
+                suffix = entry[stamp_end:len(entry) - len(extension)]
+                is_archive = False
+            else:
+                continue
+            if not suffix:
+                sequence = 0
+            elif suffix[0] == "_" and suffix[1:].isdigit():
+                sequence = int(suffix[1:])
+            else:
+                continue
+            path = os.path.join(directory, entry)
+            if is_archive:
+                archives.append((rotated_at, sequence, path))
+            else:
+                segments.append((rotated_at, sequence, path))
+        segments.sort()
+        archives.sort()
+        return (
+            [path for _, _, path in segments],
+            [(path, rotated_at) for rotated_at, _, path in archives]
+        )
+
+    def register(self, filename):
+        """登記一個日誌文件：上次中斷前未壓縮的輪替文件與過期歸檔交給背景線程處理"""
+        self.archive_queue.put((filename, None))
+
+    def rotate(self, filename):
+        """
+        將目前的日誌文件改名為輪替文件並排入背景壓縮
+        調用前寫入端必須先關閉該文件，返回輪替文件路徑（文件不存在時返回 None）
+        """
+        if not os.path.exists(filename):
+            return None
+        base_name, extension = os.path.splitext(filename)
+        stamp = datetime.now().strftime(LOG_SEGMENT_TIME_FORMAT)
+        segment_path = f"{base_name}.{stamp}{extension}"
+        sequence = 1
+        while os.path.exists(segment_path) or os.path.exists(segment_path + ".gz"):
+            segment_path = f"{base_name}.{stamp}_{sequence}{extension}"
+            sequence += 1
+        os.replace(filename, segment_path)
+        self.archive_queue.put((filename, segment_path))
+        return segment_path
+
+    def close(self):
+        """處理完佇列中的壓縮工作後結束背景線程"""
+        if self.archiver_thread.is_alive():
+            self.archive_queue.put(None)
+            self.archiver_thread.join(timeout=30)
+
+    @staticmethod
+    def _compress(segment_path):
+        archive_path = segment_path + ".gz"
+        with open(segment_path, 'rb') as source, gzip.open(archive_path + ".tmp", 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        # 壓縮完成後才換上正式檔名，中斷時不會留下不完整的 .gz
+        os.replace(archive_path + ".tmp", archive_path)
+        os.remove(segment_path)
+
+    def _apply_retention(self, filename):
+        _, archives = self._segment_files(filename)
+        expire_before = datetime.now() - timedelta(days=self.retention_days) if self.retention_days else None
+        excess_count = max(0, len(archives) - self.retention_count) if self.retention_count else 0
+        for index, (archive_path, rotated_at) in enumerate(archives):
+            if index < excess_count or (expire_before and rotated_at < expire_before):
+                os.remove(archive_path)
+                log.info(f"已刪除過期日誌歸檔: {archive_path}")
+
+    def _run_archiver(self):
+        while True:
+            item = self.archive_queue.get()
+            if item is None:
+                return
+            filename, segment_path = item
+            try:
+                segments = [segment_path] if segment_path else self._segment_files(filename)[0]
+                for pending_path in segments:
+                    # 登記時的掃描可能已壓縮了之後才排入的輪替文件
+                    if os.path.exists(pending_path):
+                        self._compress(pending_path)
+                self._apply_retention(filename)
+            except Exception as err:
+                log.error(f"日誌歸檔失敗 ({filename}): {err}")
+
+class ArchivingFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小或跨日輪替的日誌處理器，輪替出的文件交由 LogArchiver 在背景壓縮"""
+    def __init__(self, filename, archiver, max_bytes, daily=LOG_ROTATE_DAILY):
+        super().__init__(filename, maxBytes=max_bytes, encoding='utf-8')
+        self.archiver = archiver
+        self.daily = daily
+        self.opened_day = log_file_day(self.baseFilename)
+        archiver.register(self.baseFilename)
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        return log_rotation_due(self.stream.tell(), self.opened_day, self.maxBytes, self.daily)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.archiver.rotate(self.baseFilename)
+        self.opened_day = datetime.now().date()
+        self.stream = self._open()
+
+log_archiver = None
+
+def get_log_archiver():
+    """返回共用的日誌歸檔器，第一次調用時建立"""
+    global log_archiver
+    if log_archiver is None:
+        log_archiver = LogArchiver()
+    return log_archiver
+
+def setup_file_logging(filename=APP_LOG_FILE):
+    """為程式日誌加上輪替與壓縮歸檔的文件輸出（僅在實盤入口調用，回放與工具不寫文件）"""
+    if not filename:
+        return None
+    handler = ArchivingFileHandler(filename, get_log_archiver(), APP_LOG_ROTATE_MB * 1024 * 1024)
+    handler.setFormatter(logging.Formatter('[%(asctime)s][%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    logging.getLogger().addHandler(handler)
+    log.info(f"程式日誌文件: {filename} (每 {APP_LOG_ROTATE_MB}MB{' 或跨日' if LOG_ROTATE_DAILY else ''}輪替)")
+    return handler
+
+# ==========================================
+# 📝 成交記錄系統
+# ==========================================
+
+# 結構化成交日誌:
+#   日誌 (.jsonl): 每行一筆 JSON 記錄，含遞增的記錄編號 id、類型 type 與時間戳 ts；
+#                  平倉記錄以 open_id 指向對應的成交記錄
+#   索引 (.jsonl.idx): 每筆記錄一個定長條目 記錄編號(Q) 時間戳(d) 偏移量(Q) 長度(I) 類型(B)，
+#                  工具可按時間二分搜尋或按編號直接定位，無需解析整個日誌
+JOURNAL_INDEX_ENTRY = struct.Struct("<QdQIB")
+JOURNAL_INDEX_SUFFIX = ".idx"
+JOURNAL_RECORD_TYPES = {'open': 1, 'close': 2, 'risk': 3}
+JOURNAL_RECORD_TYPE_NAMES = {code: name for name, code in JOURNAL_RECORD_TYPES.items()}
+
+def read_journal_index(index_filename):
+    """讀取索引文件，返回 [(記錄編號, 時間戳, 偏移量, 長度, 類型代碼), ...]，忽略尾部不完整的條目"""
+    if not os.path.exists(index_filename):
+        return []
+    with open(index_filename, 'rb') as index_file:
+        data = index_file.read()
+    usable_size = len(data) - len(data) % JOURNAL_INDEX_ENTRY.size
+    return list(JOURNAL_INDEX_ENTRY.iter_unpack(data[:usable_size]))
+
+class TradeJournal:
+    """
+    結構化成交日誌的寫入端（由 TradeLogger 的背景線程使用）
+    開啟時校驗索引與日誌：補齊程式中斷前已寫入日誌但未寫入索引的記錄，
+    截斷尾部不完整的行，並恢復下一個記錄編號與尚未平倉的成交記錄編號
+    日誌與索引刻意不輪替：記錄編號的延續與未平倉成交的恢復都依賴完整的日誌，
+    queryJournal 的 --trade 也需要在同一份索引中找到成交與對應的平倉記錄；
+    每筆記錄約數 KB（索引每筆 29 字節），按成交頻率增長緩慢，需要清理時請停機後整份歸檔
+    """
+    def __init__(self, journal_filename):
+        self.journal_filename = journal_filename
+        self.index_filename = journal_filename + JOURNAL_INDEX_SUFFIX
+        entries = self._recover()
+        self.next_id = entries[-1][0] + 1 if entries else 1
+        self.open_trade_id = None
+        for record_id, _, _, _, type_code in reversed(entries):
+            if type_code == JOURNAL_RECORD_TYPES['close']:
+                break
+            if type_code == JOURNAL_RECORD_TYPES['open']:
+                self.open_trade_id = record_id
+                break
+        self.journal_file = open(self.journal_filename, 'ab')
+        self.index_file = open(self.index_filename, 'ab')
+        self.journal_size = self.journal_file.tell()
+
+    def _recover(self):
+        entries = read_journal_index(self.index_filename)
+        journal_size = os.path.getsize(self.journal_filename) if os.path.exists(self.journal_filename) else 0
+        indexed_end = entries[-1][2] + entries[-1][3] if entries else 0
+        if indexed_end > journal_size:
+            log.warning(f"成交日誌索引與日誌不一致，重建索引: {self.index_filename}")
+            entries, indexed_end = [], 0
+
+        recovered = []
+        valid_end = indexed_end
+        if journal_size > indexed_end:
+            with open(self.journal_filename, 'rb') as journal_file:
+                journal_file.seek(indexed_end)
+                offset = indexed_end
+                for line in journal_file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = decode_json(line)
+                        recovered.append((
+                            int(record['id']), float(record['ts']), offset, len(line),
+                            JOURNAL_RECORD_TYPES.get(record.get('type'), 0)
+                        ))
+                    except (ValueError, KeyError, TypeError):
+                        break
+                    offset += len(line)
+                valid_end = offset
+        if valid_end < journal_size:
+            log.warning(f"成交日誌尾部不完整，已截斷 {journal_size - valid_end} 字節: {self.journal_filename}")
+            with open(self.journal_filename, 'r+b') as journal_file:
+                journal_file.truncate(valid_end)
+
+        # 以校驗後的條目重寫索引（通常與原文件相同，僅在補齊或重建時有變化）
+        entries.extend(recovered)
+        index_size = os.path.getsize(self.index_filename) if os.path.exists(self.index_filename) else 0
+        if index_size != len(entries) * JOURNAL_INDEX_ENTRY.size:
+            with open(self.index_filename, 'wb') as index_file:
+                index_file.write(b"".join(JOURNAL_INDEX_ENTRY.pack(*entry) for entry in entries))
+            if recovered:
+                log.info(f"成交日誌索引已補齊 {len(recovered)} 筆記錄")
+        return entries
+
+    def append_records(self, records):
+        """寫入一批 (記錄 dict) 並追加索引條目，返回寫入筆數"""
+        lines = []
+        index_entries = []
+        offset = self.journal_size
+        for record in records:
+            line = encode_json(record).encode('utf-8') + b"\n"
+            lines.append(line)
+            index_entries.append(JOURNAL_INDEX_ENTRY.pack(
+                record['id'], record['ts'], offset, len(line), JOURNAL_RECORD_TYPES[record['type']]
+            ))
+            offset += len(line)
+        # 先寫日誌再寫索引：中斷時索引至多落後，重新開啟時會補齊
+        self.journal_file.write(b"".join(lines))
+        self.journal_file.flush()
+        self.index_file.write(b"".join(index_entries))
+        self.index_file.flush()
+        self.journal_size = offset
+        return len(lines)
+
+    def sync_to_disk(self):
+        os.fsync(self.journal_file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def close(self):
+        self.journal_file.close()
+        self.index_file.close()
+
+class TradeJournalReader:
+    """
+    結構化成交日誌的讀取端
+    只載入定長索引，按時間範圍或記錄編號定位後才讀取對應的行
+    """
+    def __init__(self, journal_filename):
+        self.journal_filename = journal_filename
+        entries = read_journal_index(journal_filename + JOURNAL_INDEX_SUFFIX)
+        self.record_ids = [entry[0] for entry in entries]
+        self.timestamps = [entry[1] for entry in entries]
+        self.offsets = [entry[2] for entry in entries]
+        self.lengths = [entry[3] for entry in entries]
+        self.type_codes = [entry[4] for entry in entries]
+
+    def __len__(self):
+        return len(self.record_ids)
+
+    def _read_at(self, position):
+        with open(self.journal_filename, 'rb') as journal_file:
+            journal_file.seek(self.offsets[position])
+            return decode_json(journal_file.read(self.lengths[position]))
+
+    def _position_of(self, record_id):
+        # 記錄編號連續遞增，可直接換算位置；索引重建後不連續時退回二分搜尋
+        if not self.record_ids:
+            return None
+        position = record_id - self.record_ids[0]
+        if not (0 <= position < len(self.record_ids) and self.record_ids[position] == record_id):
+            position = bisect_left(self.record_ids, record_id)
+            if position >= len(self.record_ids) or self.record_ids[position] != record_id:
+                return None
+        return position
+
+    def get_record(self, record_id):
+        """按記錄編號讀取單筆記錄，不存在時返回 None"""
+        position = self._position_of(record_id)
+        return self._read_at(position) if position is not None else None
+
+    def records_between(self, start_ts=None, end_ts=None, record_type=None):
+        """逐筆返回時間戳落在 [start_ts, end_ts] 內的記錄，可按類型過濾"""
+        start = bisect_left(self.timestamps, start_ts) if start_ts is not None else 0
+        end = bisect_right(self.timestamps, end_ts) if end_ts is not None else len(self.timestamps)
+        type_code = JOURNAL_RECORD_TYPES.get(record_type) if record_type else None
+        for position in range(start, end):
+            if type_code is None or self.type_codes[position] == type_code:
+                yield self._read_at(position)
+
+    def get_trade(self, open_id):
+        """返回 (成交記錄, 對應的平倉記錄或 None)；只讀取該成交之後的平倉記錄"""
+        position = self._position_of(open_id)
+        if position is None:
+            return None, None
+        open_record = self._read_at(position)
+        close_code = JOURNAL_RECORD_TYPES['close']
+        for later_position in range(position + 1, len(self.record_ids)):
+            if self.type_codes[later_position] != close_code:
+                continue
+            close_record = self._read_at(later_position)
+            if close_record.get('open_id') == open_id:
+                return open_record, close_record
+        return open_record, None
+
+class TradeLogger:
+    """
+    成交記錄器
+    策略線程只分配記錄編號並把 (記錄類型, 編號, 時間戳, 參數) 放入佇列，
+    格式化與寫檔都在背景線程完成，不會拖慢成交後的撤單與平倉；
+    每筆記錄寫入結構化日誌 (.jsonl + 索引)，並可選擇同時寫入文字記錄；
+    背景線程保持文件開啟，每批寫入後 flush，並按 fsync_interval 將數據落盤
+    """
+    def __init__(self, log_filename="trades.log", journal_filename=None,
+                 text_view=TRADE_LOG_TEXT_VIEW, fsync_interval=TRADE_LOG_FSYNC_INTERVAL):
+        """
         初始化成交記錄器
-        log_filename: 日誌文件名，默認為 trades.log
+        log_filename: 文字記錄文件名，默認為 trades.log
+        journal_filename: 結構化日誌文件名，默認為同名的 .jsonl
+        text_view: 是否寫入文字記錄
         """
         self.log_filename = log_filename
-        self.log_lock = threading.Lock()
+        self.journal_filename = journal_filename or os.path.splitext(log_filename)[0] + ".jsonl"
+        self.fsync_interval = fsync_interval
+        self.record_queue = queue.Queue(maxsize=TRADE_LOG_QUEUE_SIZE)
+        self.dropped_count = 0
+        self.written_count = 0
+        self.closed = False
+
+        self.journal = TradeJournal(self.journal_filename)
+        self.record_ids = count(self.journal.next_id)
+        # 尚未平倉的成交記錄編號，平倉記錄以此關聯
+        self.open_trade_id = self.journal.open_trade_id
+
+        self.log_file = None
+        if text_view:
+            # 文字記錄按大小或跨日輪替，舊文件由歸檔器在背景壓縮
+            self.archiver = get_log_archiver()
+            self.archiver.register(self.log_filename)
+            self.log_opened_day = log_file_day(self.log_filename)
+            self._open_log_file()
+        self.writer_thread = threading.Thread(target=self._run_writer, daemon=True)
+        self.writer_thread.start()
+        # 正常退出或 sys.exit 時寫完佇列中剩餘的記錄
+        atexit.register(self.close)
+    
+    def _open_log_file(self):
         # 確保日誌文件存在，如果不存在則創建並寫入標題
         self._initialize_log_file()
-    
+        self.log_file = open(self.log_filename, 'a', encoding='utf-8')
+
+    def _rotate_log_file(self):
+        """在背景寫入線程中輪替文字記錄：關閉、改名交給歸檔器，再開新文件"""
+        self.log_file.close()
+        segment_path = self.archiver.rotate(self.log_filename)
+        self.log_opened_day = datetime.now().date()
+        self._open_log_file()
+        log.info(f"成交記錄已輪替: {segment_path}")
+
     def _initialize_log_file(self):
         """初始化日誌文件，寫入表頭"""
         try:
@@ -425,102 +1949,55 @@ class TradeLogger:
                     f.write("=" * 80 + "\n\n")
         except Exception as e:
             log.error(f"初始化日誌文件失敗: {e}")
+
+    def _enqueue(self, record_type, fields):
+        """
+        由策略線程調用：分配記錄編號、記下事件時間後只入佇列，不做格式化與 I/O
+        返回記錄編號；佇列已滿被丟棄時返回 None（該編號不會出現在任何日誌中）
+        """
+        if self.closed:
+            return None
+        record_id = next(self.record_ids)
+        try:
+            self.record_queue.put_nowait((record_type, record_id, time.time(), fields))
+        except queue.Full:
+            self.dropped_count += 1
+            log.warning(f"成交記錄佇列已滿，丟棄記錄 #{record_id} ({record_type})")
+            return None
+        return record_id
     
     def log_trade(self, position_data, market_price=None, closing_info=None, 
                   orderbook_depth=None, detailed_orderbook=None, short_term_volatility=None, mid_term_volatility=None):
         """
-        記錄成交信息
+        記錄成交信息（非阻塞，由背景線程寫入）
         
         Args:
             position_data: 持倉數據字典，包含 qty, side 等信息
             market_price: 市場價格（可選）
             closing_info: 平倉信息字典（可選），包含 close_time, close_price 等
-                          如果提供，則追加平倉信息到最新記錄；否則創建新記錄
+                          如果提供，則記錄為最近一筆未平倉成交的平倉記錄；否則創建新的成交記錄
             orderbook_depth: 訂單簿深度元組 (買盤總量, 賣盤總量, 總深度) 或 None（已棄用，使用 detailed_orderbook）
             detailed_orderbook: 詳細訂單簿數據字典，包含每個價格檔位的深度
             short_term_volatility: 10秒波動率（百分比，例如 0.001 表示 0.1%）
             mid_term_volatility: 20秒波動率（百分比，例如 0.0015 表示 0.15%）
+        返回: 記錄編號，佇列已滿被丟棄時返回 None
         """
-        try:
-            with self.log_lock:
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 解析持倉信息
-                position_size = float(position_data.get('qty', 0))
-                position_side = 'LONG' if position_size > 0 else 'SHORT'
-                entry_price = position_data.get('entry_price', position_data.get('avg_price', 'N/A'))
-                
-                # 如果有平倉信息，追加到最新記錄
-                if closing_info:
-                    # 追加平倉信息到文件末尾
-                    with open(self.log_filename, 'a', encoding='utf-8') as f:
-                        f.write(f"平倉時間: {closing_info.get('close_time', 'N/A')}\n")
-                        f.write(f"平倉價格: {closing_info.get('close_price', 'N/A')}\n")
-                        if 'pnl' in closing_info:
-                            f.write(f"損益: {closing_info['pnl']}\n")
-                        f.write("-" * 80 + "\n\n")
-                    
-                    print(f"📝 平倉信息已更新到: {self.log_filename}")
-                    log.info(f"平倉信息已更新到日誌文件")
-                else:
-                    # 創建新的成交記錄
-                    log_entry = []
-                    log_entry.append("-" * 80)
-                    log_entry.append(f"成交時間: {timestamp}")
-                    log_entry.append(f"持倉方向: {position_side}")
-                    log_entry.append(f"持倉數量: {abs(position_size)}")
-                    log_entry.append(f"開倉價格: {entry_price}")
-                    
-                    if market_price:
-                        log_entry.append(f"市場價格: {market_price}")
-                    
-                    # 記錄訂單簿深度（僅總量）
-                    if detailed_orderbook:
-                        log_entry.append(f"訂單簿深度 (範圍: ±{ORDERBOOK_PRICE_RANGE_BPS}bps):")
-                        log_entry.append(f"  總買盤: {detailed_orderbook['total_bid']:.4f}")
-                        log_entry.append(f"  總賣盤: {detailed_orderbook['total_ask']:.4f}")
-                        log_entry.append(f"  總深度: {detailed_orderbook['total_depth']:.4f}")
-                    elif orderbook_depth and orderbook_depth[0] is not None:
-                        # 兼容舊格式
-                        bid_vol, ask_vol, total_vol = orderbook_depth
-                        log_entry.append(f"訂單簿深度 (範圍: ±{ORDERBOOK_PRICE_RANGE_BPS}bps):")
-                        log_entry.append(f"  買盤總量: {bid_vol:.4f}")
-                        log_entry.append(f"  賣盤總量: {ask_vol:.4f}")
-                        log_entry.append(f"  總深度: {total_vol:.4f}")
-                    else:
-                        log_entry.append(f"訂單簿深度: 數據未就緒")
-                    
-                    # 記錄波動率
-                    if short_term_volatility is not None:
-                        log_entry.append(f"10秒波動率: {short_term_volatility*100:.4f}%")
-                    else:
-                        log_entry.append(f"10秒波動率: 數據未就緒")
-                    
-                    if mid_term_volatility is not None:
-                        log_entry.append(f"20秒波動率: {mid_term_volatility*100:.4f}%")
-                    else:
-                        log_entry.append(f"20秒波動率: 數據未就緒")
-                    
-                    log_entry.append("-" * 80)
-                    log_entry.append("")
-                    
-                    # 寫入文件
-                    with open(self.log_filename, 'a', encoding='utf-8') as f:
-                        f.write('\n'.join(log_entry) + '\n')
-                    
-                    # 同時輸出到控制台
-                    print(f"📝 成交記錄已寫入: {self.log_filename}")
-                    log.info(f"成交記錄已寫入日誌文件: {position_side} {abs(position_size)} @ {entry_price}")
-                
-        except Exception as e:
-            log.error(f"記錄成交日誌失敗: {e}")
-            print(f"⚠️ 記錄成交日誌時發生錯誤: {e}")
+        if closing_info:
+            open_id, self.open_trade_id = self.open_trade_id, None
+            return self._enqueue('close', (open_id, closing_info))
+        record_id = self._enqueue('open', (
+            position_data, market_price, orderbook_depth, detailed_orderbook,
+            short_term_volatility, mid_term_volatility
+        ))
+        # 成交記錄被丟棄時不能讓平倉記錄指向它（也不能沿用更早的編號），平倉記錄會標示為 N/A
+        self.open_trade_id = record_id
+        return record_id
     
     def log_risk_trigger(self, trigger_type, market_price, orderbook_imbalance=None, 
                         short_term_volatility=None, mid_term_volatility=None, 
                         current_spread=None, detailed_orderbook=None):
         """
-        記錄風控觸發事件（OBI 或波動率觸發）
+        記錄風控觸發事件（OBI 或波動率觸發，非阻塞，由背景線程寫入）
         
         Args:
             trigger_type: 觸發類型 ('OBI' 或 'VOLATILITY_SHORT_TERM')
@@ -530,162 +2007,833 @@ class TradeLogger:
             mid_term_volatility: 20秒波動率（百分比）
             current_spread: 當前價差（基點）
             detailed_orderbook: 詳細訂單簿數據字典
+        返回: 記錄編號，佇列已滿被丟棄時返回 None
         """
+        return self._enqueue('risk', (
+            trigger_type, market_price, orderbook_imbalance, short_term_volatility,
+            mid_term_volatility, current_spread, detailed_orderbook
+        ))
+
+    def close(self):
+        """寫完佇列中剩餘的記錄、落盤並關閉文件"""
+        if self.closed:
+            return
+        self.closed = True
+        self.record_queue.put(None)
+        self.writer_thread.join(timeout=5)
+
+    # ------------------------------------------
+    # 以下在背景寫入線程執行
+    # 每個 _format_* 返回 (結構化記錄, 文字記錄行, 日誌訊息)
+    # ------------------------------------------
+
+    @staticmethod
+    def _orderbook_totals(detailed_orderbook):
+        if not detailed_orderbook:
+            return None
+        return {
+            'total_bid': detailed_orderbook['total_bid'],
+            'total_ask': detailed_orderbook['total_ask'],
+            'total_depth': detailed_orderbook['total_depth']
+        }
+
+    @staticmethod
+    def _format_closing(record, timestamp, open_id, closing_info):
+        record.update(open_id=open_id, close_time=closing_info.get('close_time'),
+                      close_price=closing_info.get('close_price'), pnl=closing_info.get('pnl'))
+        lines = [
+            f"平倉記錄: #{record['id']} (對應成交 #{open_id if open_id is not None else 'N/A'})",
+            f"平倉時間: {closing_info.get('close_time', 'N/A')}",
+            f"平倉價格: {closing_info.get('close_price', 'N/A')}"
+        ]
+        if 'pnl' in closing_info:
+            lines.append(f"損益: {closing_info['pnl']}")
+        lines.append("-" * 80)
+        lines.append("")
+        return record, lines, "平倉信息已更新到日誌文件"
+
+    def _format_trade(self, record, timestamp, position_data, market_price, orderbook_depth, detailed_orderbook,
+                      short_term_volatility, mid_term_volatility):
+        # 解析持倉信息
+        position_size = float(position_data.get('qty', 0))
+        position_side = 'LONG' if position_size > 0 else 'SHORT'
+        entry_price = position_data.get('entry_price', position_data.get('avg_price', 'N/A'))
+
+        orderbook_totals = self._orderbook_totals(detailed_orderbook)
+        if orderbook_totals is None and orderbook_depth and orderbook_depth[0] is not None:
+            orderbook_totals = dict(zip(('total_bid', 'total_ask', 'total_depth'), orderbook_depth))
+        record.update(
+            side=position_side, qty=abs(position_size), entry_price=entry_price, market_price=market_price,
+            orderbook=orderbook_totals,
+            volatility={'10s': short_term_volatility, '20s': mid_term_volatility}
+        )
+
+        log_entry = []
+        log_entry.append("-" * 80)
+        log_entry.append(f"成交時間: {timestamp}")
+        log_entry.append(f"成交編號: #{record['id']}")
+        log_entry.append(f"持倉方向: {position_side}")
+        log_entry.append(f"持倉數量: {abs(position_size)}")
+        log_entry.append(f"開倉價格: {entry_price}")
+        
+        if market_price:
+            log_entry.append(f"市場價格: {market_price}")
+        
+        # 記錄訂單簿深度（僅總量）
+        if detailed_orderbook:
+            log_entry.append(f"訂單簿深度 (範圍: ±{ORDERBOOK_PRICE_RANGE_BPS}bps):")
+            log_entry.append(f"  總買盤: {detailed_orderbook['total_bid']:.4f}")
+            log_entry.append(f"  總賣盤: {detailed_orderbook['total_ask']:.4f}")
+            log_entry.append(f"  總深度: {detailed_orderbook['total_depth']:.4f}")
+        elif orderbook_depth and orderbook_depth[0] is not None:
+            # 兼容舊格式
+            bid_vol, ask_vol, total_vol = orderbook_depth
+            log_entry.append(f"訂單簿深度 (範圍: ±{ORDERBOOK_PRICE_RANGE_BPS}bps):")
+            log_entry.append(f"  買盤總量: {bid_vol:.4f}")
+            log_entry.append(f"  賣盤總量: {ask_vol:.4f}")
+            log_entry.append(f"  總深度: {total_vol:.4f}")
+        else:
+            log_entry.append(f"訂單簿深度: 數據未就緒")
+        
+        # 記錄波動率
+        if short_term_volatility is not None:
+            log_entry.append(f"10秒波動率: {short_term_volatility*100:.4f}%")
+        else:
+            log_entry.append(f"10秒波動率: 數據未就緒")
+        
+        if mid_term_volatility is not None:
+            log_entry.append(f"20秒波動率: {mid_term_volatility*100:.4f}%")
+        else:
+            log_entry.append(f"20秒波動率: 數據未就緒")
+        
+        log_entry.append("-" * 80)
+        log_entry.append("")
+        return record, log_entry, f"成交記錄已寫入日誌文件: #{record['id']} {position_side} {abs(position_size)} @ {entry_price}"
+
+    def _format_risk_trigger(self, record, timestamp, trigger_type, market_price, orderbook_imbalance,
+                             short_term_volatility, mid_term_volatility, current_spread, detailed_orderbook):
+        record.update(
+            trigger_type=trigger_type, market_price=market_price, orderbook_imbalance=orderbook_imbalance,
+            volatility={'10s': short_term_volatility, '20s': mid_term_volatility},
+            spread_bps=current_spread, orderbook=self._orderbook_totals(detailed_orderbook)
+        )
+
+        log_entry = []
+        log_entry.append("-" * 80)
+        log_entry.append(f"風控觸發時間: {timestamp}")
+        log_entry.append(f"記錄編號: #{record['id']}")
+        log_entry.append(f"觸發類型: {trigger_type}")
+        log_entry.append(f"市場價格: {market_price:,.2f}")
+        
+        # 記錄 OBI 數據
+        if orderbook_imbalance is not None:
+            imbalance_pct = orderbook_imbalance * 100
+            imbalance_label = "買盤多" if orderbook_imbalance > 0 else "賣盤多" if orderbook_imbalance < 0 else "平衡"
+            log_entry.append(f"OBI指標: {imbalance_pct:.2f}% ({imbalance_label}, 閾值{ORDERBOOK_IMBALANCE_LIMIT*100:.0f}%)")
+        else:
+            log_entry.append("OBI指標: 數據未就緒")
+        
+        # 記錄波動率
+        if short_term_volatility is not None:
+            log_entry.append(f"10秒波動率: {short_term_volatility*100:.4f}% (閾值{VOLATILITY_SHORT_TERM_PCT*100:.4f}%)")
+        else:
+            log_entry.append("10秒波動率: 數據未就緒")
+        
+        if mid_term_volatility is not None:
+            log_entry.append(f"20秒波動率: {mid_term_volatility*100:.4f}% (閾值{VOLATILITY_MID_TERM_PCT*100:.4f}%)")
+        else:
+            log_entry.append("20秒波動率: 數據未就緒")
+        
+        # 記錄價差
+        if current_spread is not None:
+            log_entry.append(f"當前價差: {current_spread:.2f} bps")
+        else:
+            log_entry.append("當前價差: 數據未就緒")
+        
+        # 記錄訂單簿深度（僅總量）
+        if detailed_orderbook:
+            log_entry.append(f"訂單簿深度 (範圍: ±{ORDERBOOK_PRICE_RANGE_BPS}bps):")
+            log_entry.append(f"  總買盤: {detailed_orderbook['total_bid']:.4f}")
+            log_entry.append(f"  總賣盤: {detailed_orderbook['total_ask']:.4f}")
+            log_entry.append(f"  總深度: {detailed_orderbook['total_depth']:.4f}")
+        else:
+            log_entry.append("訂單簿深度: 數據未就緒")
+        
+        log_entry.append("-" * 80)
+        log_entry.append("")
+        return record, log_entry, f"風控觸發記錄已寫入日誌文件: #{record['id']} {trigger_type}"
+
+    def _format_record(self, record_type, record_id, record_ts, fields):
+        timestamp = datetime.fromtimestamp(record_ts).strftime('%Y-%m-%d %H:%M:%S')
+        record = {'id': record_id, 'type': record_type, 'ts': record_ts, 'time': timestamp}
+        if record_type == 'close':
+            return self._format_closing(record, timestamp, *fields)
+        if record_type == 'risk':
+            return self._format_risk_trigger(record, timestamp, *fields)
+        return self._format_trade(record, timestamp, *fields)
+
+    def _write_batch(self, batch):
+        records = []
+        chunks = []
+        messages = []
+        for record_type, record_id, record_ts, fields in batch:
+            try:
+                record, lines, message = self._format_record(record_type, record_id, record_ts, fields)
+            except Exception as err:
+                log.error(f"格式化成交記錄失敗 (#{record_id} {record_type}): {err}")
+                continue
+            records.append(record)
+            chunks.append('\n'.join(lines) + '\n')
+            messages.append(message)
+        if not records:
+            return
+        # 整批一次寫入並 flush，只在此處觸發系統調用
+        self.journal.append_records(records)
+        if self.log_file:
+            if log_rotation_due(self.log_file.tell(), self.log_opened_day, TRADE_LOG_ROTATE_MB * 1024 * 1024):
+                self._rotate_log_file()
+            self.log_file.write(''.join(chunks))
+            self.log_file.flush()
+        self.written_count += len(records)
+        for message in messages:
+            log.info(message)
+        print(f"📝 {len(records)} 筆記錄已寫入: {self.journal_filename}")
+
+    def _sync_to_disk(self):
         try:
-            with self.log_lock:
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                log_entry = []
-                log_entry.append("-" * 80)
-                log_entry.append(f"風控觸發時間: {timestamp}")
-                log_entry.append(f"觸發類型: {trigger_type}")
-                log_entry.append(f"市場價格: {market_price:,.2f}")
-                
-                # 記錄 OBI 數據
-                if orderbook_imbalance is not None:
-                    imbalance_pct = orderbook_imbalance * 100
-                    imbalance_label = "買盤多" if orderbook_imbalance > 0 else "賣盤多" if orderbook_imbalance < 0 else "平衡"
-                    log_entry.append(f"OBI指標: {imbalance_pct:.2f}% ({imbalance_label}, 閾值{ORDERBOOK_IMBALANCE_LIMIT*100:.0f}%)")
-                else:
-                    log_entry.append("OBI指標: 數據未就緒")
-                
-                # 記錄波動率
-                if short_term_volatility is not None:
-                    log_entry.append(f"10秒波動率: {short_term_volatility*100:.4f}% (閾值{VOLATILITY_SHORT_TERM_PCT*100:.4f}%)")
-                else:
-                    log_entry.append("10秒波動率: 數據未就緒")
-                
-                if mid_term_volatility is not None:
-                    log_entry.append(f"20秒波動率: {mid_term_volatility*100:.4f}% (閾值{VOLATILITY_MID_TERM_PCT*100:.4f}%)")
-                else:
-                    log_entry.append("20秒波動率: 數據未就緒")
-                
-                # 記錄價差
-                if current_spread is not None:
-                    log_entry.append(f"當前價差: {current_spread:.2f} bps")
-                else:
-                    log_entry.append("當前價差: 數據未就緒")
-                
-                # 記錄訂單簿深度（僅總量）
-                if detailed_orderbook:
-                    log_entry.append(f"訂單簿深度 (範圍: ±{ORDERBOOK_PRICE_RANGE_BPS}bps):")
-                    log_entry.append(f"  總買盤: {detailed_orderbook['total_bid']:.4f}")
-                    log_entry.append(f"  總賣盤: {detailed_orderbook['total_ask']:.4f}")
-                    log_entry.append(f"  總深度: {detailed_orderbook['total_depth']:.4f}")
+            self.journal.sync_to_disk()
+            if self.log_file:
+                os.fsync(self.log_file.fileno())
+        except OSError as err:
+            log.error(f"成交記錄落盤失敗: {err}")
+
+    def _close_files(self):
+        self.journal.close()
+        if self.log_file:
+            self.log_file.close()
+
+    def _run_writer(self):
+        fsync_due_at = None
+        while True:
+            try:
+                # 有待落盤的數據時，最多等到 fsync 時間點
+                wait_timeout = None if fsync_due_at is None else max(0.0, fsync_due_at - time.monotonic())
+                try:
+                    item = self.record_queue.get(timeout=wait_timeout)
+                except queue.Empty:
+                    item = False
+                batch = []
+                stop_requested = item is None
+                if item:
+                    batch.append(item)
+                # 一次取出佇列中所有已到達的記錄合併寫入
+                while not stop_requested:
+                    try:
+                        item = self.record_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop_requested = True
+                    else:
+                        batch.append(item)
+
+                if batch:
+                    self._write_batch(batch)
+                    if self.fsync_interval is not None and fsync_due_at is None:
+                        fsync_due_at = time.monotonic() + self.fsync_interval
+                if fsync_due_at is not None and (stop_requested or time.monotonic() >= fsync_due_at):
+                    self._sync_to_disk()
+                    fsync_due_at = None
+                if stop_requested:
+                    self._close_files()
+                    return
+            except Exception as err:
+                log.error(f"記錄成交日誌失敗: {err}")
+                print(f"⚠️ 記錄成交日誌時發生錯誤: {err}")
+
+# ==========================================
+# 🌐 HTTP 連線池與計時
+# ==========================================
+
+# 記錄當前線程最近一次請求中建立連線（DNS + TCP + TLS）的耗時
+http_connect_timing = threading.local()
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        connect_started = time.perf_counter()
+        super().connect()
+        http_connect_timing.seconds = getattr(http_connect_timing, 'seconds', 0.0) + time.perf_counter() - connect_started
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        connect_started = time.perf_counter()
+        super().connect()
+        http_connect_timing.seconds = getattr(http_connect_timing, 'seconds', 0.0) + time.perf_counter() - connect_started
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """使用可計時連線的 HTTPAdapter，用於區分建連耗時與請求耗時"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+class HttpTimingStats:
+    """按端點統計請求數、新建連線數，以及建連（DNS + TCP + TLS）與請求本身的耗時"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, connect_seconds, total_seconds):
+        connect_ms = connect_seconds * 1000
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'new_connections': 0,
+                'connect_ms_total': 0.0, 'request_ms_total': 0.0, 'max_connect_ms': 0.0
+            })
+            stats['requests'] += 1
+            stats['request_ms_total'] += total_seconds * 1000 - connect_ms
+            if connect_seconds > 0:
+                stats['new_connections'] += 1
+                stats['connect_ms_total'] += connect_ms
+                stats['max_connect_ms'] = max(stats['max_connect_ms'], connect_ms)
+        if connect_ms > HTTP_SLOW_CONNECT_MS:
+            log.warning(f"HTTP 建立新連線耗時 {connect_ms:.0f}ms ({endpoint})")
+
+    def snapshot(self):
+        """返回各端點的請求數、新建連線數，以及平均建連/請求耗時（毫秒）"""
+        with self.lock:
+            return {
+                endpoint: {
+                    'requests': stats['requests'],
+                    'new_connections': stats['new_connections'],
+                    'avg_connect_ms': stats['connect_ms_total'] / stats['new_connections'] if stats['new_connections'] else 0.0,
+                    'max_connect_ms': stats['max_connect_ms'],
+                    'avg_request_ms': stats['request_ms_total'] / stats['requests']
+                }
+                for endpoint, stats in self.endpoints.items()
+            }
+
+# ==========================================
+# 🚦 請求預算（客戶端限流）
+# ==========================================
+
+class RequestBudgetExceeded(Exception):
+    """低優先級請求在預算不足且沒有可用快取時被丟棄"""
+
+class TokenBucket:
+    """令牌桶：rate 為每秒補充的令牌數，burst 為容量；rate 會依限流回應動態調整"""
+    def __init__(self, rate, burst):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now, reserve=0.0):
+        """取得一個令牌（並保留 reserve 個）需要等待的秒數，0 表示可立即取得"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        shortfall = 1.0 + reserve - self.tokens
+        return shortfall / self.rate if shortfall > 0 else 0.0
+
+    def take(self):
+        self.tokens -= 1.0
+
+    def decrease(self, min_rate_ratio, retry_after=None):
+        """乘法減少速率；交易所給出 Retry-After 時在此期間暫停發送"""
+        self.rate = max(self.max_rate * min_rate_ratio, self.rate * RATE_LIMIT_DECREASE_FACTOR)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def increase(self):
+        """加法恢復速率，直到設定上限"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_LIMIT_INCREASE_RATIO)
+
+class RequestBudget:
+    """
+    按端點類別的自適應請求預算
+    - 每個請求同時消耗類別桶（order / query）與總桶（total）的令牌
+    - 總桶按優先級保留令牌：撤單/平倉可用全部，下單需留給撤單，查詢需留給所有訂單請求
+    - 收到 429 時乘法降速（AIMD），成功時加法恢復
+    - 低優先級查詢在預算不足時改用短時間內的快取結果，沒有快取才丟棄
+    """
+    ORDER_ENDPOINTS = ("/api/new_order", "/api/cancel_order")
+
+    def __init__(self, budgets=None):
+        budgets = budgets or RATE_LIMIT_BUDGETS
+        self.lock = threading.Lock()
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in budgets.items()}
+        self.cached_results = {}
+        self.stats = {'throttled': 0, 'throttle_wait_seconds': 0.0, 'cache_hits': 0, 'dropped': 0, 'rate_limited': 0}
+
+    @classmethod
+    def endpoint_class(cls, endpoint):
+        return "order" if endpoint in cls.ORDER_ENDPOINTS else "query"
+
+    def acquire_delay(self, endpoint, priority):
+        """
+        嘗試為請求取得令牌：返回 0 表示已取得，否則返回建議等待秒數（此時未消耗令牌）
+        """
+        endpoint_class = self.endpoint_class(endpoint)
+        reserve = RATE_LIMIT_PRIORITY_RESERVE.get(priority, 0)
+        now = time.monotonic()
+        with self.lock:
+            class_bucket = self.buckets.get(endpoint_class)
+            total_bucket = self.buckets.get("total")
+            delay = 0.0
+            if class_bucket:
+                delay = class_bucket.wait_time(now)
+            if total_bucket:
+                delay = max(delay, total_bucket.wait_time(now, reserve))
+            if delay > 0:
+                return delay
+            if class_bucket:
+                class_bucket.take()
+            if total_bucket:
+                total_bucket.take()
+            return 0.0
+
+    def force_acquire(self, endpoint):
+        """訂單請求等待逾時後仍需發送：直接扣除令牌（允許透支），讓後續請求自動延後"""
+        with self.lock:
+            for name in (self.endpoint_class(endpoint), "total"):
+                if name in self.buckets:
+                    self.buckets[name].take()
+
+    @classmethod
+    def default_priority(cls, endpoint):
+        return REQUEST_PRIORITY_NORMAL if cls.endpoint_class(endpoint) == "order" else REQUEST_PRIORITY_LOW
+
+    def next_step(self, endpoint, priority, waited_seconds):
+        """
+        決定請求的下一步，返回 (動作, 等待秒數)：
+        'send' 已取得令牌可發送；'wait' 等待後重試；'skip' 低優先級查詢改用快取或丟棄
+        訂單請求等待超過上限時仍會發送（透支令牌），不因預算丟棄
+        """
+        delay = self.acquire_delay(endpoint, priority)
+        if delay == 0:
+            self._record_wait(waited_seconds)
+            return 'send', 0.0
+        max_wait = RATE_LIMIT_QUERY_MAX_WAIT if priority == REQUEST_PRIORITY_LOW else RATE_LIMIT_ORDER_MAX_WAIT
+        if waited_seconds + delay <= max_wait:
+            return 'wait', delay
+        if priority == REQUEST_PRIORITY_LOW:
+            return 'skip', 0.0
+        self.force_acquire(endpoint)
+        self._record_wait(waited_seconds)
+        return 'send', 0.0
+
+    def _record_wait(self, waited_seconds):
+        if waited_seconds <= 0:
+            return
+        with self.lock:
+            self.stats['throttled'] += 1
+            self.stats['throttle_wait_seconds'] += waited_seconds
+
+    def record_response(self, endpoint, status_code, retry_after=None):
+        """依回應調整速率：429 乘法降速並可依 Retry-After 暫停，其他回應加法恢復"""
+        endpoint_class = self.endpoint_class(endpoint)
+        with self.lock:
+            for name in (endpoint_class, "total"):
+                bucket = self.buckets.get(name)
+                if not bucket:
+                    continue
+                if status_code == 429:
+                    bucket.decrease(RATE_LIMIT_MIN_RATE_RATIO, retry_after)
                 else:
-                    log_entry.append("訂單簿深度: 數據未就緒")
-                
-                log_entry.append("-" * 80)
-                log_entry.append("")
-                
-                # 寫入文件
-                with open(self.log_filename, 'a', encoding='utf-8') as f:
-                    f.write('\n'.join(log_entry) + '\n')
-                
-                # 同時輸出到控制台
-                print(f"📝 風控觸發記錄已寫入: {self.log_filename}")
-                log.info(f"風控觸發記錄已寫入日誌文件: {trigger_type}")
-                
-        except Exception as e:
-            log.error(f"記錄風控觸發日誌失敗: {e}")
-            print(f"⚠️ 記錄風控觸發日誌時發生錯誤: {e}")
+                    bucket.increase()
+            if status_code == 429:
+                self.stats['rate_limited'] += 1
+        if status_code == 429:
+            bucket = self.buckets.get(endpoint_class)
+            rate_text = f"，{endpoint_class} 類請求速率降至 {bucket.rate:.1f}/秒" if bucket else ""
+            log.warning(f"請求被交易所限流 ({endpoint}){rate_text}")
+
+    def cache_result(self, endpoint, result):
+        with self.lock:
+            self.cached_results[endpoint] = (time.monotonic(), result)
+
+    def cached_result(self, endpoint):
+        """返回預算不足時可用的快取結果；沒有足夠新的快取時拋出 RequestBudgetExceeded"""
+        with self.lock:
+            cached = self.cached_results.get(endpoint)
+            if cached and time.monotonic() - cached[0] <= RATE_LIMIT_CACHE_TTL:
+                self.stats['cache_hits'] += 1
+                return cached[1]
+            self.stats['dropped'] += 1
+        raise RequestBudgetExceeded(f"請求預算不足，已略過查詢 {endpoint}")
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['rates'] = {name: round(bucket.rate, 2) for name, bucket in self.buckets.items()}
+            return stats
+
+def parse_retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
 
 # ==========================================
 # 🤖 交易機器人核心
 # ==========================================
 
+# 以下為同步與非同步客戶端共用的請求內容與回應解析
+
+def build_limit_order(order_side, order_price):
+    return {
+        "symbol": TRADING_PAIR,
+        "side": order_side,
+        "order_type": "limit",
+        "qty": ORDER_SIZE,
+        "price": f"{int(order_price)}",
+        "time_in_force": "gtc",
+        "reduce_only": False
+    }
+
+def build_market_close_order(close_side, close_quantity):
+    return {
+        "symbol": TRADING_PAIR,
+        "side": close_side,
+        "order_type": "market",
+        "qty": str(abs(float(close_quantity))),
+        "time_in_force": "ioc",
+        "reduce_only": True
+    }
+
+class OrderPayloadBuilder:
+    """
+    預先序列化的訂單請求內容模板
+    每個 (交易對, 方向, 數量) 只序列化一次，之後只把價格拼接進快取的前後綴字節；
+    返回的字節同時用作簽名訊息的內容與 HTTP 請求體
+    """
+    PLACEHOLDER = "__ORDER_FIELD__"
+
+    def __init__(self):
+        self.templates = {}
+
+    def _build_template(self, cache_key, order_data, variable_field):
+        """以佔位符替換可變欄位（保持欄位順序），序列化後切成前後綴"""
+        encoded = encode_json(dict(order_data, **{variable_field: self.PLACEHOLDER})).encode('utf-8')
+        template = tuple(encoded.split(self.PLACEHOLDER.encode('utf-8')))
+        self.templates[cache_key] = template
+        return template
+
+    def limit_order(self, order_side, price_text):
+        """限價單請求內容，price_text 為已格式化的價格字串"""
+        cache_key = ('limit', TRADING_PAIR, order_side, ORDER_SIZE)
+        template = self.templates.get(cache_key)
+        if template is None:
+            template = self._build_template(cache_key, build_limit_order(order_side, 0), 'price')
+        return template[0] + price_text.encode('ascii') + template[1]
+
+    def market_close_order(self, close_side, quantity_text):
+        """市價平倉單請求內容，quantity_text 為已格式化的數量字串"""
+        cache_key = ('market_close', TRADING_PAIR, close_side)
+        template = self.templates.get(cache_key)
+        if template is None:
+            template = self._build_template(cache_key, build_market_close_order(close_side, 0), 'qty')
+        return template[0] + quantity_text.encode('ascii') + template[1]
+
+def parse_position_result(result):
+    """從持倉查詢回應中取出主交易對持倉，處理多種響應格式，無持倉返回 None"""
+    if isinstance(result, list) and len(result) > 0:
+        return result[0]
+    elif isinstance(result, dict):
+        if 'result' in result and isinstance(result['result'], list):
+            if len(result['result']) > 0:
+                return result['result'][0]
+        elif 'data' in result and isinstance(result['data'], list):
+            if len(result['data']) > 0:
+                return result['data'][0]
+    return None
+
+def parse_balance_result(result):
+    """處理 StandX API 實際返回的餘額格式，返回 {'free', 'total'} 或 None"""
+    if isinstance(result, dict) and 'cross_available' in result and 'equity' in result:
+        return {
+            'free': float(result.get('cross_available', 0)),
+            'total': float(result.get('equity', 0))
+        }
+    log.warning(f"餘額查詢返回異常格式: {result}")
+    return None
+
+def enable_private_stream(market_stream, account_state, auth_token):
+    """在行情連線上認證並註冊私有頻道處理函數"""
+    market_stream.register_channel_handler("auth", TRADING_PAIR, account_state.handle_auth_message)
+    market_stream.register_channel_handler("order", TRADING_PAIR, account_state.handle_order_message)
+    market_stream.register_channel_handler("position", TRADING_PAIR, account_state.handle_position_message)
+    market_stream.add_connection_listener(account_state.handle_connection_change)
+    if market_stream.is_connected:
+        account_state.handle_connection_change(True)
+    market_stream.authenticate(auth_token, PRIVATE_STREAM_CHANNELS)
+
+def collect_request_results(pending, default, action_label):
+    """
+    取出已完成請求的結果，未完成或拋出例外的請求使用預設值
+    pending 為 {future 或 asyncio.Task: 鍵}
+    """
+    results = {}
+    for future, key in pending.items():
+        if not future.done():
+            log.warning(f"{action_label}等待逾時: {key}")
+            results[key] = default
+        elif future.exception():
+            log.error(f"{action_label}執行錯誤: {key} {future.exception()}")
+            results[key] = default
+        else:
+            result = future.result()
+            results[key] = default if result is None else result
+    return results
+
+def report_market_close_start(close_side, quantity_str):
+    print(f"🔥 糟糕了有單，發送市價平倉單: {close_side} {quantity_str}")
+    log.info(f"[診斷] 開始平倉: {close_side} {quantity_str}")
+
+def evaluate_market_close_result(close_result):
+    """檢查市價平倉的 API 回應，返回是否成功送達（同步與非同步客戶端共用）"""
+    print(f"   => 結果: {close_result}")
+    log.info(f"[診斷] 平倉API回應: {close_result}")
+    if 'code' not in close_result:
+        log.warning("[診斷] ⚠️ 平倉回應格式異常，無法確認狀態")
+        return False
+    if close_result['code'] == 0:
+        log.info("[診斷] ✅ 平倉請求成功送達")
+        return True
+    log.error(f"[診斷] ❌ 平倉請求被拒絕: {close_result}")
+    return False
+
+def report_market_close_failure(err):
+    if isinstance(err, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+        log.error("[診斷] ❌ 平倉請求超時")
+        print("   => 平倉請求超時")
+    else:
+        log.error(f"[診斷] ❌ 平倉失敗: {err}")
+        print(f"   => 平倉請求失敗: {err}")
+
 class TradingBot:
-    def __init__(self, auth_token, signing_key_hex):
+    def __init__(self, auth_token, signing_key_hex, market_stream=None):
         self.api_url = API_BASE_URL
         self.auth_token = auth_token
         
         # 處理私鑰格式
         self.signer = SigningKey(signing_key_hex, encoder=HexEncoder)
+        self.request_signer = RequestSigner(self.signer)
+        self.payload_builder = OrderPayloadBuilder()
         
-        # HTTP 會話
+        # HTTP 會話（加大連線池，並可區分建連與請求耗時）
         self.http_session = requests.Session()
         self.http_session.headers.update({
             "Authorization": f"Bearer {self.auth_token}",
             "Content-Type": "application/json"
         })
+        http_adapter = TimedHTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE
+        )
+        self.http_session.mount("https://", http_adapter)
+        self.http_session.mount("http://", http_adapter)
+        self.last_request_at = 0.0
+        self.http_timing = HttpTimingStats()
+        self.keepalive_thread = None
+        self.request_budget = RequestBudget() if RATE_LIMIT_ENABLED else None
+        
+        # 市場數據流（可傳入離線的 MarketDataStream 供回放使用）
+        self.market_stream = market_stream or MarketDataStream()
         
-        # 市場數據流
-        self.market_stream = MarketDataStream()
+        # 訂單 I/O 執行緒池（常駐，避免每次撤單都建立新執行緒）
+        self.order_executor = ThreadPoolExecutor(
+            max_workers=ORDER_IO_WORKERS, thread_name_prefix="order-io"
+        )
+        
+        # 私有推送維護的帳戶狀態，與行情共用同一條 WebSocket 連線
+        self.account_state = AccountState()
+        if PRIVATE_STREAM_ENABLED:
+            enable_private_stream(self.market_stream, self.account_state, self.auth_token)
 
     def _create_signature_headers(self, request_payload):
         """生成請求簽名標頭"""
-        request_uuid = str(uuid.uuid4())
-        current_timestamp = int(time.time() * 1000)
-        protocol_version = "v1"
-        
-        signature_message = f"{protocol_version},{request_uuid},{current_timestamp},{request_payload}"
-        signed_data = self.signer.sign(signature_message.encode('utf-8'))
-        signature_encoded = base64.b64encode(signed_data.signature).decode('utf-8')
+        return self.request_signer.sign_headers(request_payload)
+
+    def _send_request(self, method, api_endpoint, priority=None, budgeted=True, **kwargs):
+        """
+        發送 HTTP 請求並返回解析後的 JSON，同時統計耗時
+        先向請求預算取得令牌（依優先級等待，低優先級查詢在預算不足時改用快取）；
+        快取存放解析後的結果，與 AsyncTradingBot._send_request 相同；
+        budgeted=False 的請求（連線預熱）不消耗令牌也不使用快取，只回報回應狀態供限流調整；
+        建連耗時（新連線的 DNS + TCP + TLS）與總耗時分開記錄，以便觀察冷連線的成本
+        """
+        endpoint = api_endpoint.split('?', 1)[0]
+        budget = self.request_budget
+        if budget and budgeted:
+            if priority is None:
+                priority = budget.default_priority(endpoint)
+            waited_seconds = 0.0
+            while True:
+                action, delay = budget.next_step(endpoint, priority, waited_seconds)
+                if action != 'wait':
+                    break
+                time.sleep(delay)
+                waited_seconds += delay
+            if action == 'skip':
+                return budget.cached_result(endpoint)
         
-        return {
-            "x-request-sign-version": protocol_version,
-            "x-request-id": request_uuid,
-            "x-request-timestamp": str(current_timestamp),
-            "x-request-signature": signature_encoded
-        }
+        http_connect_timing.seconds = 0.0
+        request_started = time.perf_counter()
+        try:
+            response = self.http_session.request(method, self.api_url + api_endpoint, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - request_started
+            self.last_request_at = time.monotonic()
+            self.http_timing.record(endpoint, http_connect_timing.seconds, elapsed)
+        if budget:
+            budget.record_response(endpoint, response.status_code, parse_retry_after(response.headers))
+        result = decode_json(response.content)
+        if budget and budgeted and priority == REQUEST_PRIORITY_LOW and response.status_code == 200:
+            budget.cache_result(endpoint, result)
+        return result
+
+    def get_request_budget_stats(self):
+        """返回請求預算統計：等待次數與秒數、快取命中、丟棄、被限流次數與各類當前速率"""
+        return self.request_budget.snapshot() if self.request_budget else {}
+
+    def get_http_stats(self):
+        """返回各端點的請求數、新建連線數，以及平均建連/請求耗時（毫秒）"""
+        return self.http_timing.snapshot()
+
+    def warm_up_connections(self, connection_count=HTTP_WARMUP_CONNECTIONS):
+        """
+        並行發送輕量查詢，預先建立連線池中的連線（DNS + TCP + TLS）
+        讓第一筆訂單不必承擔建連成本；探測不經請求預算，不會佔用查詢令牌，也不會被快取結果取代
+        """
+        probes = [
+            self.order_executor.submit(
+                self._send_request, "GET", f"/api/query_symbol_price?symbol={TRADING_PAIR}",
+                budgeted=False, timeout=2
+            )
+            for _ in range(connection_count)
+        ]
+        wait(probes, timeout=5)
+        warmed_count = sum(1 for probe in probes if probe.done() and not probe.exception())
+        log.info(f"HTTP 連線預熱完成: {warmed_count}/{connection_count}")
+        return warmed_count
+
+    def start_keepalive_probe(self):
+        """啟動保活線程：連線閒置過久時重新預熱，避免下一筆訂單遇到已被關閉的連線"""
+        if self.keepalive_thread:
+            return
+        self.keepalive_thread = threading.Thread(target=self._run_keepalive_probe, daemon=True)
+        self.keepalive_thread.start()
+
+    def _run_keepalive_probe(self):
+        while not is_shutting_down:
+            time.sleep(HTTP_KEEPALIVE_INTERVAL / 4)
+            if time.monotonic() - self.last_request_at < HTTP_KEEPALIVE_INTERVAL:
+                continue
+            try:
+                self.warm_up_connections()
+            except Exception as err:
+                log.error(f"HTTP 保活探測失敗: {err}")
 
     def fetch_backup_price(self):
         """備用價格獲取（HTTP API）"""
         try:
-            response = self.http_session.get(
-                f"{self.api_url}/api/query_symbol_price?symbol={TRADING_PAIR}",
+            result = self._send_request(
+                "GET", f"/api/query_symbol_price?symbol={TRADING_PAIR}",
                 timeout=2
             )
-            result = response.json()
             if 'last_price' in result:
                 return float(result['last_price'])
+        except RequestBudgetExceeded as err:
+            log.info(err)
         except requests.exceptions.Timeout:
             log.warning("HTTP 價格查詢超時")
         except Exception as err:
             log.error(f"價格查詢失敗: {err}")
         return None
 
-    def query_active_orders(self):
-        """查詢當前活躍訂單"""
+    def query_active_orders(self, force_refresh=False):
+        """
+        查詢當前活躍訂單
+        優先返回本地訂單簿；需要對帳、狀態不確定或 force_refresh 時走 REST
+        """
+        state = self.account_state
+        if not force_refresh and state.orders_trusted():
+            return state.get_open_orders()
+        
+        # 強制刷新通常用於確認狀態，不應因預算不足而改用快取
+        orders = self._fetch_active_orders_rest(REQUEST_PRIORITY_NORMAL if force_refresh else REQUEST_PRIORITY_LOW)
+        if orders is not None:
+            state.sync_orders(orders)
+            return orders
+        # 查詢失敗或被請求預算略過時，沿用本地訂單簿
+        return state.get_open_orders()
+
+    def _fetch_active_orders_rest(self, priority=REQUEST_PRIORITY_LOW):
+        """以 REST 查詢活躍訂單，失敗時返回 None"""
         try:
-            response = self.http_session.get(
-                f"{self.api_url}/api/query_open_orders?symbol={TRADING_PAIR}",
+            result = self._send_request(
+                "GET", f"/api/query_open_orders?symbol={TRADING_PAIR}",
+                priority=priority,
                 timeout=2
             )
-            result = response.json()
             if 'result' in result:
                 return result['result']
+        except RequestBudgetExceeded as err:
+            log.info(f"{err}，沿用本地訂單簿")
         except requests.exceptions.Timeout:
             log.warning("訂單查詢超時")
         except Exception as err:
             log.error(f"訂單查詢失敗: {err}")
-        return []
+        return None
+
+    def query_current_position(self, force_refresh=False):
+        """
+        查詢當前持倉
+        私有推送可用時直接返回本地視圖；需要對帳或 force_refresh 時走 REST
+        """
+        state = self.account_state
+        if not force_refresh and state.position_trusted():
+            return state.get_position()
+        
+        result = self._fetch_current_position_rest(REQUEST_PRIORITY_NORMAL if force_refresh else REQUEST_PRIORITY_LOW)
+        if result is not False:
+            state.sync_position(result)
+            return result
+        return state.get_position()
 
-    def query_current_position(self):
-        """查詢當前持倉"""
+    def _fetch_current_position_rest(self, priority=REQUEST_PRIORITY_LOW):
+        """以 REST 查詢持倉，無持倉返回 None，請求失敗返回 False"""
         try:
             query_timestamp = int(time.time() * 1000)
-            response = self.http_session.get(
-                f"{self.api_url}/api/query_positions?symbol={TRADING_PAIR}&t={query_timestamp}",
+            result = self._send_request(
+                "GET", f"/api/query_positions?symbol={TRADING_PAIR}&t={query_timestamp}",
+                priority=priority,
                 timeout=2
             )
-            result = response.json()
-            
-            # 處理多種響應格式
-            if isinstance(result, list) and len(result) > 0:
-                return result[0]
-            elif isinstance(result, dict):
-                if 'result' in result and isinstance(result['result'], list):
-                    if len(result['result']) > 0:
-                        return result['result'][0]
-                elif 'data' in result and isinstance(result['data'], list):
-                    if len(result['data']) > 0:
-                        return result['data'][0]
+            return parse_position_result(result)
+        except RequestBudgetExceeded as err:
+            log.info(f"{err}，沿用本地持倉")
         except requests.exceptions.Timeout:
             log.warning("持倉查詢超時")
         except Exception as err:
             log.error(f"持倉查詢失敗: {err}")
-        return None
+        return False
 
     def query_account_balance(self):
         """
@@ -706,22 +2854,13 @@ class TradingBot:
         """
         try:
             query_timestamp = int(time.time() * 1000)
-            response = self.http_session.get(
-                f"{self.api_url}/api/query_balance?t={query_timestamp}",
+            # 餘額檢查決定是否開始交易，不能被預算略過或改用快取
+            result = self._send_request(
+                "GET", f"/api/query_balance?t={query_timestamp}",
+                priority=REQUEST_PRIORITY_NORMAL,
                 timeout=2
             )
-            result = response.json()
-            
-            # 處理 StandX API 實際返回的格式
-            if isinstance(result, dict) and 'cross_available' in result and 'equity' in result:
-                return {
-                    'free': float(result.get('cross_available', 0)),
-                    'total': float(result.get('equity', 0))
-                }
-                
-            log.warning(f"餘額查詢返回異常格式: {result}")
-            return None
-            
+            return parse_balance_result(result)
         except requests.exceptions.Timeout:
             log.warning("餘額查詢超時")
         except Exception as err:
@@ -731,100 +2870,535 @@ class TradingBot:
     def submit_limit_order(self, order_side, order_price):
         """提交限價單"""
         api_endpoint = "/api/new_order"
-        order_data = {
-            "symbol": TRADING_PAIR,
-            "side": order_side,
-            "order_type": "limit",
-            "qty": ORDER_SIZE,
-            "price": f"{int(order_price)}",
-            "time_in_force": "gtc",
-            "reduce_only": False
-        }
-        payload_string = json.dumps(order_data)
+        price_text = f"{int(order_price)}"
+        # 同一份字節同時用於簽名與請求體
+        payload_bytes = self.payload_builder.limit_order(order_side, price_text)
         
         try:
-            response = self.http_session.post(
-                self.api_url + api_endpoint,
-                data=payload_string,
-                headers=self._create_signature_headers(payload_string),
+            order_result = self._send_request(
+                "POST", api_endpoint,
+                data=payload_bytes,
+                headers=self._create_signature_headers(payload_bytes),
                 timeout=1
             )
-            order_result = response.json()
-            if 'code' not in order_result or order_result['code'] != 0:
+            if order_result.get('code') == 429:
+                log.warning(f"下單被交易所限流: {order_side} @ {order_price}")
+            elif 'code' not in order_result or order_result['code'] != 0:
                 log.warning(f"訂單回應異常: {order_result}")
+            if order_result.get('code', 0) == 0:
+                self.account_state.register_submitted_order(
+                    order_result, order_side, price_text, ORDER_SIZE
+                )
             return order_result
         except requests.exceptions.Timeout:
             log.warning(f"下單超時: {order_side} @ {order_price}")
         except Exception as err:
             log.error(f"下單失敗: {err}")
+        # 請求結果不明，訂單可能已在交易所成立
+        self.account_state.register_submitted_order(None, order_side, price_text, ORDER_SIZE)
         return {}
 
     def cancel_single_order(self, order_identifier):
-        """取消單個訂單"""
+        """取消單個訂單，返回交易所是否確認撤單"""
         api_endpoint = "/api/cancel_order"
         cancel_data = {"order_id": order_identifier}
-        payload_string = json.dumps(cancel_data)
+        payload_string = encode_json(cancel_data)
         
+        cancel_confirmed = False
         try:
-            self.http_session.post(
-                self.api_url + api_endpoint,
+            cancel_result = self._send_request(
+                "POST", api_endpoint,
+                priority=REQUEST_PRIORITY_CRITICAL,
                 data=payload_string,
                 headers=self._create_signature_headers(payload_string),
                 timeout=1
             )
+            cancel_confirmed = isinstance(cancel_result, dict) and cancel_result.get('code') == 0
         except requests.exceptions.Timeout:
             log.warning(f"撤單超時: {order_identifier}")
         except Exception as err:
             log.error(f"撤單失敗: {err}")
+        self.account_state.register_canceled_order(order_identifier, cancel_confirmed)
+        return cancel_confirmed
+
+    def cancel_orders(self, order_identifiers, timeout=ORDER_CANCEL_TIMEOUT):
+        """
+        透過執行緒池並行撤銷多個訂單
+        返回 {訂單ID: 是否確認撤單}，逾時未完成的訂單記為 False
+        """
+        pending = {
+            self.order_executor.submit(self.cancel_single_order, order_id): order_id
+            for order_id in order_identifiers
+        }
+        if not pending:
+            return {}
+        wait(pending, timeout=timeout)
+        return collect_request_results(pending, False, "撤單")
+
+    def refresh_quotes(self, cancel_identifiers, quote_requests, timeout=ORDER_REFRESH_TIMEOUT):
+        """
+        一次刷新報價：撤單與補單同時送出，改價時新單不必等待舊單撤銷完成
+        quote_requests 為 [(方向, 價格)]
+        返回 (撤單結果 {訂單ID: 是否確認}, 下單結果 {(方向, 價格): 回應})
+        """
+        cancel_pending = {
+            self.order_executor.submit(self.cancel_single_order, order_id): order_id
+            for order_id in cancel_identifiers
+        }
+        submit_pending = {
+            self.order_executor.submit(self.submit_limit_order, order_side, order_price): (order_side, order_price)
+            for order_side, order_price in quote_requests
+        }
+        if cancel_pending or submit_pending:
+            wait(list(cancel_pending) + list(submit_pending), timeout=timeout)
+        return (
+            collect_request_results(cancel_pending, False, "撤單"),
+            collect_request_results(submit_pending, {}, "下單")
+        )
 
     def execute_market_close(self, close_side, close_quantity):
         """執行市價平倉"""
         api_endpoint = "/api/new_order"
         quantity_str = str(abs(float(close_quantity)))
-        close_order = {
-            "symbol": TRADING_PAIR,
-            "side": close_side,
-            "order_type": "market",
-            "qty": quantity_str,
-            "time_in_force": "ioc",
-            "reduce_only": True
-        }
-        payload_string = json.dumps(close_order)
+        payload_bytes = self.payload_builder.market_close_order(close_side, quantity_str)
         
         try:
-            print(f"🔥 糟糕了有單，發送市價平倉單: {close_side} {quantity_str}")
-            log.info(f"[診斷] 開始平倉: {close_side} {quantity_str}")
-            response = self.http_session.post(
-                self.api_url + api_endpoint,
-                data=payload_string,
-                headers=self._create_signature_headers(payload_string),
+            report_market_close_start(close_side, quantity_str)
+            close_result = self._send_request(
+                "POST", api_endpoint,
+                priority=REQUEST_PRIORITY_CRITICAL,
+                data=payload_bytes,
+                headers=self._create_signature_headers(payload_bytes),
                 timeout=2
             )
-            close_result = response.json()
-            print(f"   => 結果: {close_result}")
-            log.info(f"[診斷] 平倉API回應: {close_result}")
-            
-            # [新增] 檢查API回應狀態
-            if 'code' in close_result:
-                if close_result['code'] == 0:
-                    log.info(f"[診斷] ✅ 平倉請求成功送達")
-                    return True
-                else:
-                    log.error(f"[診斷] ❌ 平倉請求被拒絕: {close_result}")
-                    return False
-            else:
-                log.warning(f"[診斷] ⚠️ 平倉回應格式異常，無法確認狀態")
-                return False
-                
-        except requests.exceptions.Timeout:
-            log.error("[診斷] ❌ 平倉請求超時")
-            print("   => 平倉請求超時")
+            return evaluate_market_close_result(close_result)
+        except Exception as err:
+            report_market_close_failure(err)
             return False
+
+# ==========================================
+# ⚡ 非同步交易客戶端
+# ==========================================
+
+class AsyncTradingBot:
+    """
+    以 asyncio + aiohttp 實作的交易客戶端，操作與 TradingBot 相同（方法皆為協程）
+    下單、撤單與行情/私有推送都在同一個事件循環上並行，不需為每個請求建立線程
+    行情由 run_market_stream 以 aiohttp WebSocket 驅動 MarketDataStream(connect=False)，
+    頻道停更檢測由 run_stream_health_monitor 在同一個事件循環中執行
+    """
+    def __init__(self, auth_token, signing_key_hex, market_stream=None):
+        if aiohttp is None:
+            raise RuntimeError("AsyncTradingBot 需要安裝 aiohttp (pip install aiohttp)")
+        self.api_url = API_BASE_URL
+        self.auth_token = auth_token
+        self.signer = SigningKey(signing_key_hex, encoder=HexEncoder)
+        self.request_signer = RequestSigner(self.signer)
+        self.payload_builder = OrderPayloadBuilder()
+        
+        # aiohttp 會話需在事件循環內建立，見 start()
+        self.http_session = None
+        self.last_request_at = 0.0
+        self.http_timing = HttpTimingStats()
+        self.request_budget = RequestBudget() if RATE_LIMIT_ENABLED else None
+        self.background_tasks = []
+        
+        # 行情不自行建立連線，由 run_market_stream 在事件循環中餵入訊息
+        self.market_stream = market_stream or MarketDataStream(connect=False)
+        
+        self.account_state = AccountState()
+        if PRIVATE_STREAM_ENABLED:
+            enable_private_stream(self.market_stream, self.account_state, self.auth_token)
+
+    async def start(self):
+        """建立 HTTP 會話並在事件循環中啟動行情消費任務"""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=HTTP_POOL_MAXSIZE, keepalive_timeout=HTTP_KEEPALIVE_INTERVAL * 2
+            ),
+            headers={
+                "Authorization": f"Bearer {self.auth_token}",
+                "Content-Type": "application/json"
+            },
+            trace_configs=[trace_config]
+        )
+        self.background_tasks.append(asyncio.ensure_future(self.run_market_stream()))
+        self.background_tasks.append(asyncio.ensure_future(self.run_stream_health_monitor()))
+
+    async def close(self):
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks = []
+        if self.http_session:
+            await self.http_session.close()
+
+    # ---------- HTTP ----------
+
+    @staticmethod
+    async def _on_connection_create_start(session, trace_context, params):
+        trace_context.connect_started = time.perf_counter()
+
+    @staticmethod
+    async def _on_connection_create_end(session, trace_context, params):
+        # WebSocket 連線等未帶計時上下文的請求不統計
+        if trace_context.trace_request_ctx is not None:
+            trace_context.trace_request_ctx['connect_seconds'] += time.perf_counter() - trace_context.connect_started
+
+    async def _send_request(self, method, api_endpoint, timeout, priority=None, budgeted=True, **kwargs):
+        """
+        發送 HTTP 請求並返回解析後的 JSON，建連耗時與請求耗時分開統計
+        請求預算的處理（含 budgeted）與 TradingBot._send_request 相同，等待令牌時不阻塞事件循環
+        """
+        endpoint = api_endpoint.split('?', 1)[0]
+        budget = self.request_budget
+        if budget and budgeted:
+            if priority is None:
+                priority = budget.default_priority(endpoint)
+            waited_seconds = 0.0
+            while True:
+                action, delay = budget.next_step(endpoint, priority, waited_seconds)
+                if action != 'wait':
+                    break
+                await asyncio.sleep(delay)
+                waited_seconds += delay
+            if action == 'skip':
+                return budget.cached_result(endpoint)
+        
+        request_context = {'connect_seconds': 0.0}
+        request_started = time.perf_counter()
+        try:
+            async with self.http_session.request(
+                method, self.api_url + api_endpoint,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                trace_request_ctx=request_context,
+                **kwargs
+            ) as response:
+                result = decode_json(await response.read())
+                status_code = response.status
+                retry_after = parse_retry_after(response.headers)
+        finally:
+            elapsed = time.perf_counter() - request_started
+            self.last_request_at = time.monotonic()
+            self.http_timing.record(endpoint, request_context['connect_seconds'], elapsed)
+        if budget:
+            budget.record_response(endpoint, status_code, retry_after)
+            if budgeted and priority == REQUEST_PRIORITY_LOW and status_code == 200:
+                budget.cache_result(endpoint, result)
+        return result
+
+    async def _send_signed_request(self, api_endpoint, payload, timeout, priority=None):
+        """payload 為已序列化的請求內容，同時用於簽名與請求體"""
+        return await self._send_request(
+            "POST", api_endpoint, timeout,
+            priority=priority,
+            data=payload,
+            headers=self.request_signer.sign_headers(payload)
+        )
+
+    def get_request_budget_stats(self):
+        """返回請求預算統計，格式與 TradingBot.get_request_budget_stats 相同"""
+        return self.request_budget.snapshot() if self.request_budget else {}
+
+    def get_http_stats(self):
+        """返回各端點的請求數、新建連線數，以及平均建連/請求耗時（毫秒）"""
+        return self.http_timing.snapshot()
+
+    async def warm_up_connections(self, connection_count=HTTP_WARMUP_CONNECTIONS):
+        """並行發送輕量查詢，預先建立連線池中的連線；探測不經請求預算"""
+        probes = await asyncio.gather(*[
+            self._send_request("GET", f"/api/query_symbol_price?symbol={TRADING_PAIR}", 2, budgeted=False)
+            for _ in range(connection_count)
+        ], return_exceptions=True)
+        warmed_count = sum(1 for probe in probes if not isinstance(probe, BaseException))
+        log.info(f"HTTP 連線預熱完成: {warmed_count}/{connection_count}")
+        return warmed_count
+
+    async def start_keepalive_probe(self):
+        """啟動保活任務：連線閒置過久時重新預熱"""
+        self.background_tasks.append(asyncio.ensure_future(self._run_keepalive_probe()))
+
+    async def _run_keepalive_probe(self):
+        while not is_shutting_down:
+            await asyncio.sleep(HTTP_KEEPALIVE_INTERVAL / 4)
+            if time.monotonic() - self.last_request_at < HTTP_KEEPALIVE_INTERVAL:
+                continue
+            try:
+                await self.warm_up_connections()
+            except Exception as err:
+                log.error(f"HTTP 保活探測失敗: {err}")
+
+    # ---------- 行情 ----------
+
+    async def run_market_stream(self):
+        """
+        以 aiohttp WebSocket 驅動 MarketDataStream：訊息解析、分派與快照發布沿用同步版本的處理函數
+        斷線後按 MarketDataStream 的退避策略重連
+        """
+        stream = self.market_stream
+        while not is_shutting_down:
+            try:
+                async with self.http_session.ws_connect(
+                    stream.stream_url,
+                    heartbeat=WS_PING_INTERVAL,
+                    receive_timeout=WS_STREAM_STALE_TIMEOUT
+                ) as stream_ws:
+                    # 之後的訂閱、認證、重新訂閱與強制重連都經由 stream.stream_ws 送到這條連線
+                    stream_socket = AsyncStreamSocket(stream_ws, asyncio.get_running_loop())
+                    stream.stream_ws = stream_socket
+                    sender_task = asyncio.ensure_future(stream_socket.run_sender())
+                    try:
+                        stream._handle_stream_open(stream_socket)
+                        async for ws_message in stream_ws:
+                            if ws_message.type == aiohttp.WSMsgType.TEXT:
+                                stream._handle_stream_message(None, ws_message.data)
+                            elif ws_message.type == aiohttp.WSMsgType.ERROR:
+                                stream._handle_stream_error(None, stream_ws.exception())
+                                break
+                    finally:
+                        sender_task.cancel()
+                    stream._handle_stream_close(None, stream_ws.close_code, None)
+            except asyncio.CancelledError:
+                stream._handle_stream_disconnect()
+                raise
+            except asyncio.TimeoutError:
+                log.warning(f"市場數據超過 {WS_STREAM_STALE_TIMEOUT} 秒無訊息，重新連線")
+            except Exception as err:
+                log.error(f"市場數據流執行錯誤: {err}")
+            
+            stream._handle_stream_disconnect()
+            await asyncio.sleep(stream._next_reconnect_delay())
+
+    async def run_stream_health_monitor(self):
+        """與同步版本的健康監控線程相同：單一頻道停更時重新訂閱，全部停更時強制重連"""
+        while True:
+            await asyncio.sleep(1)
+            self.market_stream._check_health()
+
+    async def fetch_backup_price(self):
+        """備用價格獲取（HTTP API）"""
+        try:
+            result = await self._send_request("GET", f"/api/query_symbol_price?symbol={TRADING_PAIR}", 2)
+            if 'last_price' in result:
+                return float(result['last_price'])
+        except RequestBudgetExceeded as err:
+            log.info(err)
+        except asyncio.TimeoutError:
+            log.warning("HTTP 價格查詢超時")
+        except Exception as err:
+            log.error(f"價格查詢失敗: {err}")
+        return None
+
+    # ---------- 帳戶查詢 ----------
+
+    async def query_active_orders(self, force_refresh=False):
+        """查詢當前活躍訂單，優先返回本地訂單簿"""
+        state = self.account_state
+        if not force_refresh and state.orders_trusted():
+            return state.get_open_orders()
+        try:
+            result = await self._send_request(
+                "GET", f"/api/query_open_orders?symbol={TRADING_PAIR}", 2,
+                priority=REQUEST_PRIORITY_NORMAL if force_refresh else REQUEST_PRIORITY_LOW
+            )
+            if 'result' in result:
+                state.sync_orders(result['result'])
+                return result['result']
+        except RequestBudgetExceeded as err:
+            log.info(f"{err}，沿用本地訂單簿")
+        except asyncio.TimeoutError:
+            log.warning("訂單查詢超時")
+        except Exception as err:
+            log.error(f"訂單查詢失敗: {err}")
+        return state.get_open_orders()
+
+    async def query_current_position(self, force_refresh=False):
+        """查詢當前持倉，私有推送可用時返回本地視圖"""
+        state = self.account_state
+        if not force_refresh and state.position_trusted():
+            return state.get_position()
+        try:
+            query_timestamp = int(time.time() * 1000)
+            result = await self._send_request(
+                "GET", f"/api/query_positions?symbol={TRADING_PAIR}&t={query_timestamp}", 2,
+                priority=REQUEST_PRIORITY_NORMAL if force_refresh else REQUEST_PRIORITY_LOW
+            )
+            position = parse_position_result(result)
+            state.sync_position(position)
+            return position
+        except RequestBudgetExceeded as err:
+            log.info(f"{err}，沿用本地持倉")
+        except asyncio.TimeoutError:
+            log.warning("持倉查詢超時")
+        except Exception as err:
+            log.error(f"持倉查詢失敗: {err}")
+        return state.get_position()
+
+    async def query_account_balance(self):
+        """查詢帳戶餘額，返回 {'free': float, 'total': float} 或 None"""
+        try:
+            query_timestamp = int(time.time() * 1000)
+            return parse_balance_result(await self._send_request(
+                "GET", f"/api/query_balance?t={query_timestamp}", 2, priority=REQUEST_PRIORITY_NORMAL
+            ))
+        except asyncio.TimeoutError:
+            log.warning("餘額查詢超時")
+        except Exception as err:
+            log.error(f"餘額查詢失敗: {err}")
+        return None
+
+    # ---------- 訂單 ----------
+
+    async def submit_limit_order(self, order_side, order_price):
+        """提交限價單"""
+        price_text = f"{int(order_price)}"
+        payload_bytes = self.payload_builder.limit_order(order_side, price_text)
+        try:
+            order_result = await self._send_signed_request("/api/new_order", payload_bytes, 1)
+            if order_result.get('code') == 429:
+                log.warning(f"下單被交易所限流: {order_side} @ {order_price}")
+            elif 'code' not in order_result or order_result['code'] != 0:
+                log.warning(f"訂單回應異常: {order_result}")
+            if order_result.get('code', 0) == 0:
+                self.account_state.register_submitted_order(
+                    order_result, order_side, price_text, ORDER_SIZE
+                )
+            return order_result
+        except asyncio.TimeoutError:
+            log.warning(f"下單超時: {order_side} @ {order_price}")
+        except Exception as err:
+            log.error(f"下單失敗: {err}")
+        self.account_state.register_submitted_order(None, order_side, price_text, ORDER_SIZE)
+        return {}
+
+    async def cancel_single_order(self, order_identifier):
+        """取消單個訂單，返回交易所是否確認撤單"""
+        cancel_confirmed = False
+        try:
+            cancel_result = await self._send_signed_request(
+                "/api/cancel_order", encode_json({"order_id": order_identifier}), 1,
+                priority=REQUEST_PRIORITY_CRITICAL
+            )
+            cancel_confirmed = isinstance(cancel_result, dict) and cancel_result.get('code') == 0
+        except asyncio.TimeoutError:
+            log.warning(f"撤單超時: {order_identifier}")
+        except Exception as err:
+            log.error(f"撤單失敗: {err}")
+        self.account_state.register_canceled_order(order_identifier, cancel_confirmed)
+        return cancel_confirmed
+
+    async def cancel_orders(self, order_identifiers, timeout=ORDER_CANCEL_TIMEOUT):
+        """並行撤銷多個訂單，返回 {訂單ID: 是否確認撤單}"""
+        cancel_results, _ = await self.refresh_quotes(order_identifiers, [], timeout)
+        return cancel_results
+
+    async def refresh_quotes(self, cancel_identifiers, quote_requests, timeout=ORDER_REFRESH_TIMEOUT):
+        """撤單與補單同時送出並一起等待，返回值與 TradingBot.refresh_quotes 相同"""
+        cancel_pending = {
+            asyncio.ensure_future(self.cancel_single_order(order_id)): order_id
+            for order_id in cancel_identifiers
+        }
+        submit_pending = {
+            asyncio.ensure_future(self.submit_limit_order(order_side, order_price)): (order_side, order_price)
+            for order_side, order_price in quote_requests
+        }
+        if cancel_pending or submit_pending:
+            await asyncio.wait(list(cancel_pending) + list(submit_pending), timeout=timeout)
+        return (
+            collect_request_results(cancel_pending, False, "撤單"),
+            collect_request_results(submit_pending, {}, "下單")
+        )
+
+    async def execute_market_close(self, close_side, close_quantity):
+        """執行市價平倉"""
+        quantity_str = str(abs(float(close_quantity)))
+        payload_bytes = self.payload_builder.market_close_order(close_side, quantity_str)
+        try:
+            report_market_close_start(close_side, quantity_str)
+            close_result = await self._send_signed_request(
+                "/api/new_order", payload_bytes, 2, priority=REQUEST_PRIORITY_CRITICAL
+            )
+            return evaluate_market_close_result(close_result)
         except Exception as err:
-            log.error(f"[診斷] ❌ 平倉失敗: {err}")
-            print(f"   => 平倉請求失敗: {err}")
+            report_market_close_failure(err)
             return False
 
+class AsyncStreamSocket:
+    """
+    aiohttp WebSocket 的包裝，提供與 WebSocketApp 相同的 send / close / sock.connected 介面，
+    讓 MarketDataStream 的訂閱、認證與健康監控不需區分同步或非同步連線
+    訊息放入佇列由 run_sender 依序送出，可從任何線程調用
+    """
+    def __init__(self, stream_ws, event_loop):
+        self.stream_ws = stream_ws
+        self.event_loop = event_loop
+        self.outgoing = asyncio.Queue()
+        self.sock = self
+
+    @property
+    def connected(self):
+        return not self.stream_ws.closed
+
+    def _call_in_loop(self, callback, *args):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.event_loop:
+            callback(*args)
+        else:
+            self.event_loop.call_soon_threadsafe(callback, *args)
+
+    def send(self, message):
+        self._call_in_loop(self.outgoing.put_nowait, message)
+
+    def close(self):
+        self._call_in_loop(lambda: asyncio.ensure_future(self.stream_ws.close()))
+
+    async def run_sender(self):
+        """按放入順序發送訊息，連線關閉時結束"""
+        while True:
+            message = await self.outgoing.get()
+            try:
+                await self.stream_ws.send_str(message)
+            except Exception as err:
+                log.warning(f"市場數據訊息發送失敗: {err}")
+                return
+
+class SyncTradingBotBridge:
+    """
+    讓同步策略使用 AsyncTradingBot：在背景線程執行事件循環，
+    協程方法以同步方式調用並等待結果，其餘屬性（market_stream、account_state 等）直接轉發
+    """
+    def __init__(self, async_bot):
+        self.async_bot = async_bot
+        self.event_loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.event_loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.run_coroutine(async_bot.start())
+
+    def run_coroutine(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.event_loop).result(ASYNC_BRIDGE_TIMEOUT)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.async_bot, name)
+        if asyncio.iscoroutinefunction(attribute):
+            return lambda *args, **kwargs: self.run_coroutine(attribute(*args, **kwargs))
+        return attribute
+
+    def close(self):
+        self.run_coroutine(self.async_bot.close())
+        self.event_loop.call_soon_threadsafe(self.event_loop.stop)
+
+def create_trading_client(auth_token, signing_key_hex):
+    """依 ASYNC_CLIENT_ENABLED 建立同步 TradingBot 或包裝後的 AsyncTradingBot"""
+    if ASYNC_CLIENT_ENABLED:
+        return SyncTradingBotBridge(AsyncTradingBot(auth_token, signing_key_hex))
+    return TradingBot(auth_token, signing_key_hex)
+
 # ==========================================
 # 🛡️ 系統退出管理
 # ==========================================
@@ -837,7 +3411,7 @@ def perform_emergency_shutdown(bot_instance):
         log.warning("開始緊急關閉流程")
         
         # 檢查持倉狀態
-        current_position = bot_instance.query_current_position()
+        current_position = bot_instance.query_current_position(force_refresh=True)
         position_exists = False
         position_quantity = 0.0
         
@@ -847,24 +3421,18 @@ def perform_emergency_shutdown(bot_instance):
                 position_exists = True
         
         # 批量撤單
-        active_orders = bot_instance.query_active_orders()
+        active_orders = bot_instance.query_active_orders(force_refresh=True)
         if active_orders:
             print(f"📋 撤銷 {len(active_orders)} 個掛單...")
             log.info(f"開始撤銷 {len(active_orders)} 個訂單")
             
-            cancel_workers = []
-            for order_item in active_orders:
-                worker = threading.Thread(
-                    target=bot_instance.cancel_single_order,
-                    args=(order_item['id'],)
-                )
-                worker.start()
-                cancel_workers.append(worker)
-            
-            for worker in cancel_workers:
-                worker.join(timeout=2)
-            
-            print("✅ 所有訂單已撤銷")
+            cancel_results = bot_instance.cancel_orders([order_item['id'] for order_item in active_orders])
+            failed_count = list(cancel_results.values()).count(False)
+            if failed_count:
+                print(f"⚠️ {failed_count} 個訂單撤銷未確認，請手動檢查")
+                log.warning(f"{failed_count} 個訂單撤銷未確認")
+            else:
+                print("✅ 所有訂單已撤銷")
             time.sleep(1)
         
         # 處理持倉
@@ -877,7 +3445,7 @@ def perform_emergency_shutdown(bot_instance):
             time.sleep(1)
             
             # 驗證平倉結果
-            verification_position = bot_instance.query_current_position()
+            verification_position = bot_instance.query_current_position(force_refresh=True)
             if verification_position and float(verification_position.get('qty', 0)) != 0:
                 print("⚠️ 平倉可能未完成，請手動確認")
                 log.error("平倉驗證失敗")
@@ -904,6 +3472,22 @@ def handle_shutdown_signal(signal_number, stack_frame):
     
     if trading_bot:
         perform_emergency_shutdown(trading_bot)
+        for endpoint, stats in trading_bot.get_http_stats().items():
+            log.info(
+                f"HTTP {endpoint}: {stats['requests']} 次請求, {stats['new_connections']} 次新建連線 "
+                f"(平均建連 {stats['avg_connect_ms']:.1f}ms, 平均請求 {stats['avg_request_ms']:.1f}ms)"
+            )
+        budget_stats = trading_bot.get_request_budget_stats()
+        if budget_stats:
+            log.info(f"請求預算統計: {budget_stats}")
+    if risk_engine:
+        for rule_name, stats in risk_engine.snapshot().items():
+            log.info(
+                f"風控規則 {rule_name}: 評估 {stats['evaluations']} 次, 觸發 {stats['trips']} 次, "
+                f"平均 {stats['avg_us']:.1f}µs, 累計 {stats['total_ms']:.1f}ms"
+            )
+    if trading_bot and trading_bot.market_stream.recorder:
+        trading_bot.market_stream.recorder.close()
     
     print("👋 程式已安全退出")
     sys.exit(0)
@@ -947,10 +3531,210 @@ def check_balance_and_shutdown(bot_instance):
         log.error(f"餘額檢查失敗: {err}")
         return False
 
+# ==========================================
+# 🚨 風控規則引擎
+# ==========================================
+
+class RiskContext:
+    """
+    單輪風控檢查的惰性上下文
+    每個指標在第一次被讀取時才計算並快取：便宜的規則先觸發時，
+    昂貴的指標（例如 OBI 的訂單簿掃描、逐筆統計）不會被計算
+    """
+    def __init__(self, market_stream, snapshot, reference_price, volatility_tracker, tick_statistics=None):
+        self.market_stream = market_stream
+        self.snapshot = snapshot
+        self.reference_price = reference_price
+        self.volatility_tracker = volatility_tracker
+        self.tick_statistics = tick_statistics
+
+    @cached_property
+    def spread_bps(self):
+        snapshot = self.snapshot
+        if snapshot.price_ready and snapshot.ask > snapshot.bid:
+            return (snapshot.ask - snapshot.bid) / self.reference_price * 10000
+        return 0.0
+
+    @cached_property
+    def ewma_volatility(self):
+        return self.tick_statistics.ewma_volatility() if self.tick_statistics else None
+
+    @cached_property
+    def window_statistics(self):
+        if not self.tick_statistics:
+            return {}
+        return self.tick_statistics.window_stats(self.volatility_tracker.windows)
+
+    def computed_window_statistics(self):
+        """返回本輪已計算的逐筆統計；尚未計算時返回空字典，不會為此觸發計算（供儀表板顯示）"""
+        if 'window_statistics' not in self.__dict__:
+            return {}
+        return self.window_statistics
+
+    def window_volatility(self, window, limit):
+        """
+        窗口漲跌幅；超過 limit 時才以逐筆統計的穩健基準確認，單筆異常的起點報價不會單獨觸發風控
+        穩健值只會取較小者，未超過 limit 時結果不受影響，因此平穩行情下不需計算逐筆統計
+        """
+        volatility = self.volatility_tracker.window_return(window)
+        if volatility > limit:
+            window_stats = self.window_statistics.get(window)
+            if window_stats:
+                volatility = min(volatility, window_stats.robust_return)
+        return volatility
+
+    @cached_property
+    def short_term_volatility(self):
+        return self.window_volatility(VOLATILITY_SHORT_TERM_WINDOW, VOLATILITY_SHORT_TERM_PCT)
+
+    @cached_property
+    def mid_term_volatility(self):
+        return self.window_volatility(VOLATILITY_MID_TERM_WINDOW, VOLATILITY_MID_TERM_PCT)
+
+    @cached_property
+    def long_term_volatility(self):
+        return self.window_volatility(VOLATILITY_LONG_TERM_WINDOW, VOLATILITY_LONG_TERM_PCT)
+
+    @cached_property
+    def orderbook_imbalance(self):
+        return self.market_stream.compute_orderbook_imbalance(self.reference_price, snapshot=self.snapshot)
+
+    @cached_property
+    def imbalance_magnitude(self):
+        return abs(self.orderbook_imbalance) if self.orderbook_imbalance is not None else 0.0
+
+class RiskRule:
+    """
+    單條風控規則
+    check(context) 返回觸發原因字串，未觸發返回 None
+    cost: 相對評估成本，引擎按成本由低到高依序評估
+    record_details: 觸發時是否將詳細訂單簿寫入成交記錄
+    """
+    def __init__(self, name, check, cost, pause_duration=None, trigger_type=None,
+                 record_details=False, log_level=logging.WARNING):
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.pause_duration = pause_duration if pause_duration is not None else MARKET_PAUSE_DURATION
+        self.trigger_type = trigger_type
+        self.record_details = record_details
+        self.log_level = log_level
+
+class RiskEngine:
+    """
+    風控規則引擎
+    規則按成本排序，第一條觸發的規則即短路返回，
+    並統計每條規則的評估次數、耗時與觸發次數
+    """
+    def __init__(self, rules=()):
+        self.rules = []
+        self.stats = {}
+        for rule in rules:
+            self.register(rule)
+
+    def register(self, rule):
+        self.rules.append(rule)
+        # 穩定排序：同成本的規則保持註冊順序
+        self.rules.sort(key=lambda registered: registered.cost)
+        self.stats[rule.name] = {'evaluations': 0, 'seconds': 0.0, 'trips': 0}
+
+    def evaluate(self, context):
+        """依序評估規則，返回 (觸發的規則, 原因)，全部通過時返回 (None, None)"""
+        for rule in self.rules:
+            rule_stats = self.stats[rule.name]
+            started = time.perf_counter()
+            reason = rule.check(context)
+            rule_stats['seconds'] += time.perf_counter() - started
+            rule_stats['evaluations'] += 1
+            if reason:
+                rule_stats['trips'] += 1
+                log.log(rule.log_level, f"觸發風控保護: {reason}")
+                return rule, reason
+        return None, None
+
+    def snapshot(self):
+        """返回 {規則名稱: 統計}，按規則評估順序排列"""
+        snapshot = {}
+        for rule in self.rules:
+            rule_stats = self.stats[rule.name]
+            evaluations = rule_stats['evaluations']
+            snapshot[rule.name] = {
+                'evaluations': evaluations,
+                'trips': rule_stats['trips'],
+                'total_ms': rule_stats['seconds'] * 1000,
+                'avg_us': rule_stats['seconds'] / evaluations * 1e6 if evaluations else 0.0
+            }
+        return snapshot
+
+def check_spread(context):
+    if context.spread_bps > SPREAD_DANGER_THRESHOLD:
+        return f"Spread價差過大 ({context.spread_bps:.1f}bps)"
+    return None
+
+def check_ewma_volatility(context):
+    if VOLATILITY_EWMA_LIMIT_PCT is None:
+        return None
+    if context.ewma_volatility is not None and context.ewma_volatility > VOLATILITY_EWMA_LIMIT_PCT:
+        return f"EWMA波動率過高 ({context.ewma_volatility*100:.3f}%/{VOLATILITY_EWMA_HORIZON}秒)"
+    return None
+
+def check_short_term_volatility(context):
+    if context.short_term_volatility > VOLATILITY_SHORT_TERM_PCT:
+        return f"10秒趨勢劇烈 ({context.short_term_volatility*100:.2f}%)"
+    return None
+
+def check_mid_term_volatility(context):
+    if context.mid_term_volatility > VOLATILITY_MID_TERM_PCT:
+        return f"20秒趨勢劇烈 ({context.mid_term_volatility*100:.2f}%)"
+    return None
+
+def check_long_term_volatility(context):
+    if context.long_term_volatility > VOLATILITY_LONG_TERM_PCT:
+        return f"30秒趨勢劇烈 ({context.long_term_volatility*100:.2f}%)"
+    return None
+
+def check_orderbook_imbalance(context):
+    if context.orderbook_imbalance is not None and context.imbalance_magnitude > ORDERBOOK_IMBALANCE_LIMIT:
+        return f"OBI不平衡 ({context.orderbook_imbalance*100:.1f}%, 閾值{ORDERBOOK_IMBALANCE_LIMIT*100:.0f}%)"
+    return None
+
+def create_risk_engine():
+    """建立預設風控規則；新增規則只需在此註冊並給出評估成本"""
+    return RiskEngine([
+        RiskRule("spread", check_spread, cost=1),
+        RiskRule("ewma_volatility", check_ewma_volatility, cost=1),
+        RiskRule("short_term_volatility", check_short_term_volatility, cost=2,
+                 trigger_type="VOLATILITY_SHORT_TERM", record_details=True),
+        RiskRule("mid_term_volatility", check_mid_term_volatility, cost=2),
+        RiskRule("long_term_volatility", check_long_term_volatility, cost=2),
+        RiskRule("orderbook_imbalance", check_orderbook_imbalance, cost=5,
+                 pause_duration=ORDERBOOK_PAUSE_DURATION, trigger_type="OBI", record_details=True),
+    ])
+
 # ==========================================
 # 🎯 主策略執行邏輯
 # ==========================================
 
+def clear_screen():
+    """清除終端畫面"""
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+def wait_for_next_iteration(market_stream, iteration_started_at, observed_seq):
+    """
+    主循環節奏控制
+    固定模式: 每輪休眠 LOOP_INTERVAL
+    事件驅動模式: 至少間隔 LOOP_MIN_INTERVAL，之後有新行情立即返回，最長等待 LOOP_MAX_IDLE
+    """
+    if not EVENT_DRIVEN_LOOP:
+        time.sleep(LOOP_INTERVAL)
+        return
+    
+    elapsed = time.time() - iteration_started_at
+    if elapsed < LOOP_MIN_INTERVAL:
+        time.sleep(LOOP_MIN_INTERVAL - elapsed)
+        elapsed = LOOP_MIN_INTERVAL
+    market_stream.wait_for_update(observed_seq, max(0.0, LOOP_MAX_IDLE - elapsed))
+
 def execute_trading_strategy():
     global trading_bot, is_shutting_down
     
@@ -966,6 +3750,8 @@ def execute_trading_strategy():
         log.error("私鑰配置缺失")
         return
     
+    setup_file_logging()
+
     print("🔑 偵測到簽名密鑰，正在轉換...")
     log.info("開始轉換 Base58 私鑰")
     final_private_key = decode_base58_private_key(SIGNING_KEY)
@@ -981,7 +3767,12 @@ def execute_trading_strategy():
     signal.signal(signal.SIGTERM, handle_shutdown_signal)
     
     # 初始化機器人
-    trading_bot = TradingBot(API_KEY, final_private_key)
+    trading_bot = create_trading_client(API_KEY, final_private_key)
+    
+    # 預先建立 HTTP 連線並保持活躍，避免首筆訂單承擔建連成本
+    print("🌐 正在預熱 HTTP 連線...")
+    trading_bot.warm_up_connections()
+    trading_bot.start_keepalive_probe()
     
     # 初始化成交記錄器
     trade_logger = TradeLogger("trades.log")
@@ -991,6 +3782,13 @@ def execute_trading_strategy():
     print(f"💰 最低餘額閾值: {MIN_BALANCE_THRESHOLD:.2f} DUSD (每 {BALANCE_CHECK_INTERVAL} 秒檢查一次)")
     time.sleep(2)
     
+    run_trading_loop(trading_bot, trade_logger)
+
+def run_trading_loop(trading_bot, trade_logger):
+    """
+    策略主循環
+    與初始化分開，方便以回放或模擬交易所驅動同一套策略邏輯
+    """
     # 冷靜期管理
     volatility_resume_at = datetime.min
     position_resume_at = datetime.min
@@ -999,11 +3797,25 @@ def execute_trading_strategy():
     last_balance_check = 0.0  # 上次檢查餘額的時間戳
     
     # 價格歷史記錄
-    historical_prices = deque(maxlen=PRICE_HISTORY_SIZE)
-    log.info(f"價格歷史緩衝區: {historical_prices.maxlen} 筆")
+    volatility_tracker = VolatilityTracker()
+    log.info(f"價格歷史緩衝區: {volatility_tracker.capacity} 筆, 窗口 {volatility_tracker.windows} 秒")
+    tick_statistics = None
+    if TICK_STATS_ENABLED:
+        if np is None:
+            log.warning("未安裝 numpy，停用逐筆價格統計 (pip install numpy)")
+        else:
+            tick_statistics = TickStatistics()
+            log.info(f"逐筆價格統計: {tick_statistics.capacity} 筆, EWMA 半衰期 {VOLATILITY_EWMA_HALF_LIFE} 秒")
+
+    # 風控規則
+    global risk_engine
+    risk_engine = create_risk_engine()
+    log.info(f"風控規則: {' > '.join(rule.name for rule in risk_engine.rules)}")
 
     # 主循環
     while True:
+        iteration_started_at = time.time()
+        observed_seq = trading_bot.market_stream.get_snapshot().seq
         try:
             if is_shutting_down:
                 log.info("偵測到關閉信號，退出主循環")
@@ -1042,7 +3854,7 @@ def execute_trading_strategy():
                 
                 # 如果沒有持倉問題，才顯示冷靜期畫面
                 if not position or float(position.get('qty', 0)) == 0:
-                    os.system('cls' if os.name == 'nt' else 'clear')
+                    clear_screen()
                     print("=== 🧊 吃單後冷靜期 🧊 ===")
                     print(f"⏰ 剩餘時間: {time_remaining // 60}分 {time_remaining % 60}秒")
                     print("🛡️ 暫停掛單中，等待市場穩定...")
@@ -1079,21 +3891,9 @@ def execute_trading_strategy():
                 # 計算波動率（使用歷史價格數據）
                 short_term_vol = None
                 mid_term_vol = None
-                if current_market_price and historical_prices:
-                    current_ts = time.time()
-                    # 20秒波動
-                    if historical_prices:
-                        oldest_price = historical_prices[0][1]
-                        mid_term_vol = abs(current_market_price - oldest_price) / oldest_price
-                    
-                    # 10秒波動
-                    cutoff_time = current_ts - 10
-                    base_price = current_market_price
-                    for timestamp, price in historical_prices:
-                        if timestamp >= cutoff_time:
-                            base_price = price
-                            break
-                    short_term_vol = abs(current_market_price - base_price) / base_price
+                if current_market_price and len(volatility_tracker):
+                    short_term_vol = volatility_tracker.window_return(VOLATILITY_SHORT_TERM_WINDOW, current_market_price)
+                    mid_term_vol = volatility_tracker.window_return(VOLATILITY_MID_TERM_WINDOW, current_market_price)
                 
                 # 記錄成交信息（包含詳細訂單簿深度和波動率）
                 trade_logger.log_trade(
@@ -1108,17 +3908,7 @@ def execute_trading_strategy():
                 active_orders = trading_bot.query_active_orders()
                 log.info(f"撤銷 {len(active_orders)} 個訂單")
                 
-                cancel_workers = []
-                for order_item in active_orders:
-                    worker = threading.Thread(
-                        target=trading_bot.cancel_single_order,
-                        args=(order_item['id'],)
-                    )
-                    worker.start()
-                    cancel_workers.append(worker)
-                
-                for worker in cancel_workers:
-                    worker.join(timeout=2)
+                trading_bot.cancel_orders([order_item['id'] for order_item in active_orders])
                 
                 log.info("訂單已全部撤銷")
                 time.sleep(1.5)
@@ -1144,7 +3934,7 @@ def execute_trading_strategy():
                         time.sleep(2)
                         
                         # 確認平倉（多次確認）
-                        verify_position = trading_bot.query_current_position()
+                        verify_position = trading_bot.query_current_position(force_refresh=True)
                         current_qty = float(verify_position.get('qty', 0)) if verify_position else 0
                         log.info(f"[診斷] 第1次確認平倉後持倉: {current_qty}")
                         
@@ -1152,7 +3942,7 @@ def execute_trading_strategy():
                         if current_qty != 0:
                             log.warning(f"[診斷] 持倉非0，等待1秒後二次確認...")
                             time.sleep(1)
-                            verify_position = trading_bot.query_current_position()
+                            verify_position = trading_bot.query_current_position(force_refresh=True)
                             current_qty = float(verify_position.get('qty', 0)) if verify_position else 0
                             log.info(f"[診斷] 第2次確認平倉後持倉: {current_qty}")
                         
@@ -1191,7 +3981,7 @@ def execute_trading_strategy():
                             time.sleep(1)
                 
                 # [修改] 只有在確認平倉成功後才進入冷靜期
-                final_position = trading_bot.query_current_position()
+                final_position = trading_bot.query_current_position(force_refresh=True)
                 final_qty = float(final_position.get('qty', 0)) if final_position else 0
                 
                 if final_qty == 0:
@@ -1206,8 +3996,9 @@ def execute_trading_strategy():
                     time.sleep(2)
                     continue
 
-            # 獲取當前價格
-            reference_price = trading_bot.market_stream.fetch_current_price()
+            # 獲取當前價格（本輪計算統一使用同一份市場快照）
+            market_snapshot = trading_bot.market_stream.get_snapshot()
+            reference_price = trading_bot.market_stream.fetch_current_price(market_snapshot)
             price_source_label = "WS-Price"
             
             if reference_price is None:
@@ -1222,7 +4013,9 @@ def execute_trading_strategy():
             # 波動保護檢查
             if datetime.now() < volatility_resume_at:
                 time_remaining = int((volatility_resume_at - datetime.now()).total_seconds())
-                historical_prices.clear()
+                volatility_tracker.clear()
+                if tick_statistics:
+                    tick_statistics.clear()
                 
                 # [新增] 波動保護冷靜期內也要檢查持倉！
                 log.info(f"[診斷] 波動保護冷靜期中，檢查持倉狀態...")
@@ -1240,7 +4033,7 @@ def execute_trading_strategy():
                 
                 # 如果沒有持倉問題，才顯示冷靜期畫面
                 if not position or float(position.get('qty', 0)) == 0:
-                    os.system('cls' if os.name == 'nt' else 'clear')
+                    clear_screen()
                     print("=== ❄️ 市場趨勢過大，進入冷靜期 ❄️ ===")
                     print(f"⏰ 剩餘時間: {time_remaining // 60}分 {time_remaining % 60}秒")
                     print(f"📊 目前價格: {int(reference_price):,}")
@@ -1249,101 +4042,42 @@ def execute_trading_strategy():
                     time.sleep(1)
                     continue
 
-            # 記錄價格歷史
+            # 記錄價格歷史（各窗口指針隨時間推進，舊數據自然移出窗口）
             current_timestamp = time.time()
-            historical_prices.append((current_timestamp, reference_price))
+            volatility_tracker.append(current_timestamp, reference_price)
+            if tick_statistics:
+                tick_statistics.append(current_timestamp, reference_price)
 
-            # 清理舊數據（保留30秒數據）
-            while historical_prices and historical_prices[0][0] < current_timestamp - 30:
-                historical_prices.popleft()
-
-            # 計算波動率
-            short_term_volatility = 0.0
-            mid_term_volatility = 0.0
-            long_term_volatility = 0.0
-            
-            if historical_prices:
-                # 30秒波動（使用最舊的數據）
-                oldest_price = historical_prices[0][1]
-                long_term_volatility = abs(reference_price - oldest_price) / oldest_price
-                
-                # 20秒波動
-                cutoff_20s = current_timestamp - 20
-                price_20s_ago = reference_price  # 預設為當前價格
-                for timestamp, price in historical_prices:
-                    if timestamp >= cutoff_20s:
-                        price_20s_ago = price
-                        break
-                mid_term_volatility = abs(reference_price - price_20s_ago) / price_20s_ago
-                
-                # 10秒波動
-                cutoff_10s = current_timestamp - 10
-                price_10s_ago = reference_price  # 預設為當前價格
-                for timestamp, price in historical_prices:
-                    if timestamp >= cutoff_10s:
-                        price_10s_ago = price
-                        break
-                short_term_volatility = abs(reference_price - price_10s_ago) / price_10s_ago
-
-            # 計算價差
-            current_spread = 0.0
-            if (trading_bot.market_stream.price_data_ready and 
-                trading_bot.market_stream.current_ask > trading_bot.market_stream.current_bid):
-                current_spread = (
-                    (trading_bot.market_stream.current_ask - trading_bot.market_stream.current_bid) / 
-                    reference_price * 10000
-                )
-
-            # 計算 OBI
-            orderbook_imbalance = trading_bot.market_stream.compute_orderbook_imbalance(reference_price)
-            imbalance_magnitude = abs(orderbook_imbalance) if orderbook_imbalance is not None else 0.0
-
-            # 風控觸發檢查
-            market_is_dangerous = False
-            danger_reason = ""
-            pause_duration = MARKET_PAUSE_DURATION
-            trigger_type = None
-
-            if orderbook_imbalance is not None and imbalance_magnitude > ORDERBOOK_IMBALANCE_LIMIT:
-                market_is_dangerous = True
-                trigger_type = "OBI"
-                danger_reason = f"OBI不平衡 ({orderbook_imbalance*100:.1f}%, 閾值{ORDERBOOK_IMBALANCE_LIMIT*100:.0f}%)"
-                pause_duration = ORDERBOOK_PAUSE_DURATION
-            elif current_spread > SPREAD_DANGER_THRESHOLD:
-                market_is_dangerous = True
-                danger_reason = f"Spread價差過大 ({current_spread:.1f}bps)"
-            elif short_term_volatility > VOLATILITY_SHORT_TERM_PCT:
-                market_is_dangerous = True
-                trigger_type = "VOLATILITY_SHORT_TERM"
-                danger_reason = f"10秒趨勢劇烈 ({short_term_volatility*100:.2f}%)"
-            elif mid_term_volatility > VOLATILITY_MID_TERM_PCT:
-                market_is_dangerous = True
-                danger_reason = f"20秒趨勢劇烈 ({mid_term_volatility*100:.2f}%)"
-            elif long_term_volatility > VOLATILITY_LONG_TERM_PCT:
-                market_is_dangerous = True
-                danger_reason = f"30秒趨勢劇烈 ({long_term_volatility*100:.2f}%)"
+            # 風控觸發檢查：規則按成本排序，第一條觸發即短路，指標只在被讀取時計算
+            risk_context = RiskContext(
+                trading_bot.market_stream, market_snapshot, reference_price, volatility_tracker, tick_statistics
+            )
+            tripped_rule, danger_reason = risk_engine.evaluate(risk_context)
+            market_is_dangerous = tripped_rule is not None
 
             if market_is_dangerous:
+                pause_duration = tripped_rule.pause_duration
                 print(f"🌊 偵測到危險行情! 原因: {danger_reason}")
-                if orderbook_imbalance is not None and imbalance_magnitude > ORDERBOOK_IMBALANCE_LIMIT:
+                if pause_duration % 60:
                     print(f"🛡️ 撤銷所有訂單、檢查平倉並暫停交易 {pause_duration} 秒...")
                 else:
                     print(f"🛡️ 撤銷所有訂單、檢查平倉並暫停交易 {pause_duration//60} 分鐘...")
-                log.warning(f"觸發風控保護: {danger_reason}")
                 
-                # 記錄風控觸發數據（僅 OBI 和短期波動）
-                if trigger_type in ["OBI", "VOLATILITY_SHORT_TERM"]:
+                # 記錄風控觸發數據（由規則的 record_details 決定）
+                if tripped_rule.record_details:
                     # 獲取詳細訂單簿深度
-                    detailed_orderbook = trading_bot.market_stream.get_detailed_orderbook_depth(reference_price)
+                    detailed_orderbook = trading_bot.market_stream.get_detailed_orderbook_depth(
+                        reference_price, snapshot=market_snapshot
+                    )
                     
                     # 記錄到日誌文件
                     trade_logger.log_risk_trigger(
-                        trigger_type=trigger_type,
+                        trigger_type=tripped_rule.trigger_type,
                         market_price=reference_price,
-                        orderbook_imbalance=orderbook_imbalance,
-                        short_term_volatility=short_term_volatility,
-                        mid_term_volatility=mid_term_volatility,
-                        current_spread=current_spread if current_spread > 0 else None,
+                        orderbook_imbalance=risk_context.orderbook_imbalance,
+                        short_term_volatility=risk_context.short_term_volatility,
+                        mid_term_volatility=risk_context.mid_term_volatility,
+                        current_spread=risk_context.spread_bps if risk_context.spread_bps > 0 else None,
                         detailed_orderbook=detailed_orderbook
                     )
                 
@@ -1351,17 +4085,7 @@ def execute_trading_strategy():
                 active_orders = trading_bot.query_active_orders()
                 log.info(f"開始撤銷 {len(active_orders)} 個訂單")
                 
-                cancel_workers = []
-                for order_item in active_orders:
-                    worker = threading.Thread(
-                        target=trading_bot.cancel_single_order,
-                        args=(order_item['id'],)
-                    )
-                    worker.start()
-                    cancel_workers.append(worker)
-                
-                for worker in cancel_workers:
-                    worker.join(timeout=2)
+                trading_bot.cancel_orders([order_item['id'] for order_item in active_orders])
                 
                 log.info("訂單已撤銷")
                 
@@ -1393,7 +4117,7 @@ def execute_trading_strategy():
                                 time.sleep(2)
                                 
                                 # 確認平倉（多次確認）
-                                verify_position = trading_bot.query_current_position()
+                                verify_position = trading_bot.query_current_position(force_refresh=True)
                                 current_qty = float(verify_position.get('qty', 0)) if verify_position else 0
                                 log.info(f"[診斷] 波動保護第1次確認: {current_qty}")
                                 
@@ -1401,7 +4125,7 @@ def execute_trading_strategy():
                                 if current_qty != 0:
                                     log.warning(f"[診斷] 波動保護持倉非0，二次確認...")
                                     time.sleep(1)
-                                    verify_position = trading_bot.query_current_position()
+                                    verify_position = trading_bot.query_current_position(force_refresh=True)
                                     current_qty = float(verify_position.get('qty', 0)) if verify_position else 0
                                     log.info(f"[診斷] 波動保護第2次確認: {current_qty}")
                                 
@@ -1448,6 +4172,8 @@ def execute_trading_strategy():
             buy_order_exists = False
             sell_order_exists = False
 
+            deviated_order_ids = []
+
             for order_info in active_orders:
                 order_id = order_info['id']
                 order_price = float(order_info['price'])
@@ -1455,7 +4181,7 @@ def execute_trading_strategy():
                 deviation_bps = abs(reference_price - order_price) / reference_price * 10000
                 
                 if deviation_bps < SPREAD_MIN_BPS or deviation_bps > SPREAD_MAX_BPS:
-                    trading_bot.cancel_single_order(order_id)
+                    deviated_order_ids.append(order_id)
                     action_messages.append(f"⚠️ {order_direction} 偏離 {deviation_bps:.1f}bps -> 撤單")
                 else:
                     if order_direction == 'buy':
@@ -1463,28 +4189,43 @@ def execute_trading_strategy():
                     if order_direction == 'sell':
                         sell_order_exists = True
 
-            # 補充買單
+            # 補充缺少的買單/賣單
+            quote_requests = []
             if not buy_order_exists:
-                order_response = trading_bot.submit_limit_order('buy', target_buy_price)
-                if 'code' in order_response and order_response['code'] == 0:
-                    action_messages.append(f"✅ 掛買單 @ {int(target_buy_price)}")
-            
-            # 補充賣單
+                quote_requests.append(('buy', target_buy_price))
             if not sell_order_exists:
-                order_response = trading_bot.submit_limit_order('sell', target_sell_price)
-                if 'code' in order_response and order_response['code'] == 0:
-                    action_messages.append(f"✅ 掛賣單 @ {int(target_sell_price)}")
+                quote_requests.append(('sell', target_sell_price))
+
+            # 偏離訂單撤銷與補單並行送出，一起等待結果
+            if deviated_order_ids or quote_requests:
+                _, submit_results = trading_bot.refresh_quotes(deviated_order_ids, quote_requests)
+                for order_side, order_price in quote_requests:
+                    order_response = submit_results[(order_side, order_price)]
+                    if 'code' in order_response and order_response['code'] == 0:
+                        side_label = "掛買單" if order_side == 'buy' else "掛賣單"
+                        action_messages.append(f"✅ {side_label} @ {int(order_price)}")
 
             # 顯示界面
-            os.system('cls' if os.name == 'nt' else 'clear')
+            clear_screen()
             print(f"⏰ 台灣時間： {datetime.now().strftime('%H:%M:%S')}")
-            print(f"📊 即時價格: {int(reference_price):,} ({price_source_label}) [Spread: {current_spread:.1f}bps]")
-            print(f"📈 10秒波動: {short_term_volatility*100:.3f}% (限{VOLATILITY_SHORT_TERM_PCT*100}%)")
-            print(f"📈 20秒波動: {mid_term_volatility*100:.3f}% (限{VOLATILITY_MID_TERM_PCT*100}%)")
-            print(f"📈 30秒波動: {long_term_volatility*100:.3f}% (限{VOLATILITY_LONG_TERM_PCT*100}%)")
+            print(f"📊 即時價格: {int(reference_price):,} ({price_source_label}) [Spread: {risk_context.spread_bps:.1f}bps]")
+            print(f"📈 10秒波動: {risk_context.short_term_volatility*100:.3f}% (限{VOLATILITY_SHORT_TERM_PCT*100}%)")
+            print(f"📈 20秒波動: {risk_context.mid_term_volatility*100:.3f}% (限{VOLATILITY_MID_TERM_PCT*100}%)")
+            print(f"📈 30秒波動: {risk_context.long_term_volatility*100:.3f}% (限{VOLATILITY_LONG_TERM_PCT*100}%)")
+            range_low, range_high = volatility_tracker.window_range(VOLATILITY_LONG_TERM_WINDOW)
+            if range_low is not None:
+                print(f"📏 30秒區間: {int(range_low):,} ~ {int(range_high):,}")
+            if risk_context.ewma_volatility is not None:
+                ewma_limit_label = f"限{VOLATILITY_EWMA_LIMIT_PCT*100}%" if VOLATILITY_EWMA_LIMIT_PCT is not None else "僅觀察"
+                # 逐筆統計只在窗口檢查超過閾值時才計算，這裡不為了顯示而強制計算
+                long_window_stats = risk_context.computed_window_statistics().get(VOLATILITY_LONG_TERM_WINDOW)
+                realized_label = f" | 30秒已實現: {long_window_stats.realized_vol*100:.3f}%" if long_window_stats else ""
+                print(f"📉 EWMA波動: {risk_context.ewma_volatility*100:.3f}% ({ewma_limit_label}){realized_label}")
             
             # OBI 顯示
+            orderbook_imbalance = risk_context.orderbook_imbalance
             if orderbook_imbalance is not None:
+                imbalance_magnitude = risk_context.imbalance_magnitude
                 status_indicator = "🟢" if imbalance_magnitude <= ORDERBOOK_IMBALANCE_LIMIT else "🔴"
                 if abs(orderbook_imbalance) < 0.01:
                     balance_label = "平衡"
@@ -1496,8 +4237,8 @@ def execute_trading_strategy():
             else:
                 print("📊 OBI指標: ⚠️ 數據未就緒")
             
-            if trading_bot.market_stream.price_data_ready:
-                print(f"🟢 買方單: {int(trading_bot.market_stream.current_bid):,} 🔴 賣方單: {int(trading_bot.market_stream.current_ask):,}")
+            if market_snapshot.price_ready:
+                print(f"🟢 買方單: {int(market_snapshot.bid):,} 🔴 賣方單: {int(market_snapshot.ask):,}")
             
             print("🛡️ 現在沒有持倉")
             print("-" * 40)
@@ -1516,7 +4257,7 @@ def execute_trading_strategy():
         except Exception as err:
             print(f"Error: {err}")
         
-        time.sleep(LOOP_INTERVAL)
+        wait_for_next_iteration(trading_bot.market_stream, iteration_started_at, observed_seq)
 
 if __name__ == "__main__":
     execute_trading_strategy()
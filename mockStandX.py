@@ -0,0 +1,657 @@
+"""
+StandX 本地模擬交易所
+在同一個埠上提供 REST API 與 ws-stream/v1 行情 WebSocket，用於離線壓測與延遲測試
+
+功能:
+    - REST: /api/new_order /api/cancel_order /api/query_open_orders
+            /api/query_positions /api/query_balance /api/query_symbol_price
+    - WebSocket: price / depth_book 頻道（依腳本化價格路徑推送）
+                 認證後推送 order / position 私有頻道
+    - 撮合引擎: 限價單在對手價穿越時成交，市價單以買一/賣一成交
+    - 驗證請求簽名標頭 (x-request-*)，可選驗證 Bearer Token
+    - 可配置延遲、錯誤注入與逾時注入
+    - 統計每個端點的請求數，以及「行情推送 → 機器人下單/撤單」的反應時間
+
+用法:
+    python mockStandX.py --port 8765 --latency-ms 20 --error-rate 0.01
+    # 另開終端，讓機器人連到模擬交易所
+    STANDX_API_URL=http://127.0.0.1:8765 STANDX_STREAM_URL=ws://127.0.0.1:8765/ws-stream/v1 python main.py
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import base58
+from dotenv import load_dotenv
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey
+
+load_dotenv()
+
+# ==========================================
+# ⚙️ 預設配置
+# ==========================================
+DEFAULT_SYMBOL = "BTC-USD"
+DEFAULT_START_PRICE = 95000.0
+DEFAULT_BALANCE = 10000.0
+WS_PATH = "/ws-stream/v1"
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# ==========================================
+# 📈 腳本化價格路徑
+# ==========================================
+
+class PricePath:
+    """
+    價格路徑
+    提供 CSV 腳本（每行: 秒數,價格）時按腳本線性插值並循環播放，否則為隨機漫步
+    """
+    def __init__(self, start_price, volatility_bps, script_path=None):
+        self.price = start_price
+        self.volatility = volatility_bps / 10000.0
+        self.script = self._load_script(script_path) if script_path else None
+        self.started_at = time.time()
+
+    @staticmethod
+    def _load_script(script_path):
+        points = []
+        with open(script_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                seconds, price = line.split(",")[:2]
+                points.append((float(seconds), float(price)))
+        if not points:
+            raise ValueError(f"價格腳本為空: {script_path}")
+        return sorted(points)
+
+    def next_price(self):
+        if not self.script:
+            self.price *= math.exp(random.gauss(0, self.volatility))
+            return self.price
+
+        duration = self.script[-1][0] or 1.0
+        elapsed = (time.time() - self.started_at) % duration
+        previous = self.script[0]
+        for point in self.script:
+            if point[0] >= elapsed:
+                span = point[0] - previous[0]
+                ratio = (elapsed - previous[0]) / span if span > 0 else 1.0
+                self.price = previous[1] + (point[1] - previous[1]) * ratio
+                return self.price
+            previous = point
+        self.price = self.script[-1][1]
+        return self.price
+
+# ==========================================
+# ⚖️ 撮合引擎
+# ==========================================
+
+class MatchingEngine:
+    """單一交易對的簡化撮合引擎：維護掛單、持倉與餘額"""
+    def __init__(self, symbol, start_price, half_spread, balance):
+        self.symbol = symbol
+        self.half_spread = half_spread
+        self.bid = start_price - half_spread
+        self.ask = start_price + half_spread
+        self.last_price = start_price
+        self.orders = {}
+        self.order_ids = itertools.count(1)
+        self.position_qty = 0.0
+        self.entry_price = 0.0
+        self.balance = balance
+        self.fills = []
+        self.lock = threading.Lock()
+
+    def update_price(self, mid_price):
+        """更新行情並撮合被穿越的限價單，返回本次成交列表"""
+        with self.lock:
+            self.bid = round(mid_price - self.half_spread, 1)
+            self.ask = round(mid_price + self.half_spread, 1)
+            self.last_price = round(mid_price, 1)
+            filled = []
+            for order_id, order in list(self.orders.items()):
+                price = float(order['price'])
+                if (order['side'] == 'buy' and self.ask <= price) or (order['side'] == 'sell' and self.bid >= price):
+                    del self.orders[order_id]
+                    self._apply_fill(order['side'], price, float(order['qty']))
+                    filled.append(order)
+            return filled
+
+    def _apply_fill(self, side, price, quantity):
+        signed_qty = quantity if side == 'buy' else -quantity
+        if self.position_qty == 0 or (self.position_qty > 0) == (signed_qty > 0):
+            total_qty = self.position_qty + signed_qty
+            self.entry_price = (self.entry_price * abs(self.position_qty) + price * quantity) / abs(total_qty)
+            self.position_qty = total_qty
+        else:
+            closed_qty = min(abs(self.position_qty), quantity)
+            direction = 1 if self.position_qty > 0 else -1
+            self.balance += (price - self.entry_price) * closed_qty * direction
+            self.position_qty += signed_qty
+            if abs(self.position_qty) < 1e-12:
+                self.position_qty = 0.0
+                self.entry_price = 0.0
+            elif (self.position_qty > 0) != (direction > 0):
+                self.entry_price = price
+        self.fills.append((time.time(), side, price, quantity))
+
+    def new_order(self, order):
+        """返回 (回應 dict, 新增的掛單或 None)"""
+        side = order.get('side')
+        order_type = order.get('order_type')
+        try:
+            quantity = float(order.get('qty', 0))
+        except (TypeError, ValueError):
+            quantity = 0.0
+        if order.get('symbol') != self.symbol or side not in ('buy', 'sell') or quantity <= 0:
+            return {"code": 400, "message": "invalid order parameters"}, None
+
+        with self.lock:
+            order_id = next(self.order_ids)
+            if order_type == 'market':
+                if order.get('reduce_only'):
+                    quantity = min(quantity, abs(self.position_qty))
+                if quantity > 0:
+                    self._apply_fill(side, self.bid if side == 'sell' else self.ask, quantity)
+                return {"code": 0, "message": "success", "order_id": order_id}, None
+
+            if order_type != 'limit':
+                return {"code": 400, "message": f"unsupported order_type: {order_type}"}, None
+            resting = {
+                "id": order_id,
+                "symbol": self.symbol,
+                "side": side,
+                "order_type": "limit",
+                "price": str(order.get('price')),
+                "qty": str(order.get('qty')),
+                "status": "open",
+                "created_at": time.time()
+            }
+            self.orders[order_id] = resting
+            return {"code": 0, "message": "success", "order_id": order_id}, resting
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            order = self.orders.pop(order_id, None)
+        if not order:
+            return {"code": 404, "message": "order not found"}, None
+        return {"code": 0, "message": "success"}, order
+
+    def open_orders(self):
+        with self.lock:
+            return [dict(order) for order in self.orders.values()]
+
+    def positions(self):
+        with self.lock:
+            return [{
+                "symbol": self.symbol,
+                "qty": f"{self.position_qty:.6f}",
+                "entry_price": f"{self.entry_price:.2f}",
+                "mark_price": f"{self.last_price:.2f}"
+            }]
+
+    def balance_info(self):
+        with self.lock:
+            unrealized = (self.last_price - self.entry_price) * self.position_qty if self.position_qty else 0.0
+            equity = self.balance + unrealized
+            return {
+                "balance": f"{self.balance:.9f}",
+                "cross_available": f"{equity:.9f}",
+                "equity": f"{equity:.9f}",
+                "cross_margin": "0"
+            }
+
+    def depth_levels(self, level_count, tick_size):
+        with self.lock:
+            bids = [[f"{self.bid - i * tick_size:.1f}", f"{random.uniform(0.01, 2.0):.4f}"] for i in range(level_count)]
+            asks = [[f"{self.ask + i * tick_size:.1f}", f"{random.uniform(0.01, 2.0):.4f}"] for i in range(level_count)]
+        return bids, asks
+
+# ==========================================
+# 📊 統計
+# ==========================================
+
+class MockStats:
+    """端點請求計數、注入錯誤計數，以及機器人對行情的反應時間"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoint_counts = {}
+        self.injected_errors = 0
+        self.signature_failures = 0
+        self.last_broadcast_at = None
+        self.reaction_times_ms = []
+
+    def record_request(self, path):
+        with self.lock:
+            self.endpoint_counts[path] = self.endpoint_counts.get(path, 0) + 1
+
+    def record_reaction(self):
+        """下單/撤單到達時，記錄距離最近一次行情推送的時間"""
+        with self.lock:
+            if self.last_broadcast_at is not None:
+                self.reaction_times_ms.append((time.perf_counter() - self.last_broadcast_at) * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            reactions = sorted(self.reaction_times_ms)
+            summary = {
+                "endpoint_counts": dict(self.endpoint_counts),
+                "injected_errors": self.injected_errors,
+                "signature_failures": self.signature_failures,
+                "reaction_samples": len(reactions)
+            }
+            for label, pct in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                if reactions:
+                    summary[f"reaction_{label}_ms"] = round(reactions[min(len(reactions) - 1, int(len(reactions) * pct))], 3)
+            return summary
+
+# ==========================================
+# 🔌 WebSocket 連線
+# ==========================================
+
+class WebSocketClient:
+    """最小化的 RFC 6455 伺服器端連線：只處理文字幀、ping/pong 與關閉"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.send_lock = threading.Lock()
+        self.subscriptions = set()
+        self.private_channels = set()
+        self.closed = False
+
+    def _recv_exact(self, length):
+        data = b""
+        while len(data) < length:
+            chunk = self.connection.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("連線已關閉")
+            data += chunk
+        return data
+
+    def read_frame(self):
+        """返回 (opcode, payload)"""
+        first, second = self._recv_exact(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self._recv_exact(8))[0]
+        mask = self._recv_exact(4) if second & 0x80 else None
+        payload = self._recv_exact(length)
+        if mask:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return opcode, payload
+
+    def send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([length])
+        elif length < 65536:
+            header += bytes([126]) + struct.pack(">H", length)
+        else:
+            header += bytes([127]) + struct.pack(">Q", length)
+        with self.send_lock:
+            if self.closed:
+                return
+            try:
+                self.connection.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def send_json(self, message):
+        self.send_frame(0x1, json.dumps(message).encode('utf-8'))
+
+# ==========================================
+# 🏦 模擬交易所
+# ==========================================
+
+class MockExchange:
+    def __init__(self, args):
+        self.args = args
+        self.symbol = args.symbol
+        self.engine = MatchingEngine(args.symbol, args.start_price, args.half_spread, args.balance)
+        self.price_path = PricePath(args.start_price, args.volatility_bps, args.price_script)
+        self.stats = MockStats()
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.sequence = itertools.count(1)
+        self.verify_key = self._load_verify_key(args.signing_key)
+        if not self.verify_key:
+            print("⚠️ 未提供簽名密鑰，將只檢查簽名標頭格式，不驗證簽名")
+
+    @staticmethod
+    def _load_verify_key(signing_key):
+        """從機器人使用的 Base58 私鑰推導驗簽公鑰"""
+        if not signing_key:
+            return None
+        return SigningKey(base58.b58decode(signing_key)).verify_key
+
+    # ---------- 延遲與錯誤注入 ----------
+
+    def simulate_latency(self):
+        if self.args.latency_ms > 0 or self.args.jitter_ms > 0:
+            delay_ms = max(0.0, random.gauss(self.args.latency_ms, self.args.jitter_ms))
+            time.sleep(delay_ms / 1000)
+
+    def injected_failure(self):
+        """返回 None 表示正常，否則返回 (HTTP 狀態碼, 回應) 或 'timeout'"""
+        roll = random.random()
+        if roll < self.args.timeout_rate:
+            return "timeout"
+        if roll < self.args.timeout_rate + self.args.error_rate:
+            with self.stats.lock:
+                self.stats.injected_errors += 1
+            return random.choice([
+                (500, {"code": 500, "message": "internal error (injected)"}),
+                (429, {"code": 429, "message": "too many requests (injected)"}),
+                (200, {"code": 1001, "message": "order rejected (injected)"})
+            ])
+        return None
+
+    # ---------- 簽名驗證 ----------
+
+    def verify_signature(self, headers, body):
+        """返回錯誤訊息或 None"""
+        if self.args.api_key and headers.get("Authorization") != f"Bearer {self.args.api_key}":
+            return "invalid bearer token"
+        version = headers.get("x-request-sign-version")
+        request_id = headers.get("x-request-id")
+        timestamp = headers.get("x-request-timestamp")
+        signature = headers.get("x-request-signature")
+        if not (version and request_id and timestamp and signature):
+            return "missing signature headers"
+        if version != "v1":
+            return f"unsupported sign version: {version}"
+        try:
+            if abs(time.time() * 1000 - int(timestamp)) > self.args.max_clock_skew_ms:
+                return "request timestamp out of range"
+            uuid.UUID(request_id)
+        except ValueError:
+            return "malformed signature headers"
+        if not self.verify_key:
+            return None
+        message = f"{version},{request_id},{timestamp},{body}".encode('utf-8')
+        try:
+            self.verify_key.verify(message, base64.b64decode(signature))
+        except (BadSignatureError, ValueError):
+            return "invalid signature"
+        return None
+
+    # ---------- 行情推送 ----------
+
+    def add_client(self, client):
+        with self.clients_lock:
+            self.clients.append(client)
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def broadcast(self, channel, data):
+        message = {"seq": next(self.sequence), "channel": channel, "symbol": self.symbol, "data": data}
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            if (channel, self.symbol) in client.subscriptions:
+                client.send_json(message)
+
+    def push_private(self, channel, data):
+        """推送私有頻道訊息給已認證並訂閱該頻道的客戶端"""
+        message = {"seq": next(self.sequence), "channel": channel, "symbol": self.symbol, "data": data}
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            if channel in client.private_channels:
+                client.send_json(message)
+
+    def push_order_update(self, order, status):
+        self.push_private("order", dict(order, status=status))
+
+    def push_position_update(self):
+        self.push_private("position", self.engine.positions()[0])
+
+    def handle_auth(self, client, auth):
+        """處理 {"auth": {"token", "streams"}}，以 auth 頻道回應結果"""
+        if self.args.api_key and auth.get("token") != self.args.api_key:
+            client.send_json({"channel": "auth", "data": {"code": 401, "message": "invalid token"}})
+            return
+        client.private_channels = {stream.get("channel") for stream in auth.get("streams", [])}
+        client.send_json({"channel": "auth", "data": {"code": 0, "message": "success"}})
+
+    def run_market(self):
+        """按 tick 推進價格路徑、撮合並推送 price / depth_book"""
+        tick_seconds = self.args.tick_ms / 1000
+        for tick in itertools.count():
+            started = time.perf_counter()
+            mid_price = self.price_path.next_price()
+            filled_orders = self.engine.update_price(mid_price)
+            for order in filled_orders:
+                print(f"💥 成交: {order['side']} {order['qty']} @ {order['price']}")
+                self.push_order_update(order, "filled")
+            if filled_orders:
+                self.push_position_update()
+
+            engine = self.engine
+            self.broadcast("price", {
+                "spread": [f"{engine.bid:.1f}", f"{engine.ask:.1f}"],
+                "mid_price": f"{(engine.bid + engine.ask) / 2:.2f}",
+                "last_price": f"{engine.last_price:.1f}"
+            })
+            if tick % self.args.depth_every == 0:
+                bids, asks = engine.depth_levels(self.args.depth_levels, self.args.tick_size)
+                self.broadcast("depth_book", {"bids": bids, "asks": asks})
+            with self.stats.lock:
+                self.stats.last_broadcast_at = time.perf_counter()
+
+            time.sleep(max(0.0, tick_seconds - (time.perf_counter() - started)))
+
+    # ---------- REST ----------
+
+    def handle_get(self, path, query):
+        if path == "/api/query_symbol_price":
+            engine = self.engine
+            return 200, {
+                "symbol": self.symbol,
+                "last_price": f"{engine.last_price:.1f}",
+                "mid_price": f"{(engine.bid + engine.ask) / 2:.2f}",
+                "spread": [f"{engine.bid:.1f}", f"{engine.ask:.1f}"]
+            }
+        if path == "/api/query_open_orders":
+            return 200, {"result": self.engine.open_orders()}
+        if path == "/api/query_positions":
+            return 200, self.engine.positions()
+        if path == "/api/query_balance":
+            return 200, self.engine.balance_info()
+        if path == "/mock/stats":
+            return 200, self.stats.snapshot()
+        return 404, {"code": 404, "message": f"unknown endpoint: {path}"}
+
+    def handle_post(self, path, payload):
+        if path == "/api/new_order":
+            self.stats.record_reaction()
+            response, resting = self.engine.new_order(payload)
+            if resting:
+                self.push_order_update(resting, "open")
+            elif response.get("code") == 0:
+                self.push_position_update()
+            return 200, response
+        if path == "/api/cancel_order":
+            self.stats.record_reaction()
+            response, order = self.engine.cancel_order(payload.get("order_id"))
+            if order:
+                self.push_order_update(order, "canceled")
+            return 200, response
+        return 404, {"code": 404, "message": f"unknown endpoint: {path}"}
+
+def make_request_handler(exchange):
+    class MockRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            if exchange.args.verbose:
+                super().log_message(format, *args)
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _apply_injection(self):
+            """返回 True 表示已以注入的錯誤回應"""
+            exchange.simulate_latency()
+            failure = exchange.injected_failure()
+            if failure == "timeout":
+                time.sleep(exchange.args.timeout_seconds)
+                return False
+            if failure:
+                self._send_json(*failure)
+                return True
+            return False
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path == WS_PATH and self.headers.get("Upgrade", "").lower() == "websocket":
+                self._serve_websocket()
+                return
+            exchange.stats.record_request(parsed.path)
+            if not parsed.path.startswith("/mock/") and self._apply_injection():
+                return
+            self._send_json(*exchange.handle_get(parsed.path, parse_qs(parsed.query)))
+
+        def do_POST(self):
+            parsed = urlparse(self.path)
+            exchange.stats.record_request(parsed.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode('utf-8')
+
+            signature_error = exchange.verify_signature(self.headers, body)
+            if signature_error:
+                with exchange.stats.lock:
+                    exchange.stats.signature_failures += 1
+                self._send_json(401, {"code": 401, "message": signature_error})
+                return
+            if self._apply_injection():
+                return
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError:
+                self._send_json(400, {"code": 400, "message": "invalid json"})
+                return
+            self._send_json(*exchange.handle_post(parsed.path, payload))
+
+        def _serve_websocket(self):
+            accept = base64.b64encode(
+                hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WS_GUID).encode('utf-8')).digest()
+            ).decode('utf-8')
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept)
+            self.end_headers()
+            self.wfile.flush()
+            self.close_connection = True
+
+            client = WebSocketClient(self.connection)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            exchange.add_client(client)
+            print(f"🔌 WebSocket 客戶端已連線: {self.client_address}")
+            try:
+                while True:
+                    opcode, payload = client.read_frame()
+                    if opcode == 0x8:
+                        client.send_frame(0x8, payload[:2])
+                        break
+                    if opcode == 0x9:
+                        client.send_frame(0xA, payload)
+                        continue
+                    if opcode != 0x1:
+                        continue
+                    try:
+                        message = json.loads(payload.decode('utf-8'))
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        continue
+                    if message.get("auth"):
+                        exchange.handle_auth(client, message["auth"])
+                        continue
+                    subscription = message.get("subscribe")
+                    if subscription:
+                        client.subscriptions.add((subscription.get("channel"), subscription.get("symbol")))
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                client.closed = True
+                exchange.remove_client(client)
+                print(f"🔌 WebSocket 客戶端已斷線: {self.client_address}")
+
+    return MockRequestHandler
+
+# ==========================================
+# 🚀 主程式
+# ==========================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="StandX 本地模擬交易所")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--symbol", default=DEFAULT_SYMBOL)
+    parser.add_argument("--start-price", type=float, default=DEFAULT_START_PRICE)
+    parser.add_argument("--half-spread", type=float, default=0.5, help="買一/賣一距中間價的距離")
+    parser.add_argument("--volatility-bps", type=float, default=0.5, help="隨機漫步每 tick 的波動（基點）")
+    parser.add_argument("--price-script", help="價格腳本 CSV（秒數,價格），提供時取代隨機漫步")
+    parser.add_argument("--tick-ms", type=float, default=100, help="行情推送間隔（毫秒）")
+    parser.add_argument("--depth-every", type=int, default=2, help="每幾個 tick 推送一次 depth_book")
+    parser.add_argument("--depth-levels", type=int, default=50)
+    parser.add_argument("--tick-size", type=float, default=0.5)
+    parser.add_argument("--balance", type=float, default=DEFAULT_BALANCE)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="REST 平均延遲（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="REST 延遲標準差（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="REST 錯誤注入機率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="REST 逾時注入機率")
+    parser.add_argument("--timeout-seconds", type=float, default=3.0, help="逾時注入的延遲秒數")
+    parser.add_argument("--signing-key", default=os.getenv("SIGNING_KEY"), help="機器人的 Base58 私鑰，用於驗簽")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="要求的 Bearer Token，留空不檢查")
+    parser.add_argument("--max-clock-skew-ms", type=float, default=30000)
+    parser.add_argument("--verbose", action="store_true", help="輸出每個 HTTP 請求")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    exchange = MockExchange(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(exchange))
+    server.daemon_threads = True
+
+    threading.Thread(target=exchange.run_market, daemon=True).start()
+
+    print(f"🏦 模擬交易所已啟動: http://{args.host}:{args.port}")
+    print("💡 讓機器人連線到模擬交易所:")
+    print(f"   STANDX_API_URL=http://{args.host}:{args.port}")
+    print(f"   STANDX_STREAM_URL=ws://{args.host}:{args.port}{WS_PATH}")
+    print(f"📊 統計: http://{args.host}:{args.port}/mock/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n📊 統計結果:")
+        print(json.dumps(exchange.stats.snapshot(), indent=2, ensure_ascii=False))
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
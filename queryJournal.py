@@ -0,0 +1,55 @@
+"""
+結構化成交日誌查詢工具
+透過索引直接定位記錄，不需要解析整個 trades.jsonl
+
+用法:
+    # 列出所有記錄
+    python queryJournal.py trades.jsonl
+    # 查詢時間範圍內的風控觸發記錄
+    python queryJournal.py trades.jsonl --since "2026-01-16 20:00:00" --until "2026-01-16 21:00:00" --type risk
+    # 查詢某筆成交及其平倉記錄
+    python queryJournal.py trades.jsonl --trade 12
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from main import TradeJournalReader, encode_json
+
+def parse_time(value):
+    """接受 Unix 時間戳或 'YYYY-MM-DD HH:MM:SS' 本地時間"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+
+def main():
+    parser = argparse.ArgumentParser(description="結構化成交日誌查詢")
+    parser.add_argument("journal", help="結構化成交日誌 (.jsonl)，同目錄需有 .jsonl.idx 索引")
+    parser.add_argument("--since", help="起始時間（Unix 時間戳或 'YYYY-MM-DD HH:MM:SS'）")
+    parser.add_argument("--until", help="結束時間（Unix 時間戳或 'YYYY-MM-DD HH:MM:SS'）")
+    parser.add_argument("--type", choices=("open", "close", "risk"), help="只列出指定類型的記錄")
+    parser.add_argument("--trade", type=int, help="成交記錄編號，輸出該筆成交與對應的平倉記錄")
+    args = parser.parse_args()
+
+    reader = TradeJournalReader(args.journal)
+    if not len(reader):
+        print(f"❌ 索引為空或不存在: {args.journal}.idx")
+        sys.exit(1)
+
+    if args.trade is not None:
+        open_record, close_record = reader.get_trade(args.trade)
+        if open_record is None:
+            print(f"❌ 找不到記錄 #{args.trade}")
+            sys.exit(1)
+        print(encode_json(open_record))
+        print(encode_json(close_record) if close_record else "⚠️ 尚未平倉")
+        return
+
+    for record in reader.records_between(parse_time(args.since), parse_time(args.until), args.type):
+        print(encode_json(record))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+行情回放引擎
+將 MarketDataStream 錄製的 price / depth_book 訊息，經由真實的 _handle_stream_message
+分派到 _handle_price_message / _handle_depth_message，並在模擬時鐘下驅動 run_trading_loop。
+策略中的 time.sleep / datetime.now 冷靜期邏輯只推進模擬時間，不會真的等待。
+下單、撤單、持倉查詢由本地模擬撮合處理，不會連線交易所。
+
+用法:
+    # 以最快速度回放目錄內所有錄製文件
+    python replayMarket.py captures/
+    # 以 10 倍速回放，並調整策略參數
+    python replayMarket.py captures/ --speed 10 --set SPREAD_TARGET_BPS=9 --set ORDERBOOK_IMBALANCE_LIMIT=0.6
+    # 分析主循環熱點
+    python replayMarket.py captures/market_20260116_204326_0001.mdcap --profile
+"""
+import argparse
+import ast
+import cProfile
+import contextlib
+import logging
+import os
+import pstats
+import sys
+import time as real_time
+from datetime import datetime as real_datetime
+
+from nacl.encoding import HexEncoder
+from nacl.signing import SigningKey
+
+import main
+
+# ==========================================
+# ⏱️ 模擬時鐘
+# ==========================================
+
+class SimulatedClock:
+    """
+    回放用時鐘
+    策略調用 sleep() 時推進模擬時間，並把期間到達的錄製訊息依序餵給行情流
+    speed: 0 表示盡快回放，1 表示實際速度，N 表示 N 倍速
+    """
+    def __init__(self, feed, speed=0.0):
+        self.feed = feed
+        self.speed = speed
+        self.now = feed.peek_time() or real_time.time()
+        self.on_message = None
+
+    # 以下方法替換 main 模組中的 time.* 調用
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def monotonic_ns(self):
+        return int(self.now * 1e9)
+
+    def perf_counter(self):
+        return real_time.perf_counter()
+
+    def sleep(self, seconds):
+        self.advance_to(self.now + max(0.0, seconds))
+
+    def __getattr__(self, name):
+        return getattr(real_time, name)
+
+    def _wait_real(self, simulated_seconds):
+        if self.speed > 0 and simulated_seconds > 0:
+            real_time.sleep(simulated_seconds / self.speed)
+
+    def _deliver_next(self):
+        message_time, raw_message = self.feed.pop()
+        self._wait_real(message_time - self.now)
+        self.now = max(self.now, message_time)
+        self.on_message(raw_message)
+
+    def advance_to(self, target_time):
+        """推進到 target_time，期間到達的訊息按時間順序送出"""
+        while True:
+            next_time = self.feed.peek_time()
+            if next_time is None or next_time > target_time:
+                break
+            self._deliver_next()
+        if self.feed.peek_time() is None:
+            main.is_shutting_down = True
+        self._wait_real(target_time - self.now)
+        self.now = max(self.now, target_time)
+
+    def advance_until_message(self, timeout):
+        """推進到下一筆訊息或逾時為止，返回是否送出了訊息"""
+        next_time = self.feed.peek_time()
+        if next_time is not None and next_time <= self.now + timeout:
+            self.advance_to(next_time)
+            return True
+        self.advance_to(self.now + timeout)
+        return False
+
+def make_simulated_datetime(clock):
+    """建立 now() 返回模擬時間的 datetime 子類"""
+    class SimulatedDateTime(real_datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return real_datetime.fromtimestamp(clock.now, tz)
+    return SimulatedDateTime
+
+# ==========================================
+# 📼 錄製數據讀取
+# ==========================================
+
+class CaptureFeed:
+    """按時間順序提供錄製訊息，支援查看下一筆的時間"""
+    def __init__(self, capture_paths):
+        self.records = self._iter_records(capture_paths)
+        self.pending = next(self.records, None)
+        self.delivered_count = 0
+
+    @staticmethod
+    def _iter_records(capture_paths):
+        for capture_path in capture_paths:
+            for _, wall_time, raw_message in main.iter_capture_records(capture_path):
+                yield wall_time, raw_message
+
+    def peek_time(self):
+        return self.pending[0] if self.pending else None
+
+    def pop(self):
+        record = self.pending
+        self.pending = next(self.records, None)
+        self.delivered_count += 1
+        return record
+
+# ==========================================
+# 📊 回放行情流
+# ==========================================
+
+class ReplayMarketDataStream(main.MarketDataStream):
+    """不連線的 MarketDataStream，等待行情時改為推進模擬時鐘"""
+    def __init__(self, clock):
+        super().__init__(capture_dir=None, connect=False)
+        self.clock = clock
+
+    def wait_for_update(self, observed_seq, timeout):
+        if self.snapshot.seq != observed_seq:
+            return True
+        return self.clock.advance_until_message(timeout)
+
+# ==========================================
+# 🧾 模擬撮合
+# ==========================================
+
+class PaperTradingBot(main.TradingBot):
+    """
+    本地模擬撮合的 TradingBot
+    限價單在對手價或成交價穿越掛單價時全部成交，市價平倉以當前買一/賣一成交
+    """
+    def __init__(self, market_stream):
+        replay_key = SigningKey.generate().encode(encoder=HexEncoder).decode('utf-8')
+        super().__init__("replay", replay_key, market_stream=market_stream)
+        self.open_orders = {}
+        self.next_order_id = 1
+        self.position_qty = 0.0
+        self.entry_price = 0.0
+        self.realized_pnl = 0.0
+        self.stats = {'submits': 0, 'cancels': 0, 'fills': 0, 'closes': 0}
+
+    def fetch_backup_price(self):
+        return self.market_stream.fetch_current_price()
+
+    def query_active_orders(self, force_refresh=False):
+        return [dict(order) for order in self.open_orders.values()]
+
+    def query_current_position(self, force_refresh=False):
+        if self.position_qty == 0:
+            return None
+        return {
+            'symbol': main.TRADING_PAIR,
+            'qty': f"{self.position_qty:.6f}",
+            'entry_price': f"{self.entry_price:.2f}"
+        }
+
+    def query_account_balance(self):
+        return {'free': 1e9, 'total': 1e9}
+
+    def submit_limit_order(self, order_side, order_price):
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        self.open_orders[order_id] = {
+            'id': order_id,
+            'symbol': main.TRADING_PAIR,
+            'side': order_side,
+            'price': f"{int(order_price)}",
+            'qty': main.ORDER_SIZE
+        }
+        self.stats['submits'] += 1
+        return {'code': 0, 'id': order_id}
+
+    def cancel_single_order(self, order_identifier):
+        if self.open_orders.pop(order_identifier, None):
+            self.stats['cancels'] += 1
+            return True
+        return False
+
+    def cancel_orders(self, order_identifiers, timeout=main.ORDER_CANCEL_TIMEOUT):
+        # 回放必須可重現：按給定順序同步撤單，不經執行緒池與牆鐘逾時
+        return {order_id: self.cancel_single_order(order_id) for order_id in order_identifiers}
+
+    def refresh_quotes(self, cancel_identifiers, quote_requests, timeout=main.ORDER_REFRESH_TIMEOUT):
+        # 先撤單再下單，訂單編號的分配順序與撤單先後在每次回放中都相同
+        cancel_results = self.cancel_orders(cancel_identifiers)
+        submit_results = {}
+        for order_side, order_price in quote_requests:
+            submit_results[(order_side, order_price)] = self.submit_limit_order(order_side, order_price)
+        return cancel_results, submit_results
+
+    def execute_market_close(self, close_side, close_quantity):
+        snapshot = self.market_stream.get_snapshot()
+        fill_price = snapshot.bid if close_side == 'sell' else snapshot.ask
+        if not fill_price:
+            return False
+        quantity = abs(float(close_quantity))
+        self._apply_fill(close_side, fill_price, quantity)
+        self.stats['closes'] += 1
+        return True
+
+    def _apply_fill(self, side, price, quantity):
+        signed_qty = quantity if side == 'buy' else -quantity
+        if self.position_qty == 0 or (self.position_qty > 0) == (signed_qty > 0):
+            total_qty = self.position_qty + signed_qty
+            self.entry_price = (self.entry_price * abs(self.position_qty) + price * quantity) / abs(total_qty)
+            self.position_qty = total_qty
+            return
+        closed_qty = min(abs(self.position_qty), quantity)
+        direction = 1 if self.position_qty > 0 else -1
+        self.realized_pnl += (price - self.entry_price) * closed_qty * direction
+        self.position_qty += signed_qty
+        if abs(self.position_qty) < 1e-12:
+            self.position_qty = 0.0
+            self.entry_price = 0.0
+        elif (self.position_qty > 0) != (direction > 0):
+            self.entry_price = price
+
+    def match_orders(self):
+        """每筆行情到達後檢查掛單是否被穿越"""
+        if not self.open_orders:
+            return
+        snapshot = self.market_stream.get_snapshot()
+        if not snapshot.price_ready:
+            return
+        for order_id, order in list(self.open_orders.items()):
+            order_price = float(order['price'])
+            if order['side'] == 'buy':
+                filled = snapshot.ask <= order_price or 0 < snapshot.last <= order_price
+            else:
+                filled = snapshot.bid >= order_price or snapshot.last >= order_price
+            if filled:
+                del self.open_orders[order_id]
+                self._apply_fill(order['side'], order_price, float(order['qty']))
+                self.stats['fills'] += 1
+
+# ==========================================
+# 🚀 回放執行
+# ==========================================
+
+class RiskTriggerCounter(logging.Handler):
+    """統計回放期間的風控觸發次數與原因"""
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.reasons = {}
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("觸發風控保護: "):
+            reason = message.split(": ", 1)[1].split(" (")[0]
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+def apply_overrides(assignments):
+    """套用 --set NAME=VALUE 參數覆寫 main 模組的配置"""
+    for assignment in assignments:
+        name, _, value = assignment.partition("=")
+        if not hasattr(main, name):
+            raise SystemExit(f"❌ 未知的配置參數: {name}")
+        setattr(main, name, ast.literal_eval(value))
+        print(f"⚙️ {name} = {getattr(main, name)!r}")
+
+def resolve_capture_paths(inputs):
+    capture_paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            capture_paths.extend(main.list_capture_files(path))
+        else:
+            capture_paths.append(path)
+    return capture_paths
+
+def run_replay(capture_paths, speed, trade_log, profile, verbose):
+    feed = CaptureFeed(capture_paths)
+    if feed.peek_time() is None:
+        raise SystemExit("❌ 錄製文件中沒有訊息")
+
+    clock = SimulatedClock(feed, speed=speed)
+    market_stream = ReplayMarketDataStream(clock)
+    trading_bot = PaperTradingBot(market_stream)
+
+    def deliver(raw_message):
+        market_stream._handle_stream_message(None, raw_message)
+        trading_bot.match_orders()
+    clock.on_message = deliver
+
+    # 讓策略的時間與日期調用改走模擬時鐘
+    main.time = clock
+    main.datetime = make_simulated_datetime(clock)
+    main.clear_screen = lambda: None
+    main.is_shutting_down = False
+
+    risk_counter = RiskTriggerCounter()
+    main.log.addHandler(risk_counter)
+    if not verbose:
+        main.log.setLevel(logging.WARNING)
+
+    trade_logger = main.TradeLogger(trade_log)
+    started_at = clock.now
+    real_started_at = real_time.perf_counter()
+    profiler = cProfile.Profile() if profile else None
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with output:
+        if profiler:
+            profiler.enable()
+        main.run_trading_loop(trading_bot, trade_logger)
+        if profiler:
+            profiler.disable()
+
+    real_elapsed = real_time.perf_counter() - real_started_at
+    simulated_elapsed = clock.now - started_at
+    print("=" * 60)
+    print(f"📼 回放訊息: {feed.delivered_count} 筆")
+    print(f"⏱️ 模擬時長: {simulated_elapsed:.1f} 秒 | 實際耗時: {real_elapsed:.2f} 秒 "
+          f"({simulated_elapsed / max(real_elapsed, 1e-9):.1f}x)")
+    print(f"📨 訊息處理速率: {feed.delivered_count / max(real_elapsed, 1e-9):,.0f} 筆/秒")
+    print(f"🧾 掛單 {trading_bot.stats['submits']} | 撤單 {trading_bot.stats['cancels']} | "
+          f"成交 {trading_bot.stats['fills']} | 平倉 {trading_bot.stats['closes']}")
+    print(f"💰 已實現損益: {trading_bot.realized_pnl:.4f} | 剩餘持倉: {trading_bot.position_qty}")
+    print(f"🛡️ 風控觸發: {sum(risk_counter.reasons.values())} 次")
+    for reason, count in sorted(risk_counter.reasons.items(), key=lambda item: -item[1]):
+        print(f"   {reason}: {count}")
+    if main.risk_engine:
+        print("⏱️ 風控規則耗時 (按評估順序):")
+        for rule_name, stats in main.risk_engine.snapshot().items():
+            print(f"   {rule_name:<22} 評估 {stats['evaluations']:>6} | 觸發 {stats['trips']:>3} | "
+                  f"平均 {stats['avg_us']:>6.1f}µs | 累計 {stats['total_ms']:>7.1f}ms")
+    print(f"📝 成交記錄: {trade_log}")
+    print("=" * 60)
+
+    if profiler:
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+
+def main_entry():
+    parser = argparse.ArgumentParser(description="以錄製行情回放策略")
+    parser.add_argument("inputs", nargs="+", help="錄製文件 (.mdcap) 或錄製目錄")
+    parser.add_argument("--speed", type=float, default=0.0, help="回放速度：0 為盡快，1 為實際速度")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="覆寫 main.py 配置參數")
+    parser.add_argument("--trade-log", default="replay_trades.log", help="回放成交記錄文件")
+    parser.add_argument("--profile", action="store_true", help="以 cProfile 分析主循環")
+    parser.add_argument("--verbose", action="store_true", help="顯示策略界面輸出與 INFO 日誌")
+    args = parser.parse_args()
+
+    apply_overrides(args.set)
+    capture_paths = resolve_capture_paths(args.inputs)
+    if not capture_paths:
+        raise SystemExit("❌ 找不到錄製文件")
+    run_replay(capture_paths, args.speed, args.trade_log, args.profile, args.verbose)
+
+if __name__ == "__main__":
+    main_entry()